@@ -3,6 +3,7 @@ import json
 import ast
 import astor
 import logging
+from tracing import traced
 
 # ========== Logger Configuration ==========
 logging.basicConfig(
@@ -10,6 +11,7 @@ logging.basicConfig(
     level=logging.INFO
 )
 
+@traced("function_replacement", "replace")
 def replace_function_body_with_file_content(target_file_path, function_name, source_file_path, class_name=None):
     """
     Replaces the body of a function in the target file with the body from the source file.
@@ -0,0 +1,239 @@
+import os
+import json
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from git_checkout import mark_repo_as_safe
+from function_replacer import replace_function_in_file
+from test_performance_extractor import extract_cpu_instr, extract_mem_usage
+from candidates import deduplicate_candidates
+from tracing import span, traced
+
+# ================== Evaluation Configuration ==================
+MAX_WORKERS = 4  # Candidates evaluated at the same time, each in its own worktree
+TEST_TIMEOUT = 10  # Seconds per test run, as in run_test_after_modification
+# Untracked files the harness adds to each repository root (see copy_conftest.py)
+HARNESS_FILES = ("conftest.py",)
+
+
+# ================== Worktree Management ==================
+def create_worktree(repo_path, sha, worktree_dir):
+    """
+    Check out a commit into a separate worktree, so candidates can be tested side by side.
+
+    Args:
+        repo_path (str): The absolute path to the repository.
+        sha (str): The commit SHA to check out.
+        worktree_dir (str): Directory of the new worktree (must not exist).
+
+    Returns:
+        bool: True if the worktree was created, False otherwise.
+    """
+    try:
+        with span("git_checkout", "git", repo=repo_path, sha=sha, worktree=worktree_dir):
+            subprocess.run(
+                ["git", "-C", repo_path, "worktree", "add", "--detach", "-f", worktree_dir, sha],
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+    except subprocess.CalledProcessError as e:
+        print(f"Failed to create a worktree of '{repo_path}' at SHA '{sha}': {e.stderr.decode().strip()}")
+        return False
+
+    # The measuring conftest.py is copied into the repositories, not committed
+    for name in HARNESS_FILES:
+        source = os.path.join(repo_path, name)
+        target = os.path.join(worktree_dir, name)
+        if os.path.isfile(source) and not os.path.exists(target):
+            shutil.copy2(source, target)
+    return True
+
+
+def remove_worktree(repo_path, worktree_dir):
+    """
+    Remove a worktree created by `create_worktree`.
+
+    Args:
+        repo_path (str): The absolute path to the repository.
+        worktree_dir (str): Directory of the worktree.
+    """
+    subprocess.run(
+        ["git", "-C", repo_path, "worktree", "remove", "--force", worktree_dir],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    shutil.rmtree(worktree_dir, ignore_errors=True)
+
+
+def run_test_in_dir(work_dir, venv_path, test_cmd, timeout=TEST_TIMEOUT):
+    """
+    Run the test command in a directory without changing the process working directory.
+
+    Args:
+        work_dir (str): The repository (or worktree) root.
+        venv_path (str): The path to the Python virtual environment.
+        test_cmd (str): The test command to be executed.
+        timeout (int): Timeout in seconds.
+
+    Returns:
+        tuple: (stdout, error) where stdout is None and error describes the failure if the tests did not pass.
+    """
+    full_command = f"export PYTHONPATH=$PYTHONPATH:$(pwd) && bash -c 'source {venv_path}/bin/activate && {test_cmd}'"
+    try:
+        with span("test_run", "test", work_dir=work_dir):
+            result = subprocess.run(
+                full_command,
+                shell=True,
+                cwd=work_dir,
+                check=True,
+                text=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                timeout=timeout
+            )
+        return result.stdout, ""
+    except subprocess.CalledProcessError as e:
+        return None, f"Tests failed with exit code {e.returncode}: {(e.stderr or e.stdout or '').strip()[-500:]}"
+    except subprocess.TimeoutExpired:
+        return None, f"Tests timed out after {timeout}s"
+
+
+# ================== Candidate Evaluation ==================
+@traced("evaluate_candidate", "test")
+def evaluate_candidate(data, code, worktree_dir):
+    """
+    Apply one candidate in its own worktree, run the tests and measure it.
+
+    Args:
+        data (dict): Evaluation data as for code_evaluation_pipeline.evaluate.
+        code (str): The candidate function code.
+        worktree_dir (str): Directory for the candidate's worktree.
+
+    Returns:
+        dict: "passed", "cpu_instr", "mem_usage" and "error" of the candidate.
+    """
+    outcome = {"passed": False, "cpu_instr": -1, "mem_usage": -1, "error": ""}
+    repo_path = data["repo_path"]
+
+    if not create_worktree(repo_path, data["sha"], worktree_dir):
+        outcome["error"] = "Could not check out the commit"
+        return outcome
+
+    try:
+        file_path = os.path.join(worktree_dir, os.path.relpath(data["file_path"], repo_path))
+        if not replace_function_in_file(file_path, data["class_name"], data["function_name"], code):
+            outcome["error"] = "Function could not be replaced"
+            return outcome
+
+        output, error = run_test_in_dir(worktree_dir, data["venv_path"], data["test_cmd"])
+        if output is None:
+            outcome["error"] = error
+            return outcome
+
+        outcome["passed"] = True
+        outcome["cpu_instr"] = extract_cpu_instr(output)
+        outcome["mem_usage"] = extract_mem_usage(output)
+        return outcome
+    finally:
+        remove_worktree(repo_path, worktree_dir)
+
+
+def select_best(report):
+    """
+    Pick the passing candidate with the fewest measured CPU instructions.
+
+    Args:
+        report (list): Per-candidate entries from `evaluate_candidates`.
+
+    Returns:
+        dict or None: The best entry, or None if no candidate passed with a measurement.
+    """
+    measured = [entry for entry in report if entry["passed"] and entry["cpu_instr"] != -1]
+    return min(measured, key=lambda entry: (entry["cpu_instr"], entry["index"])) if measured else None
+
+
+@traced("evaluate_candidates", "test")
+def evaluate_candidates(data, candidates, max_workers=MAX_WORKERS):
+    """
+    Evaluate several candidates of one function concurrently and keep the best.
+
+    Candidates are deduplicated by normalized AST first; duplicates and candidates
+    that do not parse are reported but not run. Each remaining candidate is tested in
+    its own git worktree, so runs do not interfere. CPU instruction counts are
+    per-process, so running candidates side by side does not skew the comparison
+    the way wall-clock timing would.
+
+    Args:
+        data (dict): Evaluation data as for code_evaluation_pipeline.evaluate (without "after_code").
+        candidates (list): The candidate function codes.
+        max_workers (int): Candidates evaluated at the same time.
+
+    Returns:
+        tuple: (best, report) where best is the selected report entry or None, and report
+               has one entry per candidate with "index", "duplicate_of", "parses",
+               "evaluated", "passed", "cpu_instr", "mem_usage", "error" and "selected".
+    """
+    entries = deduplicate_candidates(candidates)
+    to_run = [entry for entry in entries if entry["duplicate_of"] is None and entry["parses"]]
+    mark_repo_as_safe(data["repo_path"])
+
+    worktree_root = tempfile.mkdtemp(prefix="bestofn_")
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            outcomes = list(executor.map(
+                lambda entry: evaluate_candidate(data, entry["code"], os.path.join(worktree_root, str(entry["index"]))),
+                to_run
+            ))
+    finally:
+        shutil.rmtree(worktree_root, ignore_errors=True)
+    outcome_by_index = {entry["index"]: outcome for entry, outcome in zip(to_run, outcomes)}
+
+    report = []
+    for entry in entries:
+        outcome = outcome_by_index.get(entry["index"])
+        if outcome is None:
+            outcome = {"passed": False, "cpu_instr": -1, "mem_usage": -1,
+                       "error": "Duplicate candidate" if entry["duplicate_of"] is not None else "Syntax error"}
+        report.append({
+            "index": entry["index"],
+            "duplicate_of": entry["duplicate_of"],
+            "parses": entry["parses"],
+            "evaluated": entry["index"] in outcome_by_index,
+            **outcome,
+            "selected": False
+        })
+
+    best = select_best(report)
+    if best is not None:
+        best["selected"] = True
+        print(f"Selected candidate {best['index']} of {len(candidates)} with {best['cpu_instr']} CPU instructions.")
+    else:
+        print(f"None of the {len(candidates)} candidates passed the tests.")
+    return best, report
+
+
+def main():
+    """
+    Main function to evaluate candidates of one function.
+    """
+    # Sample data for evaluation
+    data = {
+        "repo_path": "your_repo_path",
+        "venv_path": "your_venv_path",
+        "test_cmd": "your_test_command",
+        "sha": "your_git_commit_sha",
+        "function_name": "your_function_name",
+        "class_name": "your_class_name",
+        "file_path": "your_file_path"
+    }
+    candidates = ["your_candidate_code_1", "your_candidate_code_2"]
+
+    best, report = evaluate_candidates(data, candidates)
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
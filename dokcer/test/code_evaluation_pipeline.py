@@ -1,8 +1,10 @@
 from git_checkout import switch_repo_to_sha
 from function_replacer import replace_function_in_file
 from test_performance_extractor import run_test_after_modification, extract_cpu_instr, extract_mem_usage
+from tracing import traced
 
 
+@traced("evaluate_target", "test")
 def evaluate(data):
     """
     Evaluate the performance of a function after code replacement.
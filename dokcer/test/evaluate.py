@@ -1,5 +1,10 @@
+import os
 import json
+import argparse
 from code_evaluation_pipeline import evaluate
+from best_of_n import evaluate_candidates
+from results_store import RESULTS_DB, ResultsStore, import_evaluation
+from tracing import export_trace
 
 
 def load_json_file(file_path):
@@ -88,9 +93,19 @@ def evaluate_modifications(repo_info, modifications_data, venv_path_prefix):
                 if repo_info_item:
                     target_func = repo_info_item["target_func"]
                     for modification in modifications:
-                        if modification["function_name"] != target_func:
-                            continue
+                        if modification["function_name"] != target_func or modification.get("skipped"):
+                            continue  # Skipped functions were not optimized (budget mode)
                         evaluation_data = prepare_evaluation_data(modification, repo_info_item, sha, venv_path_prefix)
+                        if len(modification.get("candidates") or []) > 1:
+                            # Best-of-n: test every candidate concurrently and keep the cheapest passing one
+                            best, report = evaluate_candidates(evaluation_data, modification["candidates"])
+                            repo_eval_results[sha] = {
+                                "cpu_instr": best["cpu_instr"] if best else -1,
+                                "mem_usage": best["mem_usage"] if best else -1,
+                                "best_candidate": best["index"] if best else None,
+                                "candidates": report
+                            }
+                            break
                         cpu_instr, mem_usage = evaluate(evaluation_data)
                         repo_eval_results[sha] = {
                             "cpu_instr": cpu_instr,
@@ -103,26 +118,42 @@ def evaluate_modifications(repo_info, modifications_data, venv_path_prefix):
     return evaluation_results
 
 
-def main():
+def main(repo_info_file="REPO_INFO_FILE_PATH_PLACEHOLDER", modifications_file="MODIFICATIONS_FILE_PATH_PLACEHOLDER",
+         venv_path_prefix="VENV_PATH_PREFIX_PLACEHOLDER", output_file="OUTPUT_FILE_PATH_PLACEHOLDER"):
     """
     Main function to perform the evaluation process.
+
+    Args:
+        repo_info_file (str): Repository information file.
+        modifications_file (str): Model results with the modifications to evaluate.
+        venv_path_prefix (str): The prefix for the virtual environment path.
+        output_file (str): Path of the evaluation results JSON to write.
     """
+    # Absolute, since the evaluation changes into the repositories
+    output_file = os.path.abspath(output_file)
+
     # Load repository information and modification data
-    repo_info_file = "REPO_INFO_FILE_PATH_PLACEHOLDER"
-    modifications_file = "MODIFICATIONS_FILE_PATH_PLACEHOLDER"
     repo_info = load_json_file(repo_info_file)
     modifications_data = load_json_file(modifications_file)
 
-    # Prefix for virtual environment path
-    venv_path_prefix = "VENV_PATH_PREFIX_PLACEHOLDER"
-
     # Evaluate the modifications
     evaluation_results = evaluate_modifications(repo_info, modifications_data, venv_path_prefix)
 
     # Save the evaluation results
-    output_file = "OUTPUT_FILE_PATH_PLACEHOLDER"
     save_json_file(evaluation_results, output_file)
 
+    # Also record the measurements in the results store, as a run named after the output file
+    if RESULTS_DB:
+        with ResultsStore(RESULTS_DB) as store:
+            import_evaluation(store, evaluation_results, os.path.splitext(os.path.basename(output_file))[0])
+    export_trace()
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Evaluate the optimized target functions of model results.")
+    parser.add_argument("--repo-info", default="REPO_INFO_FILE_PATH_PLACEHOLDER", help="Repository information file.")
+    parser.add_argument("--modifications", default="MODIFICATIONS_FILE_PATH_PLACEHOLDER", help="Model results file.")
+    parser.add_argument("--venv-prefix", default="VENV_PATH_PREFIX_PLACEHOLDER", help="Prefix of the virtual environment paths.")
+    parser.add_argument("--output", default="OUTPUT_FILE_PATH_PLACEHOLDER", help="Evaluation results JSON to write.")
+    args = parser.parse_args()
+    main(args.repo_info, args.modifications, args.venv_prefix, args.output)
\ No newline at end of file
@@ -1,6 +1,8 @@
 import re
+from tracing import traced
 
 
+@traced("function_replacement", "replace")
 def replace_function_in_file(file_path, class_name, func_name, new_signature_and_body):
     """
     Replace the function signature and body in a Python file based on the file path, class name, and function name,
@@ -61,11 +63,13 @@ def replace_function_in_file(file_path, class_name, func_name, new_signature_and
                 if len(line) - len(line.lstrip()) <= func_indent:
                     func_end_line = i
                     break
+            else:
+                func_end_line = len(lines)  # The function runs to the end of the file
 
         # Replace the function if both start and end lines are found
         if func_start_line is not None and func_end_line is not None:
             indent = ' ' * func_indent
-            new_func_lines = [indent + line if line.strip() else line for line in new_signature_and_body.split('\n')]
+            new_func_lines = [(indent + line if line.strip() else line) + '\n' for line in new_signature_and_body.split('\n')]
             lines = lines[:func_start_line] + new_func_lines + lines[func_end_line:]
 
             # Write the modified content back to the file
@@ -1,5 +1,6 @@
 import subprocess
 import os
+from tracing import span
 
 # ================== Git Repository Management ==================
 
@@ -50,12 +51,13 @@ def switch_repo_to_sha(repo_path, sha):
         os.chdir(repo_path)
 
         # Checkout the specified commit
-        subprocess.run(
-            ["git", "checkout", sha, "-f"],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
+        with span("git_checkout", "git", repo=repo_path, sha=sha):
+            subprocess.run(
+                ["git", "checkout", sha, "-f"],
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
         print(f"Repository switched to SHA '{sha}' at '{repo_path}'.")
         return True
 
@@ -0,0 +1,634 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from dataset_stream import iter_records, records_of
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+# ========== Store Configuration ==========
+RESULTS_DB = os.environ.get("PEACE_RESULTS_DB")  # SQLite results store; unset keeps results in JSON files only
+BATCH_SIZE = 500  # Rows buffered before they are written in one transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    kind TEXT,
+    source TEXT,
+    created REAL,
+    metadata TEXT
+);
+CREATE TABLE IF NOT EXISTS targets (
+    run_id INTEGER NOT NULL,
+    repo TEXT,
+    sha TEXT,
+    function TEXT,
+    class_name TEXT,
+    file_path TEXT,
+    before TEXT,
+    after TEXT,
+    skipped TEXT,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS candidates (
+    run_id INTEGER NOT NULL,
+    repo TEXT,
+    sha TEXT,
+    function TEXT,
+    idx INTEGER,
+    code TEXT,
+    parses INTEGER,
+    duplicate_of INTEGER,
+    selected INTEGER
+);
+CREATE TABLE IF NOT EXISTS measurements (
+    run_id INTEGER NOT NULL,
+    repo TEXT,
+    sha TEXT,
+    function TEXT,
+    variant TEXT,
+    candidate INTEGER,
+    metric TEXT,
+    value REAL,
+    note TEXT
+);
+CREATE TABLE IF NOT EXISTS llm_calls (
+    run_id INTEGER NOT NULL,
+    repo TEXT,
+    sha TEXT,
+    function TEXT,
+    phase TEXT,
+    model TEXT,
+    timestamp REAL,
+    latency REAL,
+    queue_wait REAL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    retries INTEGER,
+    cache_hit INTEGER,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS targets_key ON targets (repo, sha, function);
+CREATE INDEX IF NOT EXISTS targets_run ON targets (run_id);
+CREATE INDEX IF NOT EXISTS candidates_key ON candidates (repo, sha, function);
+CREATE INDEX IF NOT EXISTS candidates_run ON candidates (run_id);
+CREATE INDEX IF NOT EXISTS measurements_key ON measurements (repo, sha, function);
+CREATE INDEX IF NOT EXISTS measurements_run ON measurements (run_id, metric, variant);
+CREATE INDEX IF NOT EXISTS llm_calls_key ON llm_calls (repo, sha, function);
+CREATE INDEX IF NOT EXISTS llm_calls_run ON llm_calls (run_id);
+"""
+
+COLUMNS = {
+    "targets": ("run_id", "repo", "sha", "function", "class_name", "file_path", "before", "after", "skipped", "data"),
+    "candidates": ("run_id", "repo", "sha", "function", "idx", "code", "parses", "duplicate_of", "selected"),
+    "measurements": ("run_id", "repo", "sha", "function", "variant", "candidate", "metric", "value", "note"),
+    "llm_calls": ("run_id", "repo", "sha", "function", "phase", "model", "timestamp", "latency", "queue_wait",
+                  "prompt_tokens", "completion_tokens", "retries", "cache_hit", "status")
+}
+METRICS = ("cpu_instr", "mem_usage")  # Measurement values of -1 mean "not measured" and are not stored
+
+
+class ResultsStore:
+    """
+    SQLite store of runs and their targets, candidates, measurements and LLM calls.
+
+    Rows are denormalized on (run, repo, sha, function), which are indexed, so
+    questions such as "all SHAs where the optimized version regressed" are single
+    queries. Writes are buffered and committed `batch_size` rows at a time; reads
+    flush the buffer first.
+
+    Attributes
+    ----------
+    path : str
+        The database file.
+    batch_size : int
+        Rows buffered before a write.
+    """
+
+    def __init__(self, path=RESULTS_DB, batch_size=BATCH_SIZE):
+        """
+        Open (and create if needed) the store.
+
+        Parameters
+        ----------
+        path : str, optional
+            The database file, default is `PEACE_RESULTS_DB`.
+        batch_size : int, optional
+            Rows buffered before a write, default is 500.
+        """
+        if not path:
+            raise ValueError("No results database given; set PEACE_RESULTS_DB or pass a path")
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self._lock = threading.RLock()
+        self._pending = {table: [] for table in COLUMNS}
+        self._pending_count = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    # ========== Writing ==========
+    def create_run(self, name, kind, source=None, metadata=None, replace=True):
+        """
+        Create a run, the unit results are imported and queried by.
+
+        Parameters
+        ----------
+        name : str
+            Unique name of the run.
+        kind : str
+            What it holds, e.g. "pipeline", "evaluation", "tests" or "associated_edits".
+        source : str or None, optional
+            File it was imported from.
+        metadata : dict or None, optional
+            Free-form details, stored as JSON.
+        replace : bool, optional
+            Delete an existing run of that name and its rows first (default), so
+            importing again does not duplicate rows; otherwise reuse it.
+
+        Returns
+        -------
+        int
+            The run id.
+        """
+        with self._lock:
+            self.flush()
+            existing = self._conn.execute("SELECT id FROM runs WHERE name = ?", (name,)).fetchone()
+            if existing is not None:
+                if not replace:
+                    return existing["id"]
+                self.delete_run(name)
+            cursor = self._conn.execute(
+                "INSERT INTO runs (name, kind, source, created, metadata) VALUES (?, ?, ?, ?, ?)",
+                (name, kind, source, time.time(), json.dumps(metadata or {}, ensure_ascii=False))
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def delete_run(self, name):
+        """Delete a run and all its rows."""
+        with self._lock:
+            self.flush()
+            row = self._conn.execute("SELECT id FROM runs WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return
+            with self._conn:
+                for table in COLUMNS:
+                    self._conn.execute(f"DELETE FROM {table} WHERE run_id = ?", (row["id"],))
+                self._conn.execute("DELETE FROM runs WHERE id = ?", (row["id"],))
+
+    def _add(self, table, row):
+        with self._lock:
+            self._pending[table].append(tuple(row.get(column) for column in COLUMNS[table]))
+            self._pending_count += 1
+            if self._pending_count >= self.batch_size:
+                self.flush()
+
+    def add_target(self, run_id, repo, sha, function=None, class_name=None, file_path=None, before=None,
+                   after=None, skipped=None, data=None):
+        """
+        Add a target (a function at a SHA) of a run.
+
+        `data` is the original record, kept as JSON so exports reproduce the input files.
+        """
+        self._add("targets", {
+            "run_id": run_id, "repo": repo, "sha": sha, "function": function, "class_name": class_name,
+            "file_path": file_path, "before": before, "after": after, "skipped": skipped,
+            "data": json.dumps(data, ensure_ascii=False) if data is not None else None
+        })
+
+    def add_candidate(self, run_id, repo, sha, function, index, code=None, parses=None, duplicate_of=None, selected=False):
+        """Add an optimization candidate of a target."""
+        self._add("candidates", {
+            "run_id": run_id, "repo": repo, "sha": sha, "function": function, "idx": index, "code": code,
+            "parses": None if parses is None else int(bool(parses)), "duplicate_of": duplicate_of,
+            "selected": int(bool(selected))
+        })
+
+    def add_measurement(self, run_id, repo, sha, function, metric, value, variant="optimized", candidate=None, note=None):
+        """
+        Add a measurement, e.g. the CPU instructions of the optimized version.
+
+        Parameters
+        ----------
+        variant : str, optional
+            "optimized" (default), "baseline" or "candidate".
+        candidate : int or None, optional
+            Index of the candidate for "candidate" measurements.
+        """
+        self._add("measurements", {
+            "run_id": run_id, "repo": repo, "sha": sha, "function": function, "variant": variant,
+            "candidate": candidate, "metric": metric, "value": value, "note": note
+        })
+
+    def add_llm_call(self, run_id, record):
+        """Add an LLM call from a telemetry record (`llm_telemetry.LLMCall.to_record`)."""
+        self._add("llm_calls", {
+            "run_id": run_id, **{column: record.get(column) for column in COLUMNS["llm_calls"][4:]},
+            "repo": record.get("repo"), "sha": record.get("sha"), "function": record.get("function"),
+            "cache_hit": int(bool(record.get("cache_hit")))
+        })
+
+    def flush(self):
+        """Write the buffered rows in one transaction."""
+        with self._lock:
+            if not self._pending_count:
+                return
+            with self._conn:
+                for table, rows in self._pending.items():
+                    if rows:
+                        columns = COLUMNS[table]
+                        self._conn.executemany(
+                            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+                        )
+                        rows.clear()
+            self._pending_count = 0
+
+    def close(self):
+        """Flush and close the database."""
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # ========== Querying ==========
+    def query(self, sql, parameters=()):
+        """
+        Run a read query and yield its rows as dicts, one at a time.
+
+        Parameters
+        ----------
+        sql : str
+            The query.
+        parameters : tuple, optional
+            Its parameters.
+        """
+        with self._lock:
+            self.flush()
+            cursor = self._conn.execute(sql, parameters)
+        for row in cursor:
+            yield dict(row)
+
+    def run_id(self, name):
+        """Return the id of a run, or None."""
+        rows = list(self.query("SELECT id FROM runs WHERE name = ?", (name,)))
+        return rows[0]["id"] if rows else None
+
+    def runs(self):
+        """Return the runs with their row counts."""
+        return list(self.query(
+            "SELECT r.name, r.kind, r.source, r.created, "
+            "(SELECT COUNT(*) FROM targets t WHERE t.run_id = r.id) AS targets, "
+            "(SELECT COUNT(*) FROM measurements m WHERE m.run_id = r.id) AS measurements, "
+            "(SELECT COUNT(*) FROM llm_calls c WHERE c.run_id = r.id) AS llm_calls "
+            "FROM runs r ORDER BY r.id"
+        ))
+
+    def _select(self, table, run=None, repo=None, sha=None, function=None, **filters):
+        conditions, parameters = [], []
+        if run is not None:
+            conditions.append("run_id = (SELECT id FROM runs WHERE name = ?)")
+            parameters.append(run)
+        for column, value in (("repo", repo), ("sha", sha), ("function", function), *filters.items()):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self.query(f"SELECT * FROM {table}{where} ORDER BY rowid", tuple(parameters))
+
+    def targets(self, run=None, repo=None, sha=None, function=None):
+        """Yield the targets matching the filters, with `data` decoded."""
+        for row in self._select("targets", run, repo, sha, function):
+            row["data"] = json.loads(row["data"]) if row["data"] else None
+            yield row
+
+    def candidates(self, run=None, repo=None, sha=None, function=None):
+        """Yield the candidates matching the filters."""
+        return self._select("candidates", run, repo, sha, function)
+
+    def measurements(self, run=None, repo=None, sha=None, function=None, metric=None, variant=None):
+        """Yield the measurements matching the filters."""
+        return self._select("measurements", run, repo, sha, function, metric=metric, variant=variant)
+
+    def llm_calls(self, run=None, repo=None, sha=None, function=None):
+        """Yield the LLM calls matching the filters."""
+        return self._select("llm_calls", run, repo, sha, function)
+
+    def regressions(self, optimized_run, baseline_run=None, metric="cpu_instr", threshold=0.0):
+        """
+        Find the targets whose optimized version measured worse than the baseline.
+
+        Optimized measurements of `optimized_run` are matched to baseline
+        measurements of `baseline_run` by repo and SHA (and function, when both have one).
+
+        Parameters
+        ----------
+        optimized_run : str
+            Run with the "optimized" measurements.
+        baseline_run : str or None, optional
+            Run with the "baseline" measurements, default is `optimized_run`.
+        metric : str, optional
+            The metric, default is "cpu_instr"; higher is worse.
+        threshold : float, optional
+            Relative increase tolerated, default is 0.
+
+        Returns
+        -------
+        list
+            Dicts with repo, sha, function, baseline, optimized and change (relative),
+            the worst first.
+        """
+        return list(self.query(
+            "SELECT o.repo, o.sha, COALESCE(o.function, b.function) AS function, "
+            "b.value AS baseline, o.value AS optimized, (o.value - b.value) / b.value AS change "
+            "FROM measurements o JOIN measurements b "
+            "ON b.repo = o.repo AND b.sha = o.sha AND b.metric = o.metric "
+            "AND (o.function IS NULL OR b.function IS NULL OR o.function = b.function) "
+            "WHERE o.run_id = (SELECT id FROM runs WHERE name = ?) AND o.variant = 'optimized' "
+            "AND b.run_id = (SELECT id FROM runs WHERE name = ?) AND b.variant = 'baseline' "
+            "AND o.metric = ? AND b.value > 0 AND o.value > b.value * (1 + ?) "
+            "ORDER BY change DESC",
+            (optimized_run, baseline_run or optimized_run, metric, threshold)
+        ))
+
+
+# ========== Import ==========
+def _load(source):
+    """Return the (key, value) records of a file path (streamed) or of data in memory."""
+    return iter_records(source) if isinstance(source, str) else records_of(source)
+
+
+def import_model_results(store, source, run, kind="pipeline"):
+    """
+    Import pipeline results: `model.py` output ({repo: {sha: [modifications]}}) or its
+    JSONL result log ({"repo", "sha", "results"} lines).
+
+    Parameters
+    ----------
+    store : ResultsStore
+        The store.
+    source : str or dict
+        File path or loaded data.
+    run : str
+        Name of the run to create (replacing one of that name).
+    kind : str, optional
+        Kind of the run, default is "pipeline".
+
+    Returns
+    -------
+    int
+        Number of targets imported.
+    """
+    run_id = store.create_run(run, kind, source if isinstance(source, str) else None)
+
+    def entries():
+        for key, value in _load(source):
+            if isinstance(value, dict) and "results" in value and "sha" in value:
+                yield value["repo"], value["sha"], value["results"]  # Result log line
+            else:
+                for sha, results in (value or {}).items():
+                    yield key, sha, results
+
+    count = 0
+    for repo, sha, results in entries():
+        for modification in results:
+            function = modification.get("function_name")
+            store.add_target(
+                run_id, repo, sha, function, modification.get("class_name"), modification.get("file_path"),
+                modification.get("before"), modification.get("after"), modification.get("skipped"),
+                dict(modification, sha=sha, repo=repo)
+            )
+            for index, code in enumerate(modification.get("candidates") or []):
+                store.add_candidate(run_id, repo, sha, function, index, code)
+            count += 1
+    store.flush()
+    logging.info(f"Imported {count} targets into run '{run}'")
+    return count
+
+
+def import_evaluation(store, source, run):
+    """
+    Import `evaluate.py` output ({repo: {sha: {"cpu_instr", "mem_usage", ...}}}) as
+    "optimized" measurements, with per-candidate measurements for best-of-n results.
+
+    Returns
+    -------
+    int
+        Number of evaluated targets imported.
+    """
+    run_id = store.create_run(run, "evaluation", source if isinstance(source, str) else None)
+    count = 0
+    for repo, sha_results in _load(source):
+        for sha, result in (sha_results or {}).items():
+            store.add_target(run_id, repo, sha, data=dict(result, repo=repo, sha=sha))
+            for metric in METRICS:
+                if result.get(metric, -1) != -1:
+                    store.add_measurement(run_id, repo, sha, None, metric, result[metric])
+            for entry in result.get("candidates") or []:
+                store.add_candidate(
+                    run_id, repo, sha, None, entry["index"], parses=entry.get("parses"),
+                    duplicate_of=entry.get("duplicate_of"), selected=entry.get("selected")
+                )
+                for metric in METRICS:
+                    if entry.get(metric, -1) != -1:
+                        store.add_measurement(run_id, repo, sha, None, metric, entry[metric], "candidate",
+                                              entry["index"], entry.get("error") or None)
+            count += 1
+    store.flush()
+    logging.info(f"Imported {count} evaluated targets into run '{run}'")
+    return count
+
+
+def import_test_results(store, source, run, variant="optimized"):
+    """
+    Import `testAndSave.py` output ({repo: [{"sha", "cpu_instr_avg", "mem_usage_avg",
+    "accepted", ...}]}) as measurements of the given variant.
+
+    Parameters
+    ----------
+    variant : str, optional
+        "optimized" (default) or "baseline", for a run without optimized functions.
+
+    Returns
+    -------
+    int
+        Number of tested targets imported.
+    """
+    run_id = store.create_run(run, "tests", source if isinstance(source, str) else None, {"variant": variant})
+    count = 0
+    for repo, entry in _load(source):
+        sha = entry.get("sha")
+        store.add_target(run_id, repo, sha, data=dict(entry, repo=repo))
+        for metric in METRICS:
+            value = entry.get(f"{metric}_avg", -1)
+            if value != -1:
+                store.add_measurement(run_id, repo, sha, None, metric, value, variant)
+        store.add_measurement(run_id, repo, sha, None, "accepted", entry.get("accepted", 0), variant,
+                              note=entry.get("error_message") or None)
+        count += 1
+    store.flush()
+    logging.info(f"Imported {count} test results into run '{run}'")
+    return count
+
+
+def import_associated_edits(store, source, run, include_patches=False):
+    """
+    Import associated-edit results (`process_edits.py` / `process_patches.py` output:
+    a list of items with `funcBody`, `results` and, for BLEU, `results2` and `groundtruth`).
+
+    Parameters
+    ----------
+    include_patches : bool, optional
+        Keep the items' `patchList`, which is usually by far their largest part;
+        default is False.
+
+    Returns
+    -------
+    int
+        Number of items imported.
+    """
+    run_id = store.create_run(run, "associated_edits", source if isinstance(source, str) else None)
+    count = 0
+    for _, item in _load(source):
+        if not include_patches:
+            item = {key: value for key, value in item.items() if key != "patchList"}
+        store.add_target(
+            run_id, item.get("repo_name") or item.get("repo"), item.get("sha"), item.get("objectFunc"),
+            before=item.get("funcBody"), after=item.get("results") if isinstance(item.get("results"), str) else None,
+            data=item
+        )
+        count += 1
+    store.flush()
+    logging.info(f"Imported {count} associated-edit items into run '{run}'")
+    return count
+
+
+def import_llm_trace(store, source, run):
+    """
+    Import LLM calls from a telemetry trace (`LLM_TELEMETRY_PATH`) or a list of records
+    into a run, which is created if it does not exist.
+
+    Returns
+    -------
+    int
+        Number of calls imported.
+    """
+    run_id = store.run_id(run) or store.create_run(run, "llm_calls", source if isinstance(source, str) else None)
+    count = 0
+    for _, record in _load(source):
+        store.add_llm_call(run_id, record)
+        count += 1
+    store.flush()
+    logging.info(f"Imported {count} LLM calls into run '{run}'")
+    return count
+
+
+# ========== Export ==========
+def export_model_results(store, run):
+    """Rebuild `model.py` output ({repo: {sha: [modifications]}}) from a run."""
+    output_data = {}
+    for target in store.targets(run):
+        modification = dict(target["data"])
+        repo, sha = modification.pop("repo"), modification.pop("sha")
+        output_data.setdefault(repo, {}).setdefault(sha, []).append(modification)
+    return output_data
+
+
+def export_evaluation(store, run):
+    """Rebuild `evaluate.py` output ({repo: {sha: result}}) from a run."""
+    output_data = {}
+    for target in store.targets(run):
+        result = dict(target["data"])
+        repo, sha = result.pop("repo"), result.pop("sha")
+        output_data.setdefault(repo, {})[sha] = result
+    return output_data
+
+
+def export_test_results(store, run):
+    """Rebuild `testAndSave.py` output ({repo: [results]}) from a run."""
+    output_data = {}
+    for target in store.targets(run):
+        entry = dict(target["data"])
+        output_data.setdefault(entry.pop("repo"), []).append(entry)
+    return output_data
+
+
+def export_associated_edits(store, run):
+    """Rebuild the associated-edit item list from a run."""
+    return [target["data"] for target in store.targets(run)]
+
+
+IMPORTERS = {
+    "model": import_model_results,
+    "evaluation": import_evaluation,
+    "tests": import_test_results,
+    "edits": import_associated_edits,
+    "llm": import_llm_trace
+}
+EXPORTERS = {
+    "model": export_model_results,
+    "evaluation": export_evaluation,
+    "tests": export_test_results,
+    "edits": export_associated_edits
+}
+
+
+# ========== Main Execution ==========
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import, export and query the SQLite results store.")
+    parser.add_argument("db", help="The results database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Import a results file as a run.")
+    import_parser.add_argument("format", choices=sorted(IMPORTERS), help="Format of the file.")
+    import_parser.add_argument("file", help="The file to import.")
+    import_parser.add_argument("--run", required=True, help="Name of the run.")
+    import_parser.add_argument("--variant", default="optimized", help="For tests: 'optimized' or 'baseline'.")
+
+    export_parser = commands.add_parser("export", help="Export a run in its original JSON format.")
+    export_parser.add_argument("format", choices=sorted(EXPORTERS), help="Format to write.")
+    export_parser.add_argument("run", help="Name of the run.")
+    export_parser.add_argument("output", help="JSON file to write.")
+
+    commands.add_parser("runs", help="List the runs.")
+
+    regressions_parser = commands.add_parser("regressions", help="List targets that measured worse than the baseline.")
+    regressions_parser.add_argument("optimized", help="Run with the optimized measurements.")
+    regressions_parser.add_argument("--baseline", default=None, help="Run with the baseline measurements.")
+    regressions_parser.add_argument("--metric", default="cpu_instr", help="Metric to compare.")
+    regressions_parser.add_argument("--threshold", type=float, default=0.0, help="Relative increase tolerated.")
+    args = parser.parse_args()
+
+    with ResultsStore(args.db) as store:
+        if args.command == "import":
+            if args.format == "tests":
+                import_test_results(store, args.file, args.run, args.variant)
+            else:
+                IMPORTERS[args.format](store, args.file, args.run)
+        elif args.command == "export":
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(EXPORTERS[args.format](store, args.run), f, ensure_ascii=False, indent=4)
+            logging.info(f"Exported run '{args.run}' to {args.output}")
+        elif args.command == "runs":
+            for run in store.runs():
+                print(f"{run['name']}\t{run['kind']}\t{run['targets']} targets\t{run['measurements']} measurements\t"
+                      f"{run['llm_calls']} LLM calls\t{run['source'] or ''}")
+        else:
+            for row in store.regressions(args.optimized, args.baseline, args.metric, args.threshold):
+                print(f"{row['repo']}\t{row['sha']}\t{row['function'] or ''}\t{row['baseline']:g} -> "
+                      f"{row['optimized']:g} ({row['change']:+.1%})")
@@ -3,7 +3,11 @@ import os
 import subprocess
 import re
 import ast
+import argparse
 import statistics
+from dataset_stream import iter_records, records_of
+from results_store import RESULTS_DB, ResultsStore, import_test_results
+from tracing import span, traced, export_trace
 
 
 def load_json_file(file_path):
@@ -43,6 +47,7 @@ def save_json_file(data, file_path):
         print(f"Error saving results to {file_path}: {e}")
 
 
+@traced("function_replacement", "replace")
 def replace_function_in_file(file_path, optimized_function_code, function_name):
     """
     Replace the original function in a specified file with an optimized one,
@@ -138,7 +143,8 @@ def run_single_test(repo_info, venv_path, test_cmd, init_workdir):
 
     try:
         os.chdir(repo_name)
-        subprocess.run(f"git checkout {sha} -f", shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with span("git_checkout", "git", repo=repo_name, sha=sha):
+            subprocess.run(f"git checkout {sha} -f", shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         print(f"Repository '{repo_name}' reset to SHA '{sha}'")
     except subprocess.CalledProcessError as e:
         print(f"Failed to reset repository '{repo_name}' to SHA '{sha}': {e.stderr}")
@@ -146,14 +152,15 @@ def run_single_test(repo_info, venv_path, test_cmd, init_workdir):
 
     full_command = f"export PYTHONPATH=$PYTHONPATH:$(pwd) && bash -c 'source {venv_path}/bin/activate && {test_cmd}'"
     try:
-        result = subprocess.run(
-            full_command,
-            shell=True,
-            check=True,
-            text=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
+        with span("test_run", "test", repo=repo_name, sha=sha):
+            result = subprocess.run(
+                full_command,
+                shell=True,
+                check=True,
+                text=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
         cpu_instr = extract_cpu_instr(result.stdout)
         mem_usage = extract_mem_usage(result.stdout)
         return cpu_instr, mem_usage, 1
@@ -167,7 +174,8 @@ def run_tests(repo_data, optimized_functions, init_workdir, num_runs=12):
     Iterate through repository configurations, run tests, and collect results.
 
     Args:
-        repo_data (dict): Repository configuration data.
+        repo_data (dict or iterable): Repository configuration data, or its (key, repo) records
+            as streamed by dataset_stream.iter_records.
         optimized_functions (dict): Optimized function code.
         init_workdir (str): The initial working directory.
         num_runs (int): Number of test runs.
@@ -176,88 +184,107 @@ def run_tests(repo_data, optimized_functions, init_workdir, num_runs=12):
         dict: The test results.
     """
     results = {}
-    for repo_key in repo_data:
-        repositories = repo_data[repo_key]
-        for repo in repositories:
-            sha = repo['sha']
-            venv_path = os.path.join(init_workdir, "venv_python", repo['venv_path'])
-            test_cmd = repo['test_cmd']
-            target_file = os.path.join(os.path.join(init_workdir, "test_repo_python", repo['repo_path']), repo['target_file'])
-            target_func = repo['target_func']
-
-            if sha in optimized_functions:
-                optimized_function_code = optimized_functions[sha]
-                replace_function_in_file(target_file, optimized_function_code, target_func)
-                print(f"Replaced function '{target_func}' in '{target_file}'.")
-
-            cpu_instr_list = []
-            mem_usage_list = []
-            accepted = 1
-            error_message = ""
-
-            cpu_instr, mem_usage, initial_accepted = run_single_test(repo, venv_path, test_cmd, init_workdir)
-            if initial_accepted:
-                if cpu_instr != -1:
-                    cpu_instr_list.append(cpu_instr)
-                if mem_usage != -1:
-                    mem_usage_list.append(mem_usage)
-            else:
-                accepted = 0
-                error_message = f"Initial test failed"
-
-            if accepted:
-                for _ in range(num_runs - 1):
-                    cpu_instr, mem_usage, run_accepted = run_single_test(repo, venv_path, test_cmd, init_workdir)
-                    if run_accepted:
-                        if cpu_instr != -1:
-                            cpu_instr_list.append(cpu_instr)
-                        if mem_usage != -1:
-                            mem_usage_list.append(mem_usage)
-                    else:
-                        accepted = 0
-                        error_message = f"Test failed during repeated runs"
-                        break
-
-            if len(cpu_instr_list) > 2:
-                cpu_instr_avg = statistics.mean(sorted(cpu_instr_list)[1:-1])
-            else:
-                cpu_instr_avg = -1
-
-            if len(mem_usage_list) > 2:
-                mem_usage_avg = statistics.mean(sorted(mem_usage_list)[1:-1])
-            else:
-                mem_usage_avg = -1
-
-            test_result = {
-                "sha": sha,
-                "test_cmd": test_cmd,
-                "cpu_instr_avg": cpu_instr_avg,
-                "mem_usage_avg": mem_usage_avg,
-                "accepted": accepted,
-                "error_message": error_message
-            }
-
-            if repo['reponame'] not in results:
-                results[repo['reponame']] = []
-            results[repo['reponame']].append(test_result)
+    for repo_key, repo in records_of(repo_data):
+        sha = repo['sha']
+        venv_path = os.path.join(init_workdir, "venv_python", repo['venv_path'])
+        test_cmd = repo['test_cmd']
+        target_file = os.path.join(os.path.join(init_workdir, "test_repo_python", repo['repo_path']), repo['target_file'])
+        target_func = repo['target_func']
+
+        if sha in optimized_functions:
+            optimized_function_code = optimized_functions[sha]
+            replace_function_in_file(target_file, optimized_function_code, target_func)
+            print(f"Replaced function '{target_func}' in '{target_file}'.")
+
+        cpu_instr_list = []
+        mem_usage_list = []
+        accepted = 1
+        error_message = ""
+
+        cpu_instr, mem_usage, initial_accepted = run_single_test(repo, venv_path, test_cmd, init_workdir)
+        if initial_accepted:
+            if cpu_instr != -1:
+                cpu_instr_list.append(cpu_instr)
+            if mem_usage != -1:
+                mem_usage_list.append(mem_usage)
+        else:
+            accepted = 0
+            error_message = f"Initial test failed"
+
+        if accepted:
+            for _ in range(num_runs - 1):
+                cpu_instr, mem_usage, run_accepted = run_single_test(repo, venv_path, test_cmd, init_workdir)
+                if run_accepted:
+                    if cpu_instr != -1:
+                        cpu_instr_list.append(cpu_instr)
+                    if mem_usage != -1:
+                        mem_usage_list.append(mem_usage)
+                else:
+                    accepted = 0
+                    error_message = f"Test failed during repeated runs"
+                    break
+
+        if len(cpu_instr_list) > 2:
+            cpu_instr_avg = statistics.mean(sorted(cpu_instr_list)[1:-1])
+        else:
+            cpu_instr_avg = -1
+
+        if len(mem_usage_list) > 2:
+            mem_usage_avg = statistics.mean(sorted(mem_usage_list)[1:-1])
+        else:
+            mem_usage_avg = -1
+
+        test_result = {
+            "sha": sha,
+            "test_cmd": test_cmd,
+            "cpu_instr_avg": cpu_instr_avg,
+            "mem_usage_avg": mem_usage_avg,
+            "accepted": accepted,
+            "error_message": error_message
+        }
+
+        if repo['reponame'] not in results:
+            results[repo['reponame']] = []
+        results[repo['reponame']].append(test_result)
 
     return results
 
 
-def main():
+def main(repo_config_file='repo_config_file_path_placeholder',
+         optimized_functions_file='optimized_functions_file_path_placeholder',
+         output_results_file='output_results_file_path_placeholder'):
     """
     Main function to run the test and save the results.
+
+    Args:
+        repo_config_file (str): Repository configuration (JSON or JSONL, streamed).
+        optimized_functions_file (str): Optimized functions to test.
+        output_results_file (str): Path of the results JSON to write.
     """
     init_workdir = os.getcwd()
-    repo_config_file = 'repo_config_file_path_placeholder'
-    optimized_functions_file = 'optimized_functions_file_path_placeholder'
-    output_results_file = 'output_results_file_path_placeholder'
+    # Absolute, since the tests run from inside the repositories
+    output_results_file = os.path.abspath(output_results_file)
 
-    repo_data = load_json_file(repo_config_file)
+    if not os.path.exists(repo_config_file):
+        print(f"Error: The file {repo_config_file} was not found.")
+        return
+    repo_data = iter_records(repo_config_file)  # Streamed, one repository entry at a time
     optimized_functions = load_json_file(optimized_functions_file)
     results = run_tests(repo_data, optimized_functions, init_workdir)
     save_json_file(results, output_results_file)
 
+    # Also record the measurements in the results store; PEACE_TEST_VARIANT=baseline marks a run of the original code
+    if RESULTS_DB:
+        with ResultsStore(RESULTS_DB) as store:
+            import_test_results(store, results, os.path.splitext(os.path.basename(output_results_file))[0],
+                                os.environ.get("PEACE_TEST_VARIANT", "optimized"))
+    export_trace()
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the tests of each repository with its optimized function and save the measurements.")
+    parser.add_argument("--repo-config", default='repo_config_file_path_placeholder', help="Repository configuration file.")
+    parser.add_argument("--optimized-functions", default='optimized_functions_file_path_placeholder', help="Optimized functions file.")
+    parser.add_argument("--output", default='output_results_file_path_placeholder', help="Results JSON to write.")
+    args = parser.parse_args()
+    main(args.repo_config, args.optimized_functions, args.output)
\ No newline at end of file
@@ -1,6 +1,7 @@
 import subprocess
 import os
 import re
+from tracing import traced
 
 
 def extract_cpu_instr(output):
@@ -33,6 +34,7 @@ def extract_mem_usage(output):
     return float(match.group(1)) if match else -1
 
 
+@traced("test_run", "test")
 def run_test_after_modification(repo_dir, venv_path, test_cmd):
     """
     Switch the repository to a specified version and run the test command
@@ -3,6 +3,7 @@ import os
 import logging
 import concurrent.futures
 from collections import defaultdict
+from tracing import span, traced
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
@@ -48,7 +49,8 @@ class FunctionAnalyzer:
 
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                tree = ast.parse(f.read(), filename=file_path)
+                with span("ast_parse", "ast", file=file_path):
+                    tree = ast.parse(f.read(), filename=file_path)
                 self.file_cache[file_path] = tree  # Cache the parsed tree
                 return tree
         except (SyntaxError, UnicodeDecodeError) as e:
@@ -84,6 +86,7 @@ class FunctionAnalyzer:
                         return True
         return False
 
+    @traced(category="walk")
     def find_target_function(self):
         """Search for the target function across all Python files in the repository."""
         file_paths = []
@@ -134,6 +137,10 @@ class FunctionAnalyzer:
         return self.get_function_details()
 
 
+# The pipeline modules import the analyzer under this name
+FindFunc = FunctionAnalyzer
+
+
 # Example usage
 if __name__ == '__main__':
     repo_path = "/path/to/repository"  # Replace with actual repository path
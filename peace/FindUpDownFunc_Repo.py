@@ -1,6 +1,7 @@
 import ast
 import os
 import logging
+from tracing import span, traced
 
 # ========== Logger Configuration ==========
 logging.basicConfig(
@@ -66,7 +67,8 @@ class FindUpDownFunc:
         """
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                tree = ast.parse(f.read(), filename=file_path)
+                with span("ast_parse", "ast", file=file_path):
+                    tree = ast.parse(f.read(), filename=file_path)
                 self.class_function_map = self._extract_class_function_map(tree)
 
                 for node in ast.walk(tree):
@@ -87,6 +89,7 @@ class FindUpDownFunc:
             logging.warning(f"Skipping file {file_path} due to error: {e}")
         return False
 
+    @traced(category="walk")
     def find_target_function(self):
         """Searches the repository for the target function's location."""
         for root, _, files in os.walk(self.repo_path):
@@ -106,6 +109,7 @@ class FindUpDownFunc:
                     calls.append(inner_node.func.attr)
         return calls
 
+    @traced(category="walk")
     def find_upstream_functions(self):
         """
         Identifies functions that call the target function.
@@ -127,7 +131,8 @@ class FindUpDownFunc:
 
                 try:
                     with open(file_path, 'r', encoding='utf-8') as f:
-                        tree = ast.parse(f.read(), filename=file_path)
+                        with span("ast_parse", "ast", file=file_path):
+                            tree = ast.parse(f.read(), filename=file_path)
                         class_function_map = self._extract_class_function_map(tree)
 
                         for node in ast.walk(tree):
@@ -143,6 +148,7 @@ class FindUpDownFunc:
                     logging.warning(f"Skipping file {file_path} due to error: {e}")
         return upstream
 
+    @traced(category="walk")
     def find_downstream_functions(self):
         """
         Identifies functions called by the target function.
@@ -167,7 +173,8 @@ class FindUpDownFunc:
 
                     try:
                         with open(file_path, 'r', encoding='utf-8') as f:
-                            tree = ast.parse(f.read(), filename=file_path)
+                            with span("ast_parse", "ast", file=file_path):
+                                tree = ast.parse(f.read(), filename=file_path)
                             class_function_map = self._extract_class_function_map(tree)
 
                             for node in ast.walk(tree):
@@ -1,7 +1,7 @@
 import os
 import ast
 import logging
-from analyze_dependency import DependencyAnalyzer
+from dependency_backend import get_dependency_analyzer
 from FindUpDownFunc_Repo import FindUpDownFunc
 from FindFunc import FindFunc
 
@@ -33,7 +33,14 @@ class FunctionDependencyAnalyzer:
         self.repo_dir = repo_dir
         self.target_function = target_function
         self.target_class = target_class
-        self.dependency_analyzer = DependencyAnalyzer()
+        self._dependency_analyzer = None
+
+    @property
+    def dependency_analyzer(self):
+        """The shared dependency analyzer, fetched when the first score is computed so the model loads lazily."""
+        if self._dependency_analyzer is None:
+            self._dependency_analyzer = get_dependency_analyzer()
+        return self._dependency_analyzer
 
     def _truncate_code(self, code, max_length=500):
         """
@@ -0,0 +1,244 @@
+import os
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from agent import process_response_loop
+from RAGEditPool import RAGEditPool
+from FindFunc import FindFunc
+from FindApi import FindApi
+from llm_client import get_client, LLMRequestError, CodeFenceStop
+from llm_batch import LLMBatchPending
+from prompt_builder import PromptBuilder, PromptSection, format_usage
+from llm_telemetry import telemetry_tags
+from tracing import traced
+
+# ========== GPT Configuration ==========
+GPT_API_URL = os.environ.get("LLM_API_URL", "https://api.example.com/v1/chat/completions")  # Placeholder URL
+GPT_MODEL = "gpt-4o"
+
+# ========== Candidate Configuration ==========
+NUM_CANDIDATES = int(os.environ.get("PEACE_CANDIDATES", "1"))  # Choices per request; >1 enables best-of-n
+CANDIDATE_TEMPERATURES = [  # e.g. "0,0.4,0.8": one request per temperature
+    float(t) for t in os.environ.get("PEACE_CANDIDATE_TEMPERATURES", "").split(",") if t.strip()
+]
+SAMPLING_TEMPERATURE = 0.8  # Used when several choices are requested without explicit temperatures
+
+# ========== Prompt Configuration ==========
+_OPTIMIZE_PROMPT_HEAD = """Given the Python function below, improve its performance. Please only respond with the function code.
+
+    Function to optimize:
+    ```python
+    {function_body}
+    ```
+
+    Associated edits (previous changes related to this function):
+    ```python
+    {associated_edit}
+    ```
+
+"""
+# Only included when there are API hints, so that other prompts carry no empty section
+_API_PROMPT_SECTION = """    APIs used by this function:
+    ```python
+    {api}
+    ```
+
+"""
+_OPTIMIZE_PROMPT_TAIL = """    If the message contains any information regarding the optimization goal, consider that as well. Otherwise, focus solely on improving execution speed, memory usage, and efficiency while keeping the functionality intact.
+
+    Message (may or may not be relevant to optimization goal):
+    ```text
+    {message}
+    ```
+
+    Optimized Version:
+    """
+OPTIMIZE_PROMPT_TEMPLATE = _OPTIMIZE_PROMPT_HEAD + _OPTIMIZE_PROMPT_TAIL
+OPTIMIZE_API_PROMPT_TEMPLATE = _OPTIMIZE_PROMPT_HEAD + _API_PROMPT_SECTION + _OPTIMIZE_PROMPT_TAIL
+PROMPT_BUILDER = PromptBuilder(OPTIMIZE_PROMPT_TEMPLATE)  # Token budget from LLM_PROMPT_TOKENS
+API_PROMPT_BUILDER = PromptBuilder(OPTIMIZE_API_PROMPT_TEMPLATE)
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+@traced("retrieve_edits", "pipeline")
+def add_data(data, rag_pool):
+    """
+    Constructs a single data entry by retrieving function details and relevant edits.
+
+    Parameters
+    ----------
+    data : dict
+        Data containing repository path, function name, class name, and message.
+    rag_pool : RAGEditPool
+        Instance of RAGEditPool for tracking function changes.
+
+    Returns
+    -------
+    dict
+        Updated data with function details, associated edits, and API info.
+    """
+    repo_path = data.get("repo_path")
+    object_function = data.get("function_name")
+    class_name = data.get("class_name")
+    message = data.get("message", "")
+
+    if not repo_path or not object_function:
+        logging.error("Repository path and function name must be provided.")
+        return data
+
+    # Retrieve function signature and body
+    try:
+        signature, body = FindFunc(repo_path, object_function, class_name).find()
+        data["function_body"] = f"{signature}\n{body}" if signature and body else ""
+    except Exception as e:
+        logging.warning(f"Failed to retrieve function details: {e}")
+        data["function_body"] = ""
+
+    # Get associated edits
+    try:
+        with telemetry_tags(phase="agent", function=object_function):
+            data["associated_edit"] = process_response_loop(rag_pool, data["function_body"])
+    except LLMBatchPending:
+        raise  # The answer is in the next batch; do not build on a missing one
+    except Exception as e:
+        logging.warning(f"Failed to process function edits: {e}")
+        data["associated_edit"] = ""
+
+    data["message"] = message
+    data["api"] = ""
+
+    return data
+
+def get_prompt(data):
+    """
+    Constructs an optimization prompt for the LLM within the prompt token budget.
+
+    The function body is allocated budget first, then the associated edits, the
+    message and the API hints; over-budget sections are trimmed at line boundaries.
+    The API section is left out when there are no hints.
+
+    Parameters
+    ----------
+    data : dict
+        Dictionary containing function details, edits, and optimization message.
+
+    Returns
+    -------
+    str
+        Prompt to be sent to the LLM.
+    """
+    sections = [
+        PromptSection("function_body", data.get("function_body", ""), priority=0, min_tokens=256),
+        PromptSection("associated_edit", data.get("associated_edit", ""), priority=1, min_tokens=256),
+        PromptSection("message", data.get("message", ""), priority=2, min_tokens=64)
+    ]
+    api = data.get("api") or ""
+    if api.strip():
+        prompt, usage = API_PROMPT_BUILDER.build(sections + [PromptSection("api", api, priority=3)])
+    else:
+        prompt, usage = PROMPT_BUILDER.build(sections)
+    logging.info(format_usage(usage))
+    return prompt
+
+def send_to_gpt(prompt):
+    """
+    Sends a request to the GPT API for function optimization, streaming the
+    response and stopping once the first fenced code block is complete.
+
+    Parameters
+    ----------
+    prompt : str
+        The prompt to be sent.
+
+    Returns
+    -------
+    str
+        The optimized function response, or an empty string if the request failed.
+    """
+    api_key = os.environ.get("GPT_API_KEY", "sk-xxxxxxxxxxxxxxxxxxxxxxxxxxxxx")  # Use environment variable for security
+    client = get_client(GPT_API_URL, api_key=api_key)
+
+    try:
+        with telemetry_tags(phase="optimize"):
+            return client.stream_chat_completion(
+                [{"role": "user", "content": prompt}],
+                model=GPT_MODEL,
+                stop=CodeFenceStop,
+                temperature=0,
+                n=1
+            )
+    except LLMRequestError as e:
+        logging.error(f"Error in GPT API request: {e}")
+        return ""
+
+def generate_candidates(prompt, n=None, temperatures=None):
+    """
+    Requests several optimized versions of a function for best-of-n selection.
+
+    Each temperature gets one request for `n` choices; the requests are sent
+    concurrently. Without temperatures, a single request samples `n` choices at
+    `SAMPLING_TEMPERATURE` (or 0 when only one choice is requested).
+
+    Parameters
+    ----------
+    prompt : str
+        The prompt to be sent.
+    n : int or None, optional
+        Choices per request, default is `PEACE_CANDIDATES` or 1.
+    temperatures : list or None, optional
+        Sampling temperatures, default is `PEACE_CANDIDATE_TEMPERATURES`.
+
+    Returns
+    -------
+    list
+        The candidate responses, grouped by temperature; failed requests contribute none.
+    """
+    n = NUM_CANDIDATES if n is None else n
+    temperatures = temperatures or CANDIDATE_TEMPERATURES or [SAMPLING_TEMPERATURE if n > 1 else 0]
+    api_key = os.environ.get("GPT_API_KEY", "sk-xxxxxxxxxxxxxxxxxxxxxxxxxxxxx")  # Use environment variable for security
+    client = get_client(GPT_API_URL, api_key=api_key)
+
+    def request(temperature):
+        try:
+            with telemetry_tags(phase="optimize"):
+                return client.chat_completions(
+                    [{"role": "user", "content": prompt}],
+                    model=GPT_MODEL,
+                    stop=CodeFenceStop,
+                    temperature=temperature,
+                    n=n
+                )
+        except LLMRequestError as e:
+            logging.error(f"Error in GPT API request (temperature={temperature}): {e}")
+            return []
+
+    # Each request runs in a copy of the caller's context so it keeps the telemetry tags
+    contexts = [contextvars.copy_context() for _ in temperatures]
+    with ThreadPoolExecutor(max_workers=len(temperatures)) as executor:
+        responses = list(executor.map(lambda context, temperature: context.run(request, temperature),
+                                      contexts, temperatures))
+
+    candidates = [candidate for group in responses for candidate in group]
+    logging.info(f"Received {len(candidates)} candidates from {len(temperatures)} request(s)")
+    return candidates
+
+# ========== Example Usage ==========
+if __name__ == "__main__":
+    DATA = {
+        "repo_path": "/path/to/repository",
+        "function_name": "target_function",
+        "class_name": None,
+        "message": "Optimize this function for performance."
+    }
+
+    rag_pool = RAGEditPool(max_lines=10)
+    updated_data = add_data(DATA, rag_pool)
+    prompt = get_prompt(updated_data)
+    optimized_code = send_to_gpt(prompt)
+
+    logging.info("Optimized Function:")
+    print(optimized_code)
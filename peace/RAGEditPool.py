@@ -1,10 +1,118 @@
 import os
 import re
 import json
+import hashlib
 from difflib import unified_diff
+from collections import OrderedDict
 
-# Import the dependency analyzer (Ensure the corresponding module is available)
-from dependency_analysis import DependencyAnalyzer  
+# The dependency analyzer backend (model or stub) is chosen in dependency_backend
+from dependency_backend import get_dependency_analyzer
+from tracing import span, traced
+
+# Below this many edits a process pool costs more than it saves.
+MIN_PARALLEL_EDITS = 64
+# Reference codes whose fragment scores are kept; the least recently used one is dropped first.
+SCORE_CACHE_REFERENCES = int(os.environ.get("PEACE_SCORE_CACHE_REFERENCES", "4"))
+
+
+def fragment_hash(fragment):
+    """
+    Compute the content hash used to identify a fragment.
+
+    Parameters
+    ----------
+    fragment : str
+        The edit fragment.
+
+    Returns
+    -------
+    str
+        Hex digest of the fragment.
+    """
+    return hashlib.sha1(fragment.encode("utf-8")).hexdigest()
+
+
+def parse_patch(patch):
+    """
+    Parse a patch string to extract before and after code.
+
+    Parameters
+    ----------
+    patch : str
+        The patch string containing the edit information.
+
+    Returns
+    -------
+    tuple
+        A tuple (before_edit, after_edit) strings.
+    """
+    before_edit, after_edit = [], []
+    lines = patch.splitlines()
+
+    for line in lines:
+        if line.startswith('-'):
+            before_edit.append(line[1:])  
+        elif line.startswith('+'):
+            after_edit.append(line[1:])  
+        elif line.startswith('@@'):
+            continue  
+        else:
+            before_edit.append(line)
+            after_edit.append(line)
+
+    return "\n".join(before_edit), "\n".join(after_edit)
+
+
+def split_edit(before_edit, after_edit, max_lines):
+    """
+    Split the unified diff of an edit into fragments of at most `max_lines` lines.
+
+    Parameters
+    ----------
+    before_edit : str
+        The function signature and body before modification.
+    after_edit : str
+        The function signature and body after modification.
+    max_lines : int
+        The maximum number of lines per edit fragment.
+
+    Returns
+    -------
+    list
+        A list of fragment strings.
+    """
+    before_lines = before_edit.splitlines()
+    after_lines = after_edit.splitlines()
+    diff = list(unified_diff(before_lines, after_lines, lineterm=""))
+
+    fragments = []
+    for start in range(0, len(diff), max_lines):
+        fragments.append("\n".join(diff[start:start + max_lines]))
+    return fragments
+
+
+def _edit_to_fragments(args):
+    """
+    Diff a single (before, after) pair or patch string and hash its fragments.
+
+    Runs inside worker processes of `RAGEditPool.add_edits`, hence module level.
+
+    Parameters
+    ----------
+    args : tuple
+        (edit, max_lines) where `edit` is a (before, after) pair or a patch string.
+
+    Returns
+    -------
+    list
+        A list of (fragment, fragment_hash) tuples.
+    """
+    edit, max_lines = args
+    if isinstance(edit, str):
+        before_edit, after_edit = parse_patch(edit)
+    else:
+        before_edit, after_edit = edit
+    return [(fragment, fragment_hash(fragment)) for fragment in split_edit(before_edit, after_edit, max_lines)]
 
 
 class RAGEditPool:
@@ -17,11 +125,14 @@ class RAGEditPool:
         The maximum number of lines per edit fragment.
     edit_pool : list
         A list storing edit fragments.
+    fragment_hashes : list
+        Content hashes of the fragments, aligned with `edit_pool`.
     dependency_analyzer : DependencyAnalyzer
-        An instance of the dependency analyzer to calculate dependencies.
+        An instance of the dependency analyzer to calculate dependencies,
+        created on first use so that building a pool does not load the model.
     """
 
-    def __init__(self, max_lines=15):
+    def __init__(self, max_lines=15, dependency_analyzer=None):
         """
         Initialize the RAG Edit Pool.
 
@@ -29,10 +140,21 @@ class RAGEditPool:
         ----------
         max_lines : int, optional
             The maximum number of lines per edit fragment, default is 15.
+        dependency_analyzer : object or None, optional
+            The analyzer used for scoring, default is the shared one from `get_dependency_analyzer`.
         """
         self.max_lines = max_lines
         self.edit_pool = []
-        self.dependency_analyzer = DependencyAnalyzer()
+        self.fragment_hashes = []
+        self._score_cache = OrderedDict()
+        self._dependency_analyzer = dependency_analyzer
+
+    @property
+    def dependency_analyzer(self):
+        """The analyzer used for scoring, fetched from `get_dependency_analyzer` when first needed."""
+        if self._dependency_analyzer is None:
+            self._dependency_analyzer = get_dependency_analyzer()
+        return self._dependency_analyzer
 
     def add_edit(self, before_edit, after_edit):
         """
@@ -49,19 +171,66 @@ class RAGEditPool:
         -------
         None
         """
-        before_lines = before_edit.splitlines()
-        after_lines = after_edit.splitlines()
-        diff = list(unified_diff(before_lines, after_lines, lineterm=""))
+        for fragment in split_edit(before_edit, after_edit, self.max_lines):
+            self.edit_pool.append(fragment)
+            self.fragment_hashes.append(fragment_hash(fragment))
 
-        chunk = []
-        for line in diff:
-            chunk.append(line)
-            if len(chunk) == self.max_lines:
-                self.edit_pool.append("\n".join(chunk))
-                chunk = []
+    def add_edits(self, edits, workers=None, chunksize=16):
+        """
+        Add many edits at once, diffing them in a process pool.
 
-        if chunk:
-            self.edit_pool.append("\n".join(chunk))
+        Fragments are appended in the order of `edits`, so the resulting pool is
+        identical to calling `add_edit`/`add_edit_from_patch` on each edit in turn.
+
+        Parameters
+        ----------
+        edits : iterable
+            (before_edit, after_edit) pairs and/or patch strings.
+        workers : int or None, optional
+            Number of worker processes, default is the number of CPUs. Use 1 to
+            diff in the current process.
+        chunksize : int, optional
+            Number of edits sent to a worker at a time, default is 16.
+
+        Returns
+        -------
+        int
+            The number of fragments added.
+        """
+        tasks = [(edit, self.max_lines) for edit in edits]
+
+        if workers == 1 or len(tasks) < MIN_PARALLEL_EDITS:
+            results = map(_edit_to_fragments, tasks)
+            added = self._extend_pool(results)
+        else:
+            from concurrent.futures import ProcessPoolExecutor  # Deferred, it is slow to import and rarely needed
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # `map` yields in submission order, which keeps the merge deterministic
+                added = self._extend_pool(executor.map(_edit_to_fragments, tasks, chunksize=chunksize))
+
+        return added
+
+    def _extend_pool(self, results):
+        """
+        Append hashed fragments produced by `_edit_to_fragments`.
+
+        Parameters
+        ----------
+        results : iterable
+            Lists of (fragment, fragment_hash) tuples.
+
+        Returns
+        -------
+        int
+            The number of fragments added.
+        """
+        added = 0
+        for hashed_fragments in results:
+            for fragment, digest in hashed_fragments:
+                self.edit_pool.append(fragment)
+                self.fragment_hashes.append(digest)
+                added += 1
+        return added
 
     def add_edit_from_patch(self, patch):
         """
@@ -93,22 +262,45 @@ class RAGEditPool:
         tuple
             A tuple (before_edit, after_edit) strings.
         """
-        before_edit, after_edit = [], []
-        lines = patch.splitlines()
+        return parse_patch(patch)
 
-        for line in lines:
-            if line.startswith('-'):
-                before_edit.append(line[1:])  
-            elif line.startswith('+'):
-                after_edit.append(line[1:])  
-            elif line.startswith('@@'):
-                continue  
-            else:
-                before_edit.append(line)
-                after_edit.append(line)
+    def score_fragments(self, reference_code, cancel_event=None):
+        """
+        Compute the dependency score of every fragment, in pool order.
 
-        return "\n".join(before_edit), "\n".join(after_edit)
+        Parameters
+        ----------
+        reference_code : str
+            The reference code string to compare against.
+        cancel_event : threading.Event or None, optional
+            Checked before each fragment; scoring stops once it is set.
 
+        Returns
+        -------
+        list or None
+            A list of dependency scores aligned with `edit_pool`, or None if cancelled.
+        """
+        # Scores are memoized per fragment for the last `SCORE_CACHE_REFERENCES` reference
+        # codes, so repeated tool calls on the same reference code do not rerun the model.
+        reference_hash = fragment_hash(reference_code)
+        cached = self._score_cache.pop(reference_hash, None)
+        if cached is None:
+            cached = {}
+            while self._score_cache and len(self._score_cache) >= SCORE_CACHE_REFERENCES:
+                self._score_cache.popitem(last=False)
+        self._score_cache[reference_hash] = cached
+
+        scores = []
+        for fragment, digest in zip(self.edit_pool, self.fragment_hashes):
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            if digest not in cached:
+                with span("dependency_score", "dependency"):
+                    cached[digest] = self.dependency_analyzer.get_dependency(reference_code, fragment)
+            scores.append(cached[digest])
+        return scores
+
+    @traced("fragment_ranking", "rank")
     def calculate_dependency_scores(self, reference_code):
         """
         Calculate dependency scores for all fragments in the pool.
@@ -123,10 +315,7 @@ class RAGEditPool:
         list
             A list of tuples (fragment, dependency_score), sorted in descending order.
         """
-        scores = [
-            (fragment, self.dependency_analyzer.get_dependency(reference_code, fragment))
-            for fragment in self.edit_pool
-        ]
+        scores = list(zip(self.edit_pool, self.score_fragments(reference_code)))
         return sorted(scores, key=lambda x: x[1], reverse=True)
 
     def get_top_k_fragments(self, reference_code, k):
@@ -203,6 +392,7 @@ class RAGEditPool:
         if os.path.exists(file_path):
             with open(file_path, "r", encoding="utf-8") as file:
                 self.edit_pool = json.load(file)
+            self.fragment_hashes = [fragment_hash(fragment) for fragment in self.edit_pool]
 
     def clear_edit_pool(self):
         """
@@ -213,6 +403,8 @@ class RAGEditPool:
         None
         """
         self.edit_pool = []
+        self.fragment_hashes = []
+        self._score_cache = OrderedDict()
 
     def __len__(self):
         """
@@ -252,6 +444,12 @@ if __name__ == '__main__':
     rag_pool.add_edit("def add(a, b): return a + b", "def add(a, b, c): return a + b + c")
     rag_pool.add_edit("def multiply(a, b): return a * b", "def multiply(a, b, c): return a * b * c")
 
+    # Bulk insert, diffed in a process pool for large inputs
+    rag_pool.add_edits([
+        ("def sub(a, b): return a - b", "def sub(a, b, c): return a - b - c"),
+        "@@ -1,2 +1,2 @@\n-def div(a, b): return a / b\n+def div(a, b): return a // b",
+    ])
+
     print(f"Number of fragments in the pool: {len(rag_pool)}")
 
     reference_code = "def calculate(x, y): return x + y"
@@ -0,0 +1,444 @@
+import os
+import json
+import heapq
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from RAGEditPool import RAGEditPool, split_edit, parse_patch, fragment_hash, _edit_to_fragments, MIN_PARALLEL_EDITS
+from tracing import traced
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+
+def _shard_worker(conn, max_lines):
+    """
+    Command loop of a shard process.
+
+    Each shard owns a `RAGEditPool` (and therefore its own dependency analyzer) plus
+    the global insertion index of every fragment it holds, so rankings merged across
+    shards break ties exactly like a single pool does.
+
+    Parameters
+    ----------
+    conn : multiprocessing.connection.Connection
+        Pipe end used to receive commands and send replies.
+    max_lines : int
+        The maximum number of lines per edit fragment.
+    """
+    rag_pool = RAGEditPool(max_lines=max_lines)
+    indices = []
+
+    while True:
+        try:
+            command, *args = conn.recv()
+        except EOFError:
+            break
+
+        try:
+            if command == "add":
+                for index, fragment, digest in args[0]:
+                    indices.append(index)
+                    rag_pool.edit_pool.append(fragment)
+                    rag_pool.fragment_hashes.append(digest)
+                reply = len(args[0])
+            elif command == "rank":
+                reference_code, k = args
+                ranked = (
+                    (-score, index, fragment)
+                    for score, index, fragment in zip(rag_pool.score_fragments(reference_code), indices, rag_pool.edit_pool)
+                )
+                reply = heapq.nsmallest(k, ranked) if k is not None else sorted(ranked)
+            elif command == "fragments":
+                reply = list(zip(indices, rag_pool.edit_pool))
+            elif command == "clear":
+                rag_pool.clear_edit_pool()
+                indices = []
+                reply = None
+            elif command == "close":
+                conn.send(("ok", None))
+                break
+            else:
+                raise ValueError(f"Unknown shard command: {command}")
+            conn.send(("ok", reply))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+
+    conn.close()
+
+
+class ShardedRAGEditPool:
+    """
+    A drop-in replacement for `RAGEditPool` that partitions fragments across worker
+    processes, each with its own scorer. Ranking queries are scattered to every shard
+    and the per-shard top-k lists are merged, so results are identical to a single pool.
+
+    Attributes
+    ----------
+    max_lines : int
+        The maximum number of lines per edit fragment.
+    num_shards : int
+        The number of worker processes.
+    """
+
+    def __init__(self, max_lines=15, num_shards=None, start_method="spawn"):
+        """
+        Initialize the sharded pool and start its worker processes.
+
+        Parameters
+        ----------
+        max_lines : int, optional
+            The maximum number of lines per edit fragment, default is 15.
+        num_shards : int or None, optional
+            The number of worker processes, default is the number of CPUs.
+        start_method : str, optional
+            The multiprocessing start method, default is "spawn" (safe with CUDA models).
+        """
+        self.max_lines = max_lines
+        self.num_shards = max(1, num_shards or os.cpu_count() or 1)
+        self._size = 0
+        self._connections = []
+        self._processes = []
+
+        context = multiprocessing.get_context(start_method)
+        for _ in range(self.num_shards):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_shard_worker, args=(child_conn, max_lines), daemon=True)
+            process.start()
+            child_conn.close()
+            self._connections.append(parent_conn)
+            self._processes.append(process)
+
+        logging.info(f"Started {self.num_shards} edit pool shards")
+
+    # ========== Shard Communication ==========
+    def _scatter(self, messages):
+        """
+        Send one message per shard, then gather every reply.
+
+        Parameters
+        ----------
+        messages : list
+            One command tuple per shard (None to skip a shard).
+
+        Returns
+        -------
+        list
+            The reply of each shard (None for skipped shards).
+        """
+        for conn, message in zip(self._connections, messages):
+            if message is not None:
+                conn.send(message)
+
+        replies = []
+        for conn, message in zip(self._connections, messages):
+            if message is None:
+                replies.append(None)
+                continue
+            status, reply = conn.recv()
+            if status != "ok":
+                raise RuntimeError(f"Edit pool shard failed: {reply}")
+            replies.append(reply)
+        return replies
+
+    def _broadcast(self, *message):
+        """Send the same command to every shard and gather the replies."""
+        return self._scatter([message] * self.num_shards)
+
+    def _distribute(self, hashed_fragments):
+        """
+        Assign fragments to shards round-robin by their global insertion index.
+
+        Parameters
+        ----------
+        hashed_fragments : iterable
+            (fragment, fragment_hash) tuples in insertion order.
+
+        Returns
+        -------
+        int
+            The number of fragments added.
+        """
+        batches = [[] for _ in range(self.num_shards)]
+        added = 0
+        for fragment, digest in hashed_fragments:
+            index = self._size + added
+            batches[index % self.num_shards].append((index, fragment, digest))
+            added += 1
+
+        self._scatter([("add", batch) if batch else None for batch in batches])
+        self._size += added
+        return added
+
+    @traced("fragment_ranking", "rank")
+    def _rank(self, reference_code, k=None):
+        """
+        Merge the per-shard rankings into the global ranking.
+
+        Parameters
+        ----------
+        reference_code : str
+            The reference code string to compare against.
+        k : int or None, optional
+            Only the top k entries are needed, default is all of them.
+
+        Returns
+        -------
+        list
+            A list of tuples (fragment, dependency_score), sorted in descending order.
+        """
+        shard_rankings = self._broadcast("rank", reference_code, k)
+        merged = heapq.merge(*shard_rankings)
+        if k is not None:
+            merged = (entry for _, entry in zip(range(k), merged))
+        return [(fragment, -negative_score) for negative_score, _, fragment in merged]
+
+    # ========== RAGEditPool API ==========
+    def add_edit(self, before_edit, after_edit):
+        """
+        Add a new edit to the pool by splitting it into fragments.
+
+        Parameters
+        ----------
+        before_edit : str
+            The function signature and body before modification.
+        after_edit : str
+            The function signature and body after modification.
+
+        Returns
+        -------
+        None
+        """
+        fragments = split_edit(before_edit, after_edit, self.max_lines)
+        self._distribute((fragment, fragment_hash(fragment)) for fragment in fragments)
+
+    def add_edit_from_patch(self, patch):
+        """
+        Add an edit to the pool based on a patch string.
+
+        Parameters
+        ----------
+        patch : str
+            The patch string containing the edit information.
+
+        Returns
+        -------
+        None
+        """
+        self.add_edit(*parse_patch(patch))
+
+    def add_edits(self, edits, workers=None, chunksize=16):
+        """
+        Add many edits at once, diffing them in a process pool.
+
+        Parameters
+        ----------
+        edits : iterable
+            (before_edit, after_edit) pairs and/or patch strings.
+        workers : int or None, optional
+            Number of worker processes used for diffing, default is the number of CPUs.
+        chunksize : int, optional
+            Number of edits sent to a worker at a time, default is 16.
+
+        Returns
+        -------
+        int
+            The number of fragments added.
+        """
+        tasks = [(edit, self.max_lines) for edit in edits]
+
+        if workers == 1 or len(tasks) < MIN_PARALLEL_EDITS:
+            results = list(map(_edit_to_fragments, tasks))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_edit_to_fragments, tasks, chunksize=chunksize))
+
+        return self._distribute(pair for hashed_fragments in results for pair in hashed_fragments)
+
+    def calculate_dependency_scores(self, reference_code):
+        """
+        Calculate dependency scores for all fragments in the pool.
+
+        Parameters
+        ----------
+        reference_code : str
+            The reference code string to compare against.
+
+        Returns
+        -------
+        list
+            A list of tuples (fragment, dependency_score), sorted in descending order.
+        """
+        return self._rank(reference_code)
+
+    def get_top_k_fragments(self, reference_code, k):
+        """
+        Get the top K fragments with the highest dependency scores.
+
+        Parameters
+        ----------
+        reference_code : str
+            The reference code string to compare against.
+        k : int
+            The number of top fragments to return.
+
+        Returns
+        -------
+        list
+            A list of tuples (fragment, dependency_score).
+        """
+        return self._rank(reference_code, max(0, min(k, self._size)))
+
+    def get_fragments_in_range(self, reference_code, l, r):
+        """
+        Get fragments ranked between positions l and r (inclusive).
+
+        Parameters
+        ----------
+        reference_code : str
+            The reference code string to compare against.
+        l : int
+            The starting rank (1-based, inclusive).
+        r : int
+            The ending rank (1-based, inclusive).
+
+        Returns
+        -------
+        list
+            A list of tuples (fragment, dependency_score).
+        """
+        if l <= 0 or r <= 0 or l > r or l > self._size:
+            return []
+        return self._rank(reference_code, min(r, self._size))[l - 1:]
+
+    @property
+    def edit_pool(self):
+        """
+        All fragments in insertion order, gathered from the shards.
+
+        Returns
+        -------
+        list
+        """
+        gathered = [pair for shard in self._broadcast("fragments") for pair in shard]
+        return [fragment for _, fragment in sorted(gathered)]
+
+    def export_edit_pool(self, file_path="edit_pool.json"):
+        """
+        Save the edit pool to a JSON file.
+
+        Parameters
+        ----------
+        file_path : str, optional
+            The file path to save the edit pool, default is "edit_pool.json".
+
+        Returns
+        -------
+        None
+        """
+        with open(file_path, "w", encoding="utf-8") as file:
+            json.dump(self.edit_pool, file, indent=4)
+
+    def load_edit_pool(self, file_path="edit_pool.json"):
+        """
+        Load the edit pool from a JSON file.
+
+        Parameters
+        ----------
+        file_path : str, optional
+            The file path to load the edit pool, default is "edit_pool.json".
+
+        Returns
+        -------
+        None
+        """
+        if os.path.exists(file_path):
+            with open(file_path, "r", encoding="utf-8") as file:
+                fragments = json.load(file)
+            self.clear_edit_pool()
+            self._distribute((fragment, fragment_hash(fragment)) for fragment in fragments)
+
+    def clear_edit_pool(self):
+        """
+        Clear all edit fragments from the pool.
+
+        Returns
+        -------
+        None
+        """
+        self._broadcast("clear")
+        self._size = 0
+
+    def close(self):
+        """
+        Stop the shard processes.
+
+        Returns
+        -------
+        None
+        """
+        if not self._connections:
+            return
+        try:
+            self._broadcast("close")
+        except (BrokenPipeError, EOFError, OSError):
+            pass
+        for conn in self._connections:
+            conn.close()
+        for process in self._processes:
+            process.join(timeout=5)
+        self._connections = []
+        self._processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        """
+        Return the number of fragments in the edit pool.
+
+        Returns
+        -------
+        int
+        """
+        return self._size
+
+    def __str__(self):
+        """
+        String representation of the edit pool.
+
+        Returns
+        -------
+        str
+        """
+        return f"ShardedRAGEditPool with {self._size} fragments across {self.num_shards} shards."
+
+    def __repr__(self):
+        """
+        Official string representation of the class.
+
+        Returns
+        -------
+        str
+        """
+        return f"ShardedRAGEditPool(max_lines={self.max_lines}, num_shards={self.num_shards})"
+
+
+if __name__ == '__main__':
+    with ShardedRAGEditPool(max_lines=15, num_shards=4) as rag_pool:
+        rag_pool.add_edits([
+            ("def add(a, b): return a + b", "def add(a, b, c): return a + b + c"),
+            ("def multiply(a, b): return a * b", "def multiply(a, b, c): return a * b * c"),
+        ])
+
+        print(f"Number of fragments in the pool: {len(rag_pool)}")
+
+        reference_code = "def calculate(x, y): return x + y"
+        for fragment, score in rag_pool.get_top_k_fragments(reference_code, 10):
+            print(f"Fragment: {fragment}, Score: {score}")
@@ -0,0 +1,294 @@
+import os
+import time
+import logging
+import threading
+from llm_telemetry import UsageMeter
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+# ========== Budget Configuration ==========
+# Per-target limits; unset means unlimited, and budget mode is on when any limit is set
+MAX_FUNCTIONS = os.environ.get("PEACE_BUDGET_MAX_FUNCTIONS")
+MAX_LLM_CALLS = os.environ.get("PEACE_BUDGET_MAX_LLM_CALLS")
+MAX_SECONDS = os.environ.get("PEACE_BUDGET_MAX_SECONDS")
+MAX_TOKENS = os.environ.get("PEACE_BUDGET_MAX_TOKENS")
+
+# Call-graph distance of a modification from the target, by its Phase I relation
+RELATION_DISTANCE = {"target": 0, "downstream": 1, "upstream": 1}
+
+
+def _priority(data):
+    return (
+        RELATION_DISTANCE.get(data.get("relation"), len(RELATION_DISTANCE)),
+        -(data.get("dependency_score") or 0)
+    )
+
+
+def rank_modifications(modifications):
+    """
+    Rank modifications from the most to the least promising.
+
+    The target comes first, then its direct callees and callers, each group by
+    decreasing `dependency_score`; ties keep their Phase I order. The ranking
+    decides what is processed and what budget is kept for whom (`Budget.plan`),
+    not the order: a function still waits for the callees whose edits it retrieves.
+
+    Parameters
+    ----------
+    modifications : list
+        Function modification entries from `analyze_modifications`.
+
+    Returns
+    -------
+    list
+        Indices of the entries, from the most to the least promising.
+    """
+    return sorted(range(len(modifications)), key=lambda index: _priority(modifications[index]))
+
+
+class Budget:
+    """
+    Limits on the work spent on one target: functions started, LLM calls, tokens
+    and wall time.
+
+    The limits are checked before each function starts, so a function in progress
+    always finishes and the target stops cleanly; the LLM calls and tokens of that
+    last function may go over the limit. LLM usage is counted by `meter` (see
+    `llm_telemetry.metered`); calls answered from the cache are free.
+
+    After `plan`, the LLM call, token and time limits are also kept for the more
+    promising functions: a function only starts if what is left covers its own
+    cost and that of every better-ranked function not started yet, estimated as
+    the mean cost of the functions started so far (an even share of the limit
+    before the first one).
+
+    Attributes
+    ----------
+    max_functions, max_llm_calls, max_seconds, max_tokens : int, float or None
+        The limits, None for unlimited.
+    meter : UsageMeter
+        LLM usage of the target.
+    functions : int
+        Functions started.
+    skipped : list
+        Entries of the functions skipped, see `skip`.
+    """
+
+    def __init__(self, max_functions=None, max_llm_calls=None, max_seconds=None, max_tokens=None):
+        """
+        Initialize the budget; the clock starts with `start`.
+
+        Parameters
+        ----------
+        max_functions : int or None, optional
+            Functions to process at most.
+        max_llm_calls : int or None, optional
+            LLM calls to send at most.
+        max_seconds : float or None, optional
+            Wall time after which no function is started.
+        max_tokens : int or None, optional
+            Prompt and completion tokens to spend at most.
+        """
+        self.max_functions = max_functions
+        self.max_llm_calls = max_llm_calls
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+        self.meter = UsageMeter()
+        self.functions = 0
+        self.skipped = []
+        self._planned = None
+        self._ranks = None
+        self._pending = set()
+        self._start = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Create a budget from the `PEACE_BUDGET_*` environment variables."""
+        return cls(
+            max_functions=int(MAX_FUNCTIONS) if MAX_FUNCTIONS else None,
+            max_llm_calls=int(MAX_LLM_CALLS) if MAX_LLM_CALLS else None,
+            max_seconds=float(MAX_SECONDS) if MAX_SECONDS else None,
+            max_tokens=int(MAX_TOKENS) if MAX_TOKENS else None
+        )
+
+    @property
+    def enabled(self):
+        """Whether any limit is set."""
+        return any(limit is not None for limit in (self.max_functions, self.max_llm_calls, self.max_seconds, self.max_tokens))
+
+    @property
+    def elapsed(self):
+        """Seconds since `start`."""
+        return time.perf_counter() - self._start if self._start is not None else 0.0
+
+    def start(self):
+        """Start the clock; returns the budget."""
+        self._start = time.perf_counter()
+        return self
+
+    def plan(self, modifications):
+        """
+        Rank the functions of a target (`rank_modifications`) and choose the ones to
+        process under `max_functions`, the most promising. The others are skipped
+        when their turn comes, see `try_start_function`.
+
+        Parameters
+        ----------
+        modifications : list
+            The target's function modification entries, in Phase I order.
+
+        Returns
+        -------
+        Budget
+            The budget.
+        """
+        ranked = rank_modifications(modifications)
+        if self.max_functions is not None:
+            ranked = ranked[:self.max_functions]
+        self._planned = set(ranked)
+        self._ranks = {index: rank for rank, index in enumerate(ranked)}
+        self._pending = set(ranked)
+        return self
+
+    def order(self, indices):
+        """Sort functions that may start from the most to the least promising, see `plan`."""
+        if self._ranks is None:
+            return list(indices)
+        return sorted(indices, key=lambda index: self._ranks.get(index, len(self._ranks)))
+
+    def _reserved(self, index):
+        """Tell which limit, if any, is kept for better-ranked functions than `index`."""
+        ahead = sum(1 for other in self._pending if self._ranks[other] < self._ranks[index])
+        if not ahead:
+            return None
+        for name, limit, used in (
+            ("max_llm_calls", self.max_llm_calls, self.meter.calls),
+            ("max_tokens", self.max_tokens, self.meter.tokens),
+            ("max_seconds", self.max_seconds, self.elapsed)
+        ):
+            if limit is None:
+                continue
+            per_function = used / self.functions if self.functions else limit / len(self._ranks)
+            if limit - used < (ahead + 1) * per_function:
+                return name
+        return None
+
+    def exhausted(self):
+        """
+        Tell which limit, if any, has been reached.
+
+        Returns
+        -------
+        str or None
+            "max_functions", "max_llm_calls", "max_tokens" or "max_seconds", or None.
+        """
+        if self.max_functions is not None and self.functions >= self.max_functions:
+            return "max_functions"
+        if self.max_llm_calls is not None and self.meter.calls >= self.max_llm_calls:
+            return "max_llm_calls"
+        if self.max_tokens is not None and self.meter.tokens >= self.max_tokens:
+            return "max_tokens"
+        if self.max_seconds is not None and self.elapsed >= self.max_seconds:
+            return "max_seconds"
+        return None
+
+    def try_start_function(self, index=None):
+        """
+        Count a function as started unless the budget is exhausted.
+
+        Parameters
+        ----------
+        index : int or None, optional
+            Position of the function in the modifications given to `plan`; a function
+            left out of the plan is refused with "max_functions", and one that would use
+            the budget kept for better-ranked functions with the limit concerned.
+
+        Returns
+        -------
+        str or None
+            None if the function may start, otherwise the limit that was reached.
+        """
+        with self._lock:
+            if self._planned is not None and index is not None and index not in self._planned:
+                return "max_functions"
+            reason = self.exhausted()
+            if reason is None and index in self._pending:
+                reason = self._reserved(index)
+            self._pending.discard(index)
+            if reason is None:
+                self.functions += 1
+            return reason
+
+    def skip(self, data, reason):
+        """
+        Record a function that was not processed.
+
+        Parameters
+        ----------
+        data : dict
+            Its function modification entry.
+        reason : str
+            The limit that was reached.
+
+        Returns
+        -------
+        dict
+            The entry stored in the results in place of the processed modification:
+            its location, `dependency_score`, `relation` and `skipped` (the reason).
+        """
+        entry = {
+            "repo_path": data.get("repo_path", ""),
+            "file_path": data.get("file_path", ""),
+            "function_name": data.get("function_name", ""),
+            "class_name": data.get("class_name", ""),
+            "message": data.get("message", ""),
+            "dependency_score": data.get("dependency_score"),
+            "relation": data.get("relation"),
+            "skipped": reason
+        }
+        with self._lock:
+            self.skipped.append(entry)
+        return entry
+
+    def summary(self):
+        """
+        Report the usage against the limits.
+
+        Returns
+        -------
+        dict
+        """
+        with self._lock:
+            return {
+                "functions": self.functions,
+                "llm_calls": self.meter.calls,
+                "tokens": self.meter.tokens,
+                "seconds": self.elapsed,
+                "skipped": len(self.skipped),
+                "limits": {
+                    "max_functions": self.max_functions,
+                    "max_llm_calls": self.max_llm_calls,
+                    "max_seconds": self.max_seconds,
+                    "max_tokens": self.max_tokens
+                }
+            }
+
+    def log_summary(self, name=""):
+        """Log the usage, and the skipped functions if any."""
+        summary = self.summary()
+        prefix = f"Budget of {name}" if name else "Budget"
+        logging.info(
+            f"{prefix}: {summary['functions']} functions, {summary['llm_calls']} LLM calls, "
+            f"{summary['tokens']} tokens in {summary['seconds']:.2f}s"
+        )
+        if self.skipped:
+            reasons = sorted({entry["skipped"] for entry in self.skipped})
+            logging.info(
+                f"{prefix}: skipped {len(self.skipped)} functions ({', '.join(reasons)}): "
+                f"{', '.join(entry['function_name'] for entry in self.skipped)}"
+            )
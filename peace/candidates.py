@@ -0,0 +1,142 @@
+import ast
+import hashlib
+import logging
+import textwrap
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+
+class _DocstringRemover(ast.NodeTransformer):
+    """
+    Removes docstrings, which do not change behaviour, from modules, classes and functions.
+    """
+
+    def _strip(self, node):
+        self.generic_visit(node)
+        body = node.body
+        if body and isinstance(body[0], ast.Expr) and isinstance(getattr(body[0], "value", None), ast.Constant) \
+                and isinstance(body[0].value.value, str):
+            node.body = body[1:] or [ast.Pass()]
+        return node
+
+    visit_Module = _strip
+    visit_ClassDef = _strip
+    visit_FunctionDef = _strip
+    visit_AsyncFunctionDef = _strip
+
+
+def normalize_code(code):
+    """
+    Normalize a code candidate so that formatting-only variants compare equal.
+
+    The code is parsed and dumped without positions, so whitespace, comments,
+    quoting style and docstrings are ignored.
+
+    Parameters
+    ----------
+    code : str
+        The candidate code.
+
+    Returns
+    -------
+    str or None
+        The normalized AST dump, or None if the code does not parse.
+    """
+    try:
+        tree = ast.parse(textwrap.dedent(code or ""))
+    except (SyntaxError, ValueError):
+        return None
+    return ast.dump(_DocstringRemover().visit(tree))
+
+
+def optimization_key(function_body, *context):
+    """
+    Hash a function and its prompt context so that identical optimization requests
+    (e.g. the same function at several SHAs or in forks) get the same key.
+
+    Parameters
+    ----------
+    function_body : str
+        The function to optimize; compared by normalized AST when it parses.
+    *context : str
+        The rest of the prompt context (associated edits, message, ...), compared as stripped text.
+
+    Returns
+    -------
+    str
+        Hex SHA-256 digest.
+    """
+    normalized = normalize_code(function_body)
+    parts = [normalized if normalized is not None else (function_body or "").strip()]
+    parts.extend((part or "").strip() for part in context)
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def deduplicate_candidates(candidates):
+    """
+    Mark candidates whose normalized AST equals that of an earlier candidate.
+
+    Candidates that do not parse are compared by their stripped text instead.
+
+    Parameters
+    ----------
+    candidates : list
+        The candidate codes, in generation order.
+
+    Returns
+    -------
+    list
+        One dict per candidate with `index`, `code`, `parses` and `duplicate_of`
+        (the index of the first equal candidate, or None if it is the first).
+    """
+    first_seen = {}
+    entries = []
+    for index, code in enumerate(candidates):
+        normalized = normalize_code(code)
+        key = ("ast", normalized) if normalized is not None else ("text", (code or "").strip())
+        duplicate_of = first_seen.setdefault(key, index)
+        entries.append({
+            "index": index,
+            "code": code,
+            "parses": normalized is not None,
+            "duplicate_of": None if duplicate_of == index else duplicate_of
+        })
+
+    unique = sum(1 for entry in entries if entry["duplicate_of"] is None)
+    logging.info(f"Candidates: {len(entries)} generated, {unique} distinct after AST normalization")
+    return entries
+
+
+def unique_candidates(candidates):
+    """
+    Return the distinct non-empty candidates in generation order.
+
+    Parameters
+    ----------
+    candidates : list
+        The candidate codes.
+
+    Returns
+    -------
+    list
+        The first candidate of every group of AST-equal candidates.
+    """
+    return [
+        entry["code"] for entry in deduplicate_candidates([code for code in candidates if code and code.strip()])
+        if entry["duplicate_of"] is None
+    ]
+
+
+# ========== Example Usage ==========
+if __name__ == "__main__":
+    CANDIDATES = [
+        "def total(xs):\n    return sum(xs)",
+        "def total(xs):\n    '''Sum the values.'''\n    return sum( xs )  # builtin",
+        "def total(xs):\n    result = 0\n    for x in xs:\n        result += x\n    return result"
+    ]
+    for entry in deduplicate_candidates(CANDIDATES):
+        print(entry["index"], entry["duplicate_of"])
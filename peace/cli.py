@@ -0,0 +1,474 @@
+import io
+import os
+import sys
+import json
+import time
+import pstats
+import logging
+import subprocess
+import argparse
+import cProfile
+import statistics
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+# ========== CLI Configuration ==========
+# Command-line options and the environment variables they set. The pipeline modules read
+# their configuration when imported, so the options are applied first and the modules
+# imported afterwards; worker processes inherit them the same way.
+ENVIRONMENT_OPTIONS = (
+    ("--repos-dir", "PEACE_REPOS_DIR", {"help": "Directory holding the repositories."}),
+    ("--workers", "PEACE_MAX_WORKERS", {"type": int, "help": "Targets processed at the same time."}),
+    ("--per-repo", "PEACE_PER_REPO_CONCURRENCY", {"type": int, "help": "Targets of one repository at the same time."}),
+    ("--executor", "PEACE_EXECUTOR", {"choices": ("thread", "process", "staged"), "help": "Worker pool kind."}),
+    ("--lookahead", "PEACE_LOOKAHEAD", {"type": int, "help": "Targets read ahead while their repository is busy."}),
+    ("--analyze-workers", "PEACE_ANALYZE_WORKERS", {"type": int, "help": "Staged executor: Phase I workers."}),
+    ("--retrieve-workers", "PEACE_RETRIEVE_WORKERS", {"type": int, "help": "Staged executor: Phase II workers."}),
+    ("--optimize-workers", "PEACE_OPTIMIZE_WORKERS", {"type": int, "help": "Staged executor: Phase III workers."}),
+    ("--stage-queue-size", "PEACE_STAGE_QUEUE_SIZE", {"type": int, "help": "Staged executor: items queued per stage."}),
+    ("--function-workers", "PEACE_FUNCTION_WORKERS", {"type": int, "help": "Functions of a target optimized at a time (--dag)."}),
+    ("--candidates", "PEACE_CANDIDATES", {"type": int, "help": "Candidates per optimization request (best-of-n)."}),
+    ("--dependency-backend", "PEACE_DEPENDENCY_BACKEND", {"choices": ("model", "stub", "server"), "help": "Dependency analyzer."}),
+    ("--llm-url", "LLM_API_URL", {"help": "Chat-completions endpoint."}),
+    ("--cache-dir", "LLM_CACHE_DIR", {"help": "LLM response cache directory."}),
+    ("--cache-mode", "LLM_CACHE_MODE", {"help": "LLM response cache mode."}),
+    ("--telemetry", "LLM_TELEMETRY_PATH", {"help": "JSONL trace of every LLM call."}),
+    ("--trace", "PEACE_TRACE", {"help": "Chrome trace-event JSON of the run."}),
+    ("--results-db", "PEACE_RESULTS_DB", {"help": "SQLite results store."}),
+    ("--max-functions", "PEACE_BUDGET_MAX_FUNCTIONS", {"type": int, "help": "Budget: functions per target."}),
+    ("--max-llm-calls", "PEACE_BUDGET_MAX_LLM_CALLS", {"type": int, "help": "Budget: LLM calls per target."}),
+    ("--max-seconds", "PEACE_BUDGET_MAX_SECONDS", {"type": float, "help": "Budget: seconds per target."}),
+    ("--max-tokens", "PEACE_BUDGET_MAX_TOKENS", {"type": int, "help": "Budget: tokens per target."})
+)
+ENVIRONMENT_FLAGS = (
+    ("--dag", "PEACE_DAG_SCHEDULING", "1", "Optimize independent functions of a target concurrently."),
+    ("--no-dedup", "PEACE_DEDUP_OPTIMIZATION", "0", "Do not share optimizations of identical functions.")
+)
+BENCH_MODEL = "bench"  # Model name sent by `bench llm`
+# `bench imports`: what is imported (and constructed, without scoring anything) in a fresh interpreter.
+# None of them may load the dependency model stack; it is imported when the first score is computed.
+IMPORT_CASES = (
+    ("RAGEditPool", "from RAGEditPool import RAGEditPool; RAGEditPool()"),
+    ("FunctionModificationAnalyzer", "from get_modifications import FunctionModificationAnalyzer; FunctionModificationAnalyzer('.', 'f')"),
+    ("FunctionDependencyAnalyzer", "from FunctionDependencyAnalyzer import FunctionDependencyAnalyzer; FunctionDependencyAnalyzer('.', 'f')"),
+    ("agent", "import agent"),
+    ("model", "import model")
+)
+HEAVY_MODULES = ("torch", "transformers", "huggingface_hub", "numpy")
+
+
+def _destination(flag):
+    return flag.lstrip("-").replace("-", "_")
+
+
+def add_environment_options(parser):
+    """
+    Add the pipeline configuration options and the stub LLM server options to a parser.
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser
+        The parser.
+    """
+    group = parser.add_argument_group("pipeline configuration (default: the environment variables)")
+    for flag, variable, options in ENVIRONMENT_OPTIONS:
+        group.add_argument(flag, default=None, **dict(options, help=f"{options['help']} [{variable}]"))
+    for flag, variable, _, help_text in ENVIRONMENT_FLAGS:
+        group.add_argument(flag, action="store_true", help=f"{help_text} [{variable}]")
+    stub = parser.add_argument_group("stub LLM server")
+    stub.add_argument("--stub-llm", action="store_true",
+                      help="Serve LLM requests from a local StubLLMServer instead of --llm-url.")
+    stub.add_argument("--stub-latency", type=float, default=0.0, help="Latency of the stub server, in seconds.")
+
+
+def apply_environment(args):
+    """
+    Set the environment variables of the options given on the command line, and start
+    the stub LLM server if requested.
+
+    Must run before the pipeline modules are imported.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Parsed arguments of a parser set up with `add_environment_options`.
+
+    Returns
+    -------
+    StubLLMServer or None
+        The running stub server, to stop at the end.
+    """
+    for flag, variable, _ in ENVIRONMENT_OPTIONS:
+        value = getattr(args, _destination(flag), None)
+        if value is not None:
+            os.environ[variable] = str(value)
+    for flag, variable, value, _ in ENVIRONMENT_FLAGS:
+        if getattr(args, _destination(flag), False):
+            os.environ[variable] = value
+
+    if not getattr(args, "stub_llm", False):
+        return None
+    from stub_llm_server import StubLLMServer
+    server = StubLLMServer(port=0, latency=args.stub_latency).start()
+    os.environ["LLM_API_URL"] = server.url
+    os.environ.setdefault("GPT_API_KEY", "stub")
+    return server
+
+
+def report(name, results, json_path=None):
+    """
+    Log benchmark results and optionally write them as JSON, with the configuration
+    they were measured under.
+
+    Parameters
+    ----------
+    name : str
+        The benchmark.
+    results : dict
+        Measured values.
+    json_path : str or None, optional
+        File to write.
+    """
+    for key, value in results.items():
+        logging.info(f"{name} {key}: {value:.4g}" if isinstance(value, float) else f"{name} {key}: {value}")
+    if json_path:
+        configuration = {variable: os.environ[variable] for _, variable, _ in ENVIRONMENT_OPTIONS if variable in os.environ}
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": name, "results": results, "configuration": configuration}, f, indent=4)
+
+
+def _timings(seconds):
+    return {
+        "runs": len(seconds),
+        "min_seconds": min(seconds),
+        "mean_seconds": statistics.mean(seconds),
+        "max_seconds": max(seconds)
+    }
+
+
+# ========== Commands ==========
+def run_command(args):
+    """`peace run`: run the pipeline over a dataset."""
+    from model import run_pipeline
+    start = time.perf_counter()
+    completed = run_pipeline(args.input, args.output, args.results_log, args.run_name)
+    logging.info(f"Pipeline {'finished' if completed else 'stopped'} in {time.perf_counter() - start:.2f}s")
+    return 0 if completed else 1
+
+
+def bench_dataset(args):
+    """`peace bench dataset`: read a dataset with the streaming reader."""
+    from dataset_stream import iter_records, CHUNK_SIZE
+    size = os.path.getsize(args.file)
+    seconds, records = [], 0
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        records = sum(1 for _ in iter_records(args.file, args.chunk_size or CHUNK_SIZE))
+        seconds.append(time.perf_counter() - start)
+    best = min(seconds)
+    return {**_timings(seconds), "records": records, "records_per_second": records / best,
+            "megabytes_per_second": size / best / 1e6}
+
+
+def bench_analysis(args):
+    """`peace bench analysis`: Phase I (repo walks, AST parses and dependency scoring) of one target."""
+    from get_modifications import FunctionModificationAnalyzer
+    seconds, modifications = [], []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        modifications = FunctionModificationAnalyzer(args.repo, args.function, args.class_name).get_modifications()
+        seconds.append(time.perf_counter() - start)
+    return {**_timings(seconds), "functions": len(modifications)}
+
+
+def bench_rag(args):
+    """`peace bench rag`: insert synthetic edits into a RAGEditPool and rank its fragments."""
+    from RAGEditPool import RAGEditPool
+    edits = [(
+        f"def func_{i}(a, b):\n    total = a + {i}\n    for _ in range(b):\n        total += a\n    return total",
+        f"def func_{i}(a, b):\n    return a + {i} + a * b"
+    ) for i in range(args.edits)]
+    rag_pool = RAGEditPool(max_lines=args.max_lines)
+    start = time.perf_counter()
+    rag_pool.add_edits(edits)
+    add_seconds = time.perf_counter() - start
+
+    seconds = []
+    for query in range(args.queries):
+        reference_code = f"def calculate_{query}(x, y):\n    return func_{query}(x, y) + {query}"
+        start = time.perf_counter()
+        rag_pool.get_top_k_fragments(reference_code, args.k)
+        seconds.append(time.perf_counter() - start)
+    return {"fragments": len(rag_pool), "add_seconds": add_seconds, **_timings(seconds),
+            "fragments_scored_per_second": len(rag_pool) * len(seconds) / sum(seconds)}
+
+
+def bench_dependency(args):
+    """`peace bench dependency`: score code pairs with the dependency analyzer, one by one and batched."""
+    from dependency_backend import get_dependency_analyzer
+    analyzer = get_dependency_analyzer()
+    pairs = [(
+        f"def load_{i}(path):\n    return parse_{i}(read(path))",
+        f"def parse_{i}(text):\n    return text.split()[{i % 7}:]"
+    ) for i in range(args.pairs)]
+    start = time.perf_counter()
+    for code_1, code_2 in pairs:
+        analyzer.get_dependency(code_1, code_2)
+    single_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    analyzer.compare_multiple_codes(pairs)
+    batch_seconds = time.perf_counter() - start
+    return {"pairs": len(pairs), "single_seconds": single_seconds, "batch_seconds": batch_seconds,
+            "pairs_per_second_single": len(pairs) / single_seconds, "pairs_per_second_batch": len(pairs) / batch_seconds}
+
+
+def bench_llm(args):
+    """`peace bench llm`: send concurrent chat-completion requests through the LLM client."""
+    from llm_client import get_client
+    client = get_client(api_key=os.environ.get("GPT_API_KEY"))
+
+    def request(index):
+        messages = [{"role": "user", "content": f"Function to optimize:\n```python\ndef f_{index}(x):\n    return x + {index}\n```"}]
+        start = time.perf_counter()
+        client.chat_completion(messages, args.model)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = sorted(pool.map(request, range(args.requests)))
+    wall = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "concurrency": args.concurrency,
+        "seconds": wall,
+        "requests_per_second": len(latencies) / wall,
+        "latency_p50": latencies[len(latencies) // 2],
+        "latency_p95": latencies[int(0.95 * (len(latencies) - 1))]
+    }
+
+
+def _import_times(code):
+    """
+    Run `code` under `python -X importtime`.
+
+    Returns
+    -------
+    tuple
+        ({module: cumulative microseconds} of every module imported, total microseconds).
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"'{code}' failed:\n{completed.stderr[-2000:]}")
+    modules, total = {}, 0
+    for line in completed.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package", nested imports indented under their importer
+        fields = line[len("import time:"):].split("|") if line.startswith("import time:") else []
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        modules[fields[2].strip()] = int(fields[1])
+        if not fields[2][1:].startswith(" "):
+            total += int(fields[1])
+    return modules, total
+
+
+def bench_imports(args):
+    """`peace bench imports`: time the imports of the pipeline modules and check none loads the model stack."""
+    results, passed = {}, True
+    for case, code in IMPORT_CASES:
+        milliseconds = []
+        for _ in range(args.repeat):
+            modules, micros = _import_times(code)
+            milliseconds.append(micros / 1000)
+        heavy = sorted(name for name in modules if name in HEAVY_MODULES)
+        results[f"{case}_import_ms"] = min(milliseconds)
+        results[f"{case}_heavy_modules"] = ", ".join(heavy) or "none"
+        if heavy:
+            logging.error(f"{case} imports {', '.join(heavy)}; they should load when a score is first computed")
+            passed = False
+        if args.max_ms is not None and min(milliseconds) > args.max_ms:
+            logging.error(f"{case} takes {min(milliseconds):.1f}ms to import, over the {args.max_ms}ms budget")
+            passed = False
+    results["passed"] = passed
+    return results
+
+
+def bench_command(args):
+    """`peace bench <subsystem>`: run a benchmark and report it; fails if the benchmark reports it did not pass."""
+    results = args.bench(args)
+    report(args.subsystem, results, args.json)
+    return 0 if results.get("passed", True) else 1
+
+
+def profile_command(args, parser):
+    """
+    `peace profile [options] <command> ...`: run another command under cProfile
+    and/or tracemalloc and report where the time and memory went.
+    """
+    inner = parser.parse_args(args.command)
+    if inner.name == "profile":
+        parser.error("profile cannot wrap itself")
+    profiler = cProfile.Profile() if args.mode in ("cpu", "both") else None
+    if args.mode in ("memory", "both"):
+        tracemalloc.start(args.frames)
+
+    server = apply_environment(inner)
+    try:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            status = inner.handler(inner)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+    finally:
+        if server is not None:
+            server.stop()
+    # Snapshot before building the report, whose own allocations would show up in it
+    snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+    memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    text = io.StringIO()
+    if profiler is not None:
+        stats = pstats.Stats(profiler, stream=text).strip_dirs().sort_stats(args.sort)
+        stats.print_stats(args.top)
+        if args.output:
+            stats.dump_stats(args.output)
+            logging.info(f"Wrote the CPU profile to {args.output} (open it with pstats or snakeviz)")
+    if snapshot is not None:
+        current, peak = memory
+        text.write(f"Memory: {current / 1e6:.1f} MB still allocated, {peak / 1e6:.1f} MB peak\n")
+        text.write(f"Top {args.top} allocation sites:\n")
+        for statistic in snapshot.statistics("lineno")[:args.top]:
+            text.write(f"    {statistic}\n")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(text.getvalue())
+        logging.info(f"Wrote the profile report to {args.report}")
+    else:
+        print(text.getvalue())
+    return status
+
+
+def build_parser():
+    """
+    Build the `peace` argument parser.
+
+    Returns
+    -------
+    argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(
+        prog="peace",
+        description="Run, benchmark and profile the Peace pipeline. Options override the environment variables in brackets."
+    )
+    commands = parser.add_subparsers(dest="name", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the pipeline over a dataset.")
+    run_parser.add_argument("--input", required=True, help="Dataset: nested JSON or JSONL.")
+    run_parser.add_argument("--output", default="model_results.json", help="Nested results JSON to write.")
+    run_parser.add_argument("--results-log", default=None, help="Resumable JSONL result log (default: output.jsonl).")
+    run_parser.add_argument("--run-name", default=None, help="Run name in the results store.")
+    add_environment_options(run_parser)
+    run_parser.set_defaults(handler=run_command)
+
+    bench_parser = commands.add_parser("bench", help="Benchmark one subsystem.")
+    subsystems = bench_parser.add_subparsers(dest="subsystem", required=True)
+
+    dataset = subsystems.add_parser("dataset", help="Streaming dataset reader.")
+    dataset.add_argument("file", help="Dataset file.")
+    dataset.add_argument("--chunk-size", type=int, default=None, help="Characters read at a time.")
+    dataset.add_argument("--repeat", type=int, default=3, help="Runs.")
+    dataset.set_defaults(bench=bench_dataset)
+
+    analysis = subsystems.add_parser("analysis", help="Phase I of one target: repo walks, AST parses, dependency scores.")
+    analysis.add_argument("--repo", required=True, help="Repository directory.")
+    analysis.add_argument("--function", required=True, help="Target function.")
+    analysis.add_argument("--class", dest="class_name", default=None, help="Class of the target function.")
+    analysis.add_argument("--repeat", type=int, default=3, help="Runs.")
+    analysis.set_defaults(bench=bench_analysis)
+
+    rag = subsystems.add_parser("rag", help="Associated edit pool: insertion and fragment ranking.")
+    rag.add_argument("--edits", type=int, default=200, help="Synthetic edits inserted.")
+    rag.add_argument("--queries", type=int, default=20, help="Rankings computed.")
+    rag.add_argument("--k", type=int, default=5, help="Fragments retrieved per query.")
+    rag.add_argument("--max-lines", type=int, default=15, help="Lines per fragment.")
+    rag.set_defaults(bench=bench_rag)
+
+    dependency = subsystems.add_parser("dependency", help="Dependency analyzer scoring.")
+    dependency.add_argument("--pairs", type=int, default=64, help="Code pairs scored.")
+    dependency.set_defaults(bench=bench_dependency)
+
+    llm = subsystems.add_parser("llm", help="LLM client throughput and latency.")
+    llm.add_argument("--requests", type=int, default=64, help="Requests sent.")
+    llm.add_argument("--concurrency", type=int, default=8, help="Requests in flight.")
+    llm.add_argument("--model", default=BENCH_MODEL, help="Model name sent.")
+    llm.set_defaults(bench=bench_llm)
+
+    imports = subsystems.add_parser("imports", help="Import time of the pipeline modules (python -X importtime).")
+    imports.add_argument("--repeat", type=int, default=3, help="Runs per module; the fastest is reported.")
+    imports.add_argument("--max-ms", type=float, default=None, help="Fail if a module takes longer to import.")
+    imports.set_defaults(bench=bench_imports)
+
+    for subsystem in (dataset, analysis, rag, dependency, llm, imports):
+        subsystem.add_argument("--json", default=None, help="Write the results and configuration to this JSON file.")
+        add_environment_options(subsystem)
+        subsystem.set_defaults(handler=bench_command)
+
+    profile_parser = commands.add_parser(
+        "profile", help="Run another command under cProfile and/or tracemalloc.",
+        description="cProfile sees the thread that runs the command: with --workers 1 (and no --dag) "
+                    "the whole pipeline runs in it."
+    )
+    profile_parser.add_argument("--mode", choices=("cpu", "memory", "both"), default="cpu", help="What to profile.")
+    profile_parser.add_argument("--sort", default="cumulative", help="pstats sort key.")
+    profile_parser.add_argument("--top", type=int, default=30, help="Functions or allocation sites reported.")
+    profile_parser.add_argument("--frames", type=int, default=1, help="Traceback frames kept by tracemalloc.")
+    profile_parser.add_argument("--output", default=None, help="Write the raw cProfile stats to this file.")
+    profile_parser.add_argument("--report", default=None, help="Write the report to this file instead of stdout.")
+    profile_parser.add_argument("command", nargs=argparse.REMAINDER, help="The command to profile, e.g. run --input data.json.")
+    profile_parser.set_defaults(handler=None)
+    return parser
+
+
+def main(argv=None):
+    """
+    Entry point of the `peace` command line.
+
+    Parameters
+    ----------
+    argv : list or None, optional
+        Arguments, default is `sys.argv[1:]`.
+
+    Returns
+    -------
+    int
+        Exit status.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.name == "profile":
+        if not args.command:
+            parser.error("profile needs a command, e.g. profile run --input data.json")
+        return profile_command(args, parser)
+
+    server = apply_environment(args)
+    try:
+        return args.handler(args)
+    finally:
+        if server is not None:
+            server.stop()
+
+
+# ========== Main Execution ==========
+if __name__ == "__main__":
+    sys.exit(main())
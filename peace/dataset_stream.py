@@ -0,0 +1,248 @@
+import json
+import logging
+import argparse
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+# ========== Stream Configuration ==========
+CHUNK_SIZE = 1 << 20  # Characters read at a time; a record larger than this grows the read size
+JSONL_EXTENSIONS = (".jsonl", ".ndjson")
+JSONL_KEY = "repo"  # Field holding the record key in JSONL datasets
+
+_WHITESPACE = " \t\r\n"
+_NUMBER_CHARS = "0123456789+-.eE"
+
+
+class _JSONStreamReader:
+    """
+    Reads a JSON document piece by piece, keeping only the unread part in memory.
+    """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self, size=None):
+        """Read more text; returns False at the end of the file."""
+        if self._eof:
+            return False
+        chunk = self._file.read(size or self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it, or "" at the end."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        """Consume the next non-whitespace character, which must be `char`."""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' but found '{found or 'end of file'}'")
+        self._pos += 1
+
+    def value(self):
+        """Decode the next JSON value."""
+        self.peek()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._fill(size):
+                    size *= 2  # The value is larger than the buffer; read more each time
+                    continue
+                raise
+            # A number at the end of the buffer may continue in the next chunk
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and not self._eof \
+                    and not self._buffer[end:].strip(_NUMBER_CHARS) and self._fill(size):
+                continue
+            self._pos = end
+            return value
+
+    def elements(self):
+        """Yield the elements of the array that starts here."""
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.peek()
+            self._pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or ']' in an array but found '{separator or 'end of file'}'")
+
+
+def _iter_json(f, chunk_size):
+    reader = _JSONStreamReader(f, chunk_size)
+    start = reader.peek()
+    if start == "[":
+        for element in reader.elements():
+            yield None, element
+        return
+
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if reader.peek() == "[":
+            for element in reader.elements():
+                yield key, element
+        else:
+            yield key, reader.value()
+        separator = reader.peek()
+        if separator not in (",", "}"):
+            raise ValueError(f"Expected ',' or '}}' in an object but found '{separator or 'end of file'}'")
+        reader.expect(separator)
+        if separator == "}":
+            return
+
+
+def _iter_jsonl(f):
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {number} is not valid JSON: {e}") from e
+        yield record.get(JSONL_KEY) if isinstance(record, dict) else None, record
+
+
+def iter_records(path, chunk_size=CHUNK_SIZE):
+    """
+    Read the records of a dataset one at a time, without loading the whole file.
+
+    Supported layouts:
+
+    - nested JSON, {key: [item, ...], ...} as in the input of `model.py`: yields
+      (key, item) for every item; a key whose value is not a list yields (key, value);
+    - a JSON array [item, ...]: yields (None, item);
+    - JSONL (`.jsonl` or `.ndjson`), one item per line: yields (item["repo"], item),
+      or (None, item) without a "repo" field.
+
+    Parameters
+    ----------
+    path : str
+        The dataset file.
+    chunk_size : int, optional
+        Characters read at a time, default is 1M.
+
+    Yields
+    ------
+    tuple
+        (key, item) in file order.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith(JSONL_EXTENSIONS):
+            yield from _iter_jsonl(f)
+        else:
+            yield from _iter_json(f, chunk_size)
+
+
+def iter_items(path, chunk_size=CHUNK_SIZE):
+    """Read the items of a dataset one at a time, see `iter_records`."""
+    for _, item in iter_records(path, chunk_size):
+        yield item
+
+
+def records_of(data):
+    """
+    Return the (key, item) records of a dataset already in memory, like `iter_records`.
+
+    Parameters
+    ----------
+    data : dict or list or iterable
+        Nested {key: [item, ...]} data, a list of items, or (key, item) records,
+        which are returned as they are.
+
+    Returns
+    -------
+    iterable
+    """
+    if isinstance(data, dict):
+        return (
+            (key, element)
+            for key, value in data.items()
+            for element in (value if isinstance(value, list) else [value])
+        )
+    if isinstance(data, list):
+        return ((None, item) for item in data)
+    return data
+
+
+def write_items(path, items, indent=4):
+    """
+    Write items as they come, as a JSON array or, for a `.jsonl` path, as JSONL.
+
+    Parameters
+    ----------
+    path : str
+        Output file.
+    items : iterable
+        The items; they are consumed lazily.
+    indent : int or None, optional
+        Indentation of the JSON array, default is 4.
+
+    Returns
+    -------
+    int
+        The number of items written.
+    """
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        if path.lower().endswith(JSONL_EXTENSIONS):
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+                count += 1
+            return count
+
+        f.write("[")
+        for item in items:
+            text = json.dumps(item, ensure_ascii=False, indent=indent)
+            if indent is not None:
+                text = "\n" + "\n".join(" " * indent + line for line in text.splitlines())
+            f.write(("," if count else "") + text)
+            count += 1
+        f.write("\n]\n" if count and indent is not None else "]\n")
+    return count
+
+
+# ========== Main Execution ==========
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a nested JSON dataset to JSONL, streaming.")
+    parser.add_argument("input", help="Nested JSON or JSON array dataset.")
+    parser.add_argument("output", help="JSONL file to write; each item gets its key in a \"repo\" field.")
+    args = parser.parse_args()
+
+    def keyed(records):
+        for key, item in records:
+            if key is not None and isinstance(item, dict):
+                item = {JSONL_KEY: key, **item}
+            yield item
+
+    count = write_items(args.output, keyed(iter_records(args.input)), indent=None)
+    logging.info(f"Wrote {count} records from {args.input} to {args.output}")
@@ -1,9 +1,10 @@
 import os
 import ast
 import logging
-from analyze_dependency import DependencyAnalyzer
+from dependency_backend import get_dependency_analyzer
 from FindUpDownFunc_Repo import FindUpDownFunc
 from FindFunc import FindFunc
+from tracing import span, traced
 
 # ========== Logger Configuration ==========
 logging.basicConfig(
@@ -33,7 +34,14 @@ class FunctionModificationAnalyzer:
         self.repo_dir = repo_dir
         self.target_function = target_function
         self.target_class = target_class
-        self.dependency_analyzer = DependencyAnalyzer()
+        self._dependency_analyzer = None
+
+    @property
+    def dependency_analyzer(self):
+        """The shared dependency analyzer, fetched when the first score is computed so the model loads lazily."""
+        if self._dependency_analyzer is None:
+            self._dependency_analyzer = get_dependency_analyzer()
+        return self._dependency_analyzer
 
     def _truncate_code(self, code, max_length=500):
         """
@@ -73,7 +81,51 @@ class FunctionModificationAnalyzer:
         signature, body = analyzer.find()
         return f"{signature}\n{body}" if signature and body else None
 
-    def _get_dependent_functions(self, func_list):
+    def _get_function_calls(self, file_path, function_name, class_name=None):
+        """
+        Lists the names of the functions called in a function, like `FindUpDownFunc`.
+
+        Parameters
+        ----------
+        file_path : str or None
+            File containing the function.
+        function_name : str
+            Name of the function.
+        class_name : str or None, optional
+            Name of the class containing the function (if applicable).
+
+        Returns
+        -------
+        list or None
+            Sorted called names, or None if the function cannot be found or parsed.
+        """
+        if not file_path:
+            return None
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                with span("ast_parse", "ast", file=file_path):
+                    tree = ast.parse(f.read(), filename=file_path)
+        except (OSError, SyntaxError, UnicodeDecodeError, ValueError):
+            return None
+
+        scopes = [n for n in ast.walk(tree) if isinstance(n, ast.ClassDef) and n.name == class_name] if class_name else [tree]
+        function_node = next((
+            n for scope in scopes for n in ast.walk(scope)
+            if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)) and n.name == function_name
+        ), None)
+        if function_node is None:
+            return None
+
+        calls = set()
+        for node in ast.walk(function_node):
+            if isinstance(node, ast.Call):
+                if isinstance(node.func, ast.Name):
+                    calls.add(node.func.id)
+                elif isinstance(node.func, ast.Attribute):
+                    calls.add(node.func.attr)
+        return sorted(calls)
+
+    def _get_dependent_functions(self, func_list, relation):
         """
         Retrieves functions with their dependency scores.
 
@@ -81,6 +133,8 @@ class FunctionModificationAnalyzer:
         ----------
         func_list : list
             List of functions to analyze.
+        relation : str
+            "downstream" (callees of the target) or "upstream" (callers of the target).
 
         Returns
         -------
@@ -109,21 +163,25 @@ class FunctionModificationAnalyzer:
                 continue
 
             # Compute dependency score
-            score = self.dependency_analyzer.get_dependency(
-                self._truncate_code(function_code), 
-                self._truncate_code(target_code)
-            )
+            with span("dependency_score", "dependency", function=function_name, relation=relation):
+                score = self.dependency_analyzer.get_dependency(
+                    self._truncate_code(function_code), 
+                    self._truncate_code(target_code)
+                )
 
             if score > 0.001:
                 modifications.append({
                     "file_path": file_path,
                     "class_name": class_name,
                     "function_name": function_name,
-                    "dependency_score": score
+                    "dependency_score": score,
+                    "relation": relation,
+                    "calls": self._get_function_calls(file_path, function_name, class_name)
                 })
 
         return modifications
 
+    @traced(category="walk")
     def _get_function_file_path(self, function_name, class_name=None):
         """
         Identifies the file containing the given function.
@@ -146,7 +204,8 @@ class FunctionModificationAnalyzer:
                     file_path = os.path.join(root, file)
                     try:
                         with open(file_path, "r", encoding="utf-8") as f:
-                            tree = ast.parse(f.read(), filename=file_path)
+                            with span("ast_parse", "ast", file=file_path):
+                                tree = ast.parse(f.read(), filename=file_path)
                             for node in ast.walk(tree):
                                 if isinstance(node, ast.FunctionDef) and node.name == function_name:
                                     if class_name:
@@ -165,6 +224,10 @@ class FunctionModificationAnalyzer:
         """
         Determines functions requiring modifications based on dependency scores.
 
+        Each entry records its `relation` to the target ("downstream", "target" or
+        "upstream") and the names it `calls`, from which the functions it depends on
+        can be derived.
+
         Returns
         -------
         list
@@ -177,19 +240,22 @@ class FunctionModificationAnalyzer:
         modifications = []
 
         # Analyze downstream functions
-        downstream_modifications = self._get_dependent_functions(downstream)
+        downstream_modifications = self._get_dependent_functions(downstream, "downstream")
         modifications.extend(downstream_modifications)
 
         # Include target function itself
+        target_file = self._get_function_file_path(self.target_function, self.target_class)
         modifications.append({
-            "file_path": self._get_function_file_path(self.target_function, self.target_class),
+            "file_path": target_file,
             "class_name": self.target_class,
             "function_name": self.target_function,
-            "dependency_score": 100  # Target function always requires modification
+            "dependency_score": 100,  # Target function always requires modification
+            "relation": "target",
+            "calls": self._get_function_calls(target_file, self.target_function, self.target_class)
         })
 
         # Analyze upstream functions
-        upstream_modifications = self._get_dependent_functions(upstream)
+        upstream_modifications = self._get_dependent_functions(upstream, "upstream")
         modifications.extend(upstream_modifications)
 
         return modifications
@@ -0,0 +1,448 @@
+import os
+import time
+import asyncio
+import logging
+import aiohttp
+from llm_client import (
+    DEFAULT_API_URL, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT, DEFAULT_MAX_RETRIES,
+    DEFAULT_BACKOFF_BASE, DEFAULT_BACKOFF_MAX, RETRY_STATUS_CODES,
+    LLMRequestError, LLMClientMetrics, compute_backoff, extract_content, lookup_cache
+)
+from llm_cache import default_cache
+from llm_batch import default_batch_session, LLMBatchPending
+from llm_telemetry import LLMCall, default_recorder
+from tracing import span
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+# ========== Engine Configuration ==========
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+DEFAULT_COMPLETION_TOKENS = 512  # Tokens reserved per request when `max_tokens` is not set
+
+
+def estimate_tokens(text):
+    """
+    Roughly estimate the number of tokens of a text (about 4 characters per token).
+
+    Parameters
+    ----------
+    text : str
+        The text to measure.
+
+    Returns
+    -------
+    int
+        Estimated token count.
+    """
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter refilled continuously at `rate_per_minute`.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        """
+        Initialize the bucket, full.
+
+        Parameters
+        ----------
+        rate_per_minute : float
+            Refill rate in units per minute.
+        capacity : float or None, optional
+            Maximum burst size, default is one minute worth of units.
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        """
+        Wait until `amount` units are available and take them.
+
+        Parameters
+        ----------
+        amount : float, optional
+            Units to take; clamped to the bucket capacity.
+
+        Returns
+        -------
+        float
+            Time spent waiting, in seconds.
+        """
+        amount = min(amount, self.capacity)
+        start = time.monotonic()
+        # The lock keeps waiters first-come, first-served
+        async with self._lock:
+            self._refill()
+            while self.available < amount:
+                await asyncio.sleep((amount - self.available) / self.rate)
+                self._refill()
+            self.available -= amount
+        return time.monotonic() - start
+
+
+class RateLimiter:
+    """
+    Combined requests-per-minute and tokens-per-minute limiter.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        """
+        Initialize the limiter; a limit of None disables that bucket.
+
+        Parameters
+        ----------
+        requests_per_minute : float or None, optional
+            Maximum number of requests per minute.
+        tokens_per_minute : float or None, optional
+            Maximum number of (prompt + completion) tokens per minute.
+        """
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    async def acquire(self, tokens):
+        """
+        Wait until one request carrying `tokens` tokens is allowed.
+
+        Parameters
+        ----------
+        tokens : int
+            Estimated tokens of the request.
+
+        Returns
+        -------
+        float
+            Time spent waiting, in seconds.
+        """
+        waited = 0.0
+        if self.request_bucket:
+            waited += await self.request_bucket.acquire(1)
+        if self.token_bucket:
+            waited += await self.token_bucket.acquire(tokens)
+        return waited
+
+
+class AsyncLLMClient:
+    """
+    Asyncio chat-completions client with a concurrency limit, a token-bucket rate
+    limiter and the same retry policy as `LLMClient`. Use it as an async context manager.
+
+    Attributes
+    ----------
+    url : str
+        The chat-completions endpoint.
+    max_concurrency : int
+        Maximum number of requests in flight.
+    rate_limiter : RateLimiter
+        Requests/min and tokens/min limiter.
+    metrics : LLMClientMetrics
+        Request, retry and latency metrics.
+    cache : LLMResponseCache or None
+        Response cache consulted before every request.
+    batch : BatchSession or None
+        Offline batch session; when set, requests are never sent to the API.
+    telemetry : TelemetryRecorder or None
+        Recorder of per-call latency, queue wait, tokens, retries and cache hits.
+    """
+
+    def __init__(self, url=None, api_key=None, headers=None, timeout=None, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, requests_per_minute=None, tokens_per_minute=None,
+                 cache=None, batch=None, telemetry=None):
+        """
+        Initialize the client.
+
+        Parameters
+        ----------
+        url : str or None, optional
+            The chat-completions endpoint, default is `LLM_API_URL`.
+        api_key : str or None, optional
+            API key sent as a bearer token, default is `GPT_API_KEY`.
+        headers : dict or None, optional
+            Extra headers; an `Authorization` header here takes precedence over `api_key`.
+        timeout : float or tuple or None, optional
+            Read timeout or (connect, read) timeouts in seconds.
+        max_retries : int, optional
+            Maximum number of retries per request.
+        backoff_base : float, optional
+            Base delay of the exponential backoff in seconds.
+        backoff_max : float, optional
+            Upper bound of a single backoff delay in seconds.
+        max_concurrency : int, optional
+            Maximum number of requests in flight.
+        requests_per_minute : float or None, optional
+            Requests-per-minute limit, default is unlimited.
+        tokens_per_minute : float or None, optional
+            Tokens-per-minute limit, default is unlimited.
+        cache : LLMResponseCache or bool or None, optional
+            Response cache; None uses the one configured by `LLM_CACHE_DIR`, False disables caching.
+        batch : BatchSession or bool or None, optional
+            Offline batch session; None uses the one configured by `LLM_BATCH_REQUESTS`, False disables it.
+        telemetry : TelemetryRecorder or bool or None, optional
+            Call recorder; None uses the process-wide one (`LLM_TELEMETRY_PATH`), False disables it.
+        """
+        self.url = url or DEFAULT_API_URL
+        if timeout is None:
+            timeout = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+        elif not isinstance(timeout, tuple):
+            timeout = (DEFAULT_CONNECT_TIMEOUT, float(timeout))
+        self.timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max(1, max_concurrency)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.metrics = LLMClientMetrics()
+        self.cache = default_cache() if cache is None else (cache or None)
+        self.batch = default_batch_session() if batch is None else (batch or None)
+        self.telemetry = default_recorder() if telemetry is None else (telemetry or None)
+
+        self.headers = {"Content-Type": "application/json"}
+        api_key = api_key or os.environ.get("GPT_API_KEY")
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+        self.headers.update(headers or {})
+
+        self.session = None
+        self.rate_limiter = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        # asyncio primitives must be created inside the running loop
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        self.session = aiohttp.ClientSession(connector=connector, headers=self.headers, timeout=self.timeout)
+        self.rate_limiter = RateLimiter(self.requests_per_minute, self.tokens_per_minute)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.session.close()
+        self.session = None
+
+    async def post(self, payload, estimated_tokens=None):
+        """
+        Post a chat-completions payload, retrying transient failures.
+
+        Parameters
+        ----------
+        payload : dict
+            The request body.
+        estimated_tokens : int or None, optional
+            Tokens charged to the tokens/min bucket, estimated from the payload if None.
+
+        Returns
+        -------
+        dict
+            The decoded response body.
+
+        Raises
+        ------
+        LLMRequestError
+            If the request fails with a non-retryable error or runs out of retries.
+        LLMCacheMiss
+            If the cache is in replay mode and does not hold the request.
+        LLMBatchPending
+            If batch mode is on and the request was queued for the next batch.
+        """
+        call = LLMCall(payload)
+        with span("llm_call", "llm", model=call.payload.get("model"), **call.tags) as llm_span:
+            try:
+                result = await self._post(call, estimated_tokens)
+            except Exception as e:
+                if self.telemetry is not None:
+                    self.telemetry.record(call, error=e)
+                raise
+            llm_span.set_tag("cache_hit", call.cache_hit)
+            llm_span.set_tag("retries", call.retries)
+        if self.telemetry is not None:
+            self.telemetry.record(call, result)
+        return result
+
+    async def _post(self, call, estimated_tokens=None):
+        key, cached = lookup_cache(self.cache, self.metrics, call.payload)
+        if cached is not None:
+            call.cache_hit = True
+            return cached
+
+        if self.batch is not None:
+            call.batch = True
+            result = self.batch.resolve(call.payload)
+        else:
+            result = await self._post_with_retries(call.payload, estimated_tokens, call)
+        if key is not None:
+            self.cache.put(key, call.payload, result)
+        return result
+
+    async def _post_with_retries(self, payload, estimated_tokens=None, call=None):
+        """
+        Post a payload to the API within the concurrency and rate limits, retrying
+        transient failures.
+
+        Parameters
+        ----------
+        payload : dict
+            The request body.
+        estimated_tokens : int or None, optional
+            Tokens charged to the tokens/min bucket, estimated from the payload if None.
+        call : LLMCall or None, optional
+            Call measurements to update with the queue wait and retry count.
+
+        Returns
+        -------
+        dict
+            The decoded response body.
+        """
+        if estimated_tokens is None:
+            prompt_text = "".join(message.get("content") or "" for message in payload.get("messages", []))
+            estimated_tokens = estimate_tokens(prompt_text) + payload.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+
+        waited = time.perf_counter()
+        async with self._semaphore:
+            attempt = 0
+            while True:
+                await self.rate_limiter.acquire(estimated_tokens)
+                if call is not None:
+                    # Time waiting for a slot and for the rate limiter, not the backoff sleeps
+                    call.queue_wait += time.perf_counter() - waited
+                    call.retries = attempt
+                retry_after = None
+                start = time.perf_counter()
+                try:
+                    async with self.session.post(self.url, json=payload) as response:
+                        self.metrics.record_attempt(time.perf_counter() - start, response.status)
+                        if response.status not in RETRY_STATUS_CODES:
+                            response.raise_for_status()
+                            result = await response.json(content_type=None)
+                            self.metrics.record_request(True, attempt)
+                            return result
+                        error = LLMRequestError(f"HTTP {response.status} from {self.url}")
+                        retry_after = response.headers.get("Retry-After")
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    self.metrics.record_attempt(time.perf_counter() - start, type(e).__name__)
+                    error = LLMRequestError(f"{type(e).__name__} while requesting {self.url}: {e}")
+                except (aiohttp.ClientError, ValueError) as e:
+                    # Non-retryable HTTP errors (4xx) and undecodable bodies
+                    self.metrics.record_request(False, attempt)
+                    raise LLMRequestError(f"LLM request to {self.url} failed: {e}") from e
+
+                if attempt >= self.max_retries:
+                    self.metrics.record_request(False, attempt)
+                    raise LLMRequestError(f"{error} (gave up after {attempt} retries)")
+
+                delay = compute_backoff(attempt, self.backoff_base, self.backoff_max, retry_after)
+                logging.warning(f"{error}; retrying in {delay:.2f}s ({attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+                attempt += 1
+                waited = time.perf_counter()
+
+    async def chat_completion(self, messages, model, temperature=0, n=1, **options):
+        """
+        Request a chat completion and return the content of the first choice.
+
+        Parameters
+        ----------
+        messages : list
+            Chat messages, e.g. [{"role": "user", "content": prompt}].
+        model : str
+            Model name.
+        temperature : float, optional
+            Sampling temperature, default is 0.
+        n : int, optional
+            Number of choices, default is 1.
+        **options
+            Extra fields of the request body.
+
+        Returns
+        -------
+        str
+            The message content.
+        """
+        payload = {"model": model, "messages": messages, "temperature": temperature, "n": n}
+        payload.update(options)
+        return extract_content(await self.post(payload))
+
+    async def complete_prompts(self, prompts, model, **options):
+        """
+        Send many single-message prompts concurrently.
+
+        Parameters
+        ----------
+        prompts : list
+            Prompt strings.
+        model : str
+            Model name.
+        **options
+            Extra fields of the request body.
+
+        Returns
+        -------
+        list
+            One entry per prompt, in input order: the content, or None if the request failed
+            or was queued for batch submission.
+        """
+        async def complete(prompt):
+            try:
+                return await self.chat_completion([{"role": "user", "content": prompt}], model, **options)
+            except LLMBatchPending:
+                return None
+            except LLMRequestError as e:
+                logging.error(f"Error in LLM API request: {e}")
+                return None
+
+        return await asyncio.gather(*(complete(prompt) for prompt in prompts))
+
+
+def run_prompts(prompts, model, client_options=None, **options):
+    """
+    Synchronous entry point: send many prompts concurrently and wait for all of them.
+
+    Parameters
+    ----------
+    prompts : list
+        Prompt strings.
+    model : str
+        Model name.
+    client_options : dict or None, optional
+        `AsyncLLMClient` arguments (url, headers, max_concurrency, requests_per_minute, ...).
+    **options
+        Extra fields of the request body.
+
+    Returns
+    -------
+    tuple
+        (responses, metrics) where `responses` is in input order (None for failures)
+        and `metrics` is the client metrics snapshot.
+    """
+    async def run():
+        async with AsyncLLMClient(**(client_options or {})) as client:
+            responses = await client.complete_prompts(prompts, model, **options)
+            return responses, client.metrics.snapshot()
+
+    return asyncio.run(run())
+
+
+# ========== Example Usage ==========
+if __name__ == "__main__":
+    # Point LLM_API_URL at a local stub server to try the engine offline
+    responses, metrics = run_prompts(
+        [f"Say hello to number {i}." for i in range(20)],
+        model="gpt-4o",
+        client_options={"max_concurrency": 4, "requests_per_minute": 600, "tokens_per_minute": 100000}
+    )
+    for response in responses:
+        print(response)
+    print(metrics)
@@ -0,0 +1,271 @@
+import os
+import json
+import asyncio
+import logging
+import argparse
+import threading
+from llm_cache import request_key
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+DEFAULT_BATCH_ENDPOINT = "/v1/chat/completions"
+
+
+class LLMBatchPending(Exception):
+    """
+    Raised when a request has been queued for offline batch submission instead of sent.
+
+    Deliberately not an `LLMRequestError`: the pipeline must stop building on the
+    missing response rather than treat it as an empty answer.
+    """
+
+
+class BatchSession:
+    """
+    Collects LLM requests into a JSONL batch request file and serves responses from
+    JSONL batch response files, matched by custom id.
+
+    The custom id is the content address of the request (see `llm_cache.request_key`),
+    so a rerun of the pipeline finds the responses of the prompts it collected earlier.
+
+    Attributes
+    ----------
+    requests_path : str
+        Batch request file written by this session.
+    responses_paths : list
+        Batch response files read by this session.
+    pending : int
+        Number of requests queued by this session.
+    """
+
+    def __init__(self, requests_path, responses_paths=None, endpoint=DEFAULT_BATCH_ENDPOINT):
+        """
+        Initialize the session and load the available responses.
+
+        Parameters
+        ----------
+        requests_path : str
+            Batch request file to write; overwritten when the first request is queued.
+        responses_paths : str or list or None, optional
+            One or more batch response files from previous rounds.
+        endpoint : str, optional
+            Endpoint recorded in each request line, default is "/v1/chat/completions".
+        """
+        if isinstance(responses_paths, str):
+            responses_paths = [responses_paths]
+        self.requests_path = requests_path
+        self.responses_paths = list(responses_paths or [])
+        self.endpoint = endpoint
+        self.pending = 0
+        self._queued_ids = set()
+        self._file = None
+        self._lock = threading.Lock()
+        self._responses = {}
+
+        for path in self.responses_paths:
+            self._load_responses(path)
+
+    def _load_responses(self, path):
+        """
+        Load successful responses of a batch response file.
+
+        Parameters
+        ----------
+        path : str
+            Path to the JSONL response file.
+        """
+        if not os.path.exists(path):
+            logging.warning(f"Batch response file not found: {path}")
+            return
+
+        loaded = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if response.get("status_code") == 200 and response.get("body"):
+                    self._responses[record["custom_id"]] = response["body"]
+                    loaded += 1
+        logging.info(f"Loaded {loaded} batch responses from {path}")
+
+    @property
+    def paused(self):
+        """Whether requests were queued and the pipeline must be resumed later."""
+        return self.pending > 0
+
+    def lookup(self, payload):
+        """
+        Find the response of a request.
+
+        Parameters
+        ----------
+        payload : dict
+            The request body.
+
+        Returns
+        -------
+        tuple
+            (custom_id, response) where `response` is None if not available yet.
+        """
+        custom_id = request_key(payload)
+        return custom_id, self._responses.get(custom_id)
+
+    def resolve(self, payload):
+        """
+        Return the batch response of a request, or queue the request if there is none yet.
+
+        Parameters
+        ----------
+        payload : dict
+            The request body.
+
+        Returns
+        -------
+        dict
+            The response body.
+
+        Raises
+        ------
+        LLMBatchPending
+            If the request was queued for the next batch.
+        """
+        custom_id, response = self.lookup(payload)
+        if response is None:
+            self.submit(custom_id, payload)
+            raise LLMBatchPending(f"Request {custom_id[:12]} queued for batch submission in {self.requests_path}")
+        return response
+
+    def submit(self, custom_id, payload):
+        """
+        Queue a request in the batch request file.
+
+        Parameters
+        ----------
+        custom_id : str
+            The custom id of the request.
+        payload : dict
+            The request body.
+        """
+        with self._lock:
+            if custom_id in self._queued_ids:
+                return
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.requests_path)), exist_ok=True)
+                # Start a fresh request file per run, but keep appending after a close()
+                self._file = open(self.requests_path, "a" if self._queued_ids else "w", encoding="utf-8")
+            record = {"custom_id": custom_id, "method": "POST", "url": self.endpoint, "body": payload}
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self._queued_ids.add(custom_id)
+            self.pending += 1
+
+    def close(self):
+        """Close the batch request file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def log_summary(self):
+        """Log whether the pipeline is paused and how to resume it."""
+        if self.paused:
+            logging.info(
+                f"Pipeline paused: {self.pending} requests written to {self.requests_path}. "
+                f"Run the batch job, then rerun with its response file added to LLM_BATCH_RESPONSES."
+            )
+        else:
+            logging.info(f"All LLM requests were served from {len(self.responses_paths)} batch response file(s).")
+
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+
+def default_batch_session():
+    """
+    Return the process-wide batch session configured by environment variables, or None.
+
+    `LLM_BATCH_REQUESTS` enables batch mode and names the request file to write;
+    `LLM_BATCH_RESPONSES` lists response files of previous rounds, separated by `os.pathsep`.
+
+    Returns
+    -------
+    BatchSession or None
+    """
+    global _default_session
+    requests_path = os.environ.get("LLM_BATCH_REQUESTS")
+    if not requests_path:
+        return None
+
+    with _default_session_lock:
+        if _default_session is None:
+            responses = os.environ.get("LLM_BATCH_RESPONSES", "")
+            _default_session = BatchSession(requests_path, [path for path in responses.split(os.pathsep) if path])
+        return _default_session
+
+
+def process_batch_file(requests_path, responses_path, url=None, max_concurrency=8):
+    """
+    Local stand-in for a batch job: replay every request against a chat-completions
+    endpoint (e.g. the local stub server) and write a batch response file.
+
+    Parameters
+    ----------
+    requests_path : str
+        Batch request file.
+    responses_path : str
+        Batch response file to write.
+    url : str or None, optional
+        The chat-completions endpoint, default is `LLM_API_URL`.
+    max_concurrency : int, optional
+        Maximum number of requests in flight, default is 8.
+
+    Returns
+    -------
+    int
+        Number of successful responses.
+    """
+    # Imported here so the batch session itself does not depend on aiohttp
+    from llm_async import AsyncLLMClient
+    from llm_client import LLMRequestError
+
+    with open(requests_path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    async def run():
+        async with AsyncLLMClient(url=url, max_concurrency=max_concurrency, cache=False, batch=False) as client:
+            async def replay(record):
+                try:
+                    body = await client.post(record["body"])
+                    return {"custom_id": record["custom_id"], "response": {"status_code": 200, "body": body}, "error": None}
+                except LLMRequestError as e:
+                    return {"custom_id": record["custom_id"], "response": None, "error": {"message": str(e)}}
+
+            return await asyncio.gather(*(replay(record) for record in records))
+
+    results = asyncio.run(run())
+    with open(responses_path, "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    succeeded = sum(1 for result in results if result["error"] is None)
+    logging.info(f"Processed {len(records)} batch requests ({succeeded} succeeded) into {responses_path}")
+    return succeeded
+
+
+# ========== Main Execution ==========
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a JSONL batch request file against a chat-completions endpoint.")
+    parser.add_argument("requests_path", help="Batch request file written by the pipeline.")
+    parser.add_argument("responses_path", help="Batch response file to write.")
+    parser.add_argument("--url", default=None, help="Chat-completions endpoint, default is LLM_API_URL.")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="Maximum number of requests in flight.")
+    args = parser.parse_args()
+
+    process_batch_file(args.requests_path, args.responses_path, args.url, args.max_concurrency)
@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+# ========== Cache Modes ==========
+MODE_READWRITE = "readwrite"  # Serve hits, store misses
+MODE_REPLAY = "replay"        # Serve hits, never call the API (offline benchmarking)
+MODE_OFF = "off"              # Bypass the cache
+CACHE_MODES = (MODE_READWRITE, MODE_REPLAY, MODE_OFF)
+
+# Request fields that determine the response
+KEY_FIELDS = ("model", "messages", "temperature", "n")
+
+
+def request_key(payload, variant=None):
+    """
+    Compute the content address of a chat-completions request.
+
+    Parameters
+    ----------
+    payload : dict
+        The request body.
+    variant : str or None, optional
+        What else the stored response depends on, e.g. the stop condition a streamed
+        response was cut at; None for a plain response.
+
+    Returns
+    -------
+    str
+        SHA-256 hex digest of (model, messages, temperature, n) and the variant.
+    """
+    material = {field: payload.get(field) for field in KEY_FIELDS}
+    if variant is not None:
+        material["variant"] = variant
+    encoded = json.dumps(material, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Disk-backed, content-addressed cache of chat-completions responses with TTL and
+    size-based (least recently used) eviction. One JSON file per entry, so several
+    processes can share a cache directory.
+
+    Attributes
+    ----------
+    cache_dir : str
+        Directory holding the entries.
+    ttl : float or None
+        Entry lifetime in seconds, None for no expiry.
+    max_bytes : int or None
+        Size limit of the cache directory, None for no limit.
+    mode : str
+        One of "readwrite", "replay" or "off".
+    hits : int
+        Number of cache hits.
+    misses : int
+        Number of cache misses.
+    """
+
+    def __init__(self, cache_dir, ttl=None, max_bytes=None, mode=MODE_READWRITE):
+        """
+        Initialize the cache.
+
+        Parameters
+        ----------
+        cache_dir : str
+            Directory holding the entries; created if missing.
+        ttl : float or None, optional
+            Entry lifetime in seconds, default is no expiry.
+        max_bytes : int or None, optional
+            Size limit of the cache directory, default is no limit.
+        mode : str, optional
+            "readwrite" (default), "replay" (read-only) or "off".
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode '{mode}', expected one of {CACHE_MODES}")
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None  # Computed lazily, only needed for eviction
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def enabled(self):
+        """Whether lookups are served from the cache."""
+        return self.mode != MODE_OFF
+
+    @property
+    def read_only(self):
+        """Whether misses must not reach the API."""
+        return self.mode == MODE_REPLAY
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """
+        Look up a response.
+
+        Parameters
+        ----------
+        key : str
+            The request key from `request_key`.
+
+        Returns
+        -------
+        dict or None
+            The cached response body, or None on a miss or an expired entry.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        if self.ttl is not None and time.time() - entry.get("created", 0) > self.ttl:
+            if not self.read_only:
+                self._remove(path)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            os.utime(path)  # Mark as recently used for eviction
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return entry["response"]
+
+    def put(self, key, payload, response):
+        """
+        Store a response; a no-op in replay mode.
+
+        Parameters
+        ----------
+        key : str
+            The request key from `request_key`.
+        payload : dict
+            The request body, stored alongside for inspection.
+        response : dict
+            The response body.
+        """
+        if self.read_only or not self.enabled:
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            "key": key,
+            "created": time.time(),
+            "request": {field: payload.get(field) for field in KEY_FIELDS},
+            "response": response
+        }
+        # Write then rename so concurrent readers never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        if self.max_bytes is not None:
+            with self._lock:
+                if self._size is None:
+                    self._size = sum(size for _, size, _ in self._entries())
+                else:
+                    self._size += os.path.getsize(path)
+                if self._size > self.max_bytes:
+                    self._evict()
+
+    def _entries(self):
+        """Yields (path, size, last_used) of every entry."""
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith(".json"):
+                    path = os.path.join(root, file)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        """Remove least recently used entries until the cache is 90% of `max_bytes`."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for path, size, _ in entries:
+            if self._size <= target:
+                break
+            self._remove(path)
+            self._size -= size
+            removed += 1
+        logging.info(f"Evicted {removed} LLM cache entries from {self.cache_dir}")
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        """Remove every entry."""
+        for path, _, _ in list(self._entries()):
+            self._remove(path)
+        self._size = 0
+
+    def stats(self):
+        """
+        Return hit/miss counters.
+
+        Returns
+        -------
+        dict
+        """
+        with self._lock:
+            return {"mode": self.mode, "hits": self.hits, "misses": self.misses}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """
+    Return the process-wide cache configured by environment variables, or None.
+
+    `LLM_CACHE_DIR` enables the cache; `LLM_CACHE_MODE` (readwrite/replay/off),
+    `LLM_CACHE_TTL` (seconds) and `LLM_CACHE_MAX_BYTES` tune it.
+
+    Returns
+    -------
+    LLMResponseCache or None
+    """
+    global _default_cache
+    cache_dir = os.environ.get("LLM_CACHE_DIR")
+    if not cache_dir:
+        return None
+
+    with _default_cache_lock:
+        if _default_cache is None or _default_cache.cache_dir != cache_dir:
+            ttl = os.environ.get("LLM_CACHE_TTL")
+            max_bytes = os.environ.get("LLM_CACHE_MAX_BYTES")
+            _default_cache = LLMResponseCache(
+                cache_dir,
+                ttl=float(ttl) if ttl else None,
+                max_bytes=int(max_bytes) if max_bytes else None,
+                mode=os.environ.get("LLM_CACHE_MODE", MODE_READWRITE)
+            )
+        return _default_cache
+
+
+# ========== Example Usage ==========
+if __name__ == "__main__":
+    cache = LLMResponseCache("llm_cache", ttl=7 * 24 * 3600, max_bytes=512 * 1024 * 1024)
+    payload = {"model": "gpt-4o", "messages": [{"role": "user", "content": "Say hello."}], "temperature": 0, "n": 1}
+    key = request_key(payload)
+
+    if cache.get(key) is None:
+        cache.put(key, payload, {"choices": [{"message": {"content": "Hello."}}]})
+    print(cache.get(key), cache.stats())
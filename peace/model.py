@@ -1,6 +1,29 @@
+import os
 import json
 import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from process_function_modifications import pipeline_function_modifications as process_pipeline
+from llm_client import log_all_metrics
+from llm_batch import LLMBatchPending, default_batch_session
+from llm_telemetry import TELEMETRY_PATH, default_recorder, telemetry_tags
+from staged_pipeline import StagedPipeline
+from dependency_backend import DependencyServer, RemoteDependencyAnalyzer, set_dependency_analyzer
+from result_log import ResultLog, compact
+from dataset_stream import iter_records, records_of
+from results_store import RESULTS_DB, ResultsStore, import_model_results, import_llm_trace
+from tracing import default_tracer, enable_tracing, export_trace, span
+
+# ========== Path Configuration ==========
+REPOS_DIR = os.environ.get("PEACE_REPOS_DIR", "/path/to/repos")  # Modify path accordingly
+
+# ========== Parallelism Configuration ==========
+MAX_WORKERS = int(os.environ.get("PEACE_MAX_WORKERS", "1"))  # Targets processed at the same time; 1 is sequential
+PER_REPO_CONCURRENCY = int(os.environ.get("PEACE_PER_REPO_CONCURRENCY", "1"))  # Targets of one repo at the same time
+EXECUTOR = os.environ.get("PEACE_EXECUTOR", "thread")  # "thread", "process" or "staged"
+LOOKAHEAD = int(os.environ.get("PEACE_LOOKAHEAD", "64"))  # Targets read ahead while their repository is busy
 
 # ========== Logger Configuration ==========
 logging.basicConfig(
@@ -53,61 +76,298 @@ def save_json(data, file_path):
     except Exception as e:
         logging.error(f"Failed to save JSON file {file_path}: {e}")
 
-def process_repositories(data):
+def pipeline_input(item):
+    """
+    Builds the input of `pipeline_function_modifications` for one target.
+
+    Parameters
+    ----------
+    item : dict
+        The target entry.
+
+    Returns
+    -------
+    dict or None
+        The pipeline input, or None if the entry lacks the repository or function.
+    """
+    repo_path = item.get("reponame", "")
+    function_name = item.get("target_func", "")
+    class_name = item.get("target_class", "")
+    message = item.get("prompt", "")
+
+    if not repo_path or not function_name:
+        logging.warning(f"Skipping entry due to missing repo_path or function_name: {item}")
+        return None
+
+    return {
+        "repo_path": os.path.join(REPOS_DIR, repo_path),
+        "function_name": function_name,
+        "class_name": class_name if class_name else None,
+        "message": message
+    }
+
+def process_item(repo_name, item):
+    """
+    Processes one target (a function at a SHA) of a repository.
+
+    Parameters
+    ----------
+    repo_name : str
+        Key of the repository in the input data.
+    item : dict
+        The target entry.
+
+    Returns
+    -------
+    tuple or None
+        (sha, results), or None if the target was skipped, failed or is pending in batch mode.
+    """
+    try:
+        # Construct input data for pipeline
+        data_for_pipeline = pipeline_input(item)
+        if data_for_pipeline is None:
+            return None
+
+        # Process modifications
+        with telemetry_tags(repo=repo_name, sha=item.get("sha", "unknown_sha")), \
+                span("target", "pipeline", repo=repo_name, sha=item.get("sha", "unknown_sha")):
+            results = process_pipeline(data_for_pipeline)
+        return item.get("sha", "unknown_sha"), results
+
+    except LLMBatchPending as e:
+        logging.info(f"Paused {item.get('sha', 'unknown_sha')} until the next batch: {e}")
+    except Exception as e:
+        logging.error(f"Error processing {item.get('sha', 'unknown_sha')}: {e}")
+    return None
+
+def _init_worker_process(dependency_server_url, tracing):
+    """Point a worker process at the parent's dependency server instead of loading the model again."""
+    set_dependency_analyzer(RemoteDependencyAnalyzer(dependency_server_url))
+    enable_tracing(tracing)
+
+def _process_item_in_worker(repo_name, item):
+    """Runs `process_item` in a worker process and hands its LLM telemetry and trace events back to the parent."""
+    return process_item(repo_name, item), default_recorder().pop_records(), default_tracer().pop_events()
+
+def process_repositories(data, max_workers=None, per_repo_concurrency=None, executor=None, skip=None, on_result=None):
     """
     Processes repositories by applying function modifications.
 
+    Targets of different repositories are independent and run in parallel on a
+    worker pool. At most `per_repo_concurrency` targets of one repository are in
+    flight; the next one is submitted when one finishes. Results are assembled in
+    input order whatever the completion order.
+
+    Targets are read from `data` as they are needed, so a dataset streamed with
+    `dataset_stream.iter_records` is processed from its first record on, with at
+    most `PEACE_LOOKAHEAD` targets read ahead while their repository is busy.
+
+    With a process pool, the parent loads the dependency model once and serves it to
+    the workers (`dependency_backend.DependencyServer`). Batch mode always uses
+    threads so that every request lands in one batch file.
+
+    The "staged" executor runs the phases as stages with their own worker pools
+    instead (`staged_pipeline.StagedPipeline`); `max_workers` and
+    `per_repo_concurrency` do not apply to it.
+
     Parameters
     ----------
-    data : dict
-        Dictionary containing repository data.
+    data : dict or iterable
+        Dictionary containing repository data, or (repo_name, item) records.
+    max_workers : int or None, optional
+        Size of the worker pool, default is `PEACE_MAX_WORKERS` or 1 (sequential).
+    per_repo_concurrency : int or None, optional
+        Targets of one repository in flight, default is `PEACE_PER_REPO_CONCURRENCY` or 1.
+    executor : str or None, optional
+        "thread", "process" or "staged", default is `PEACE_EXECUTOR` or "thread".
+    skip : set or None, optional
+        (repo, sha) keys that already have a result and are not processed again.
+    on_result : callable or None, optional
+        Called as `on_result(repo_name, sha, results)` as soon as a target completes
+        (e.g. `ResultLog.append`); such results are not kept in memory.
 
     Returns
     -------
     dict
-        Processed results.
+        Processed results that were not handed to `on_result`.
     """
-    output_data = {}
+    max_workers = max(1, MAX_WORKERS if max_workers is None else max_workers)
+    per_repo_concurrency = max(1, PER_REPO_CONCURRENCY if per_repo_concurrency is None else per_repo_concurrency)
+    executor = executor or EXECUTOR
+    skip = skip or set()
+    if executor not in ("thread", "process", "staged"):
+        raise ValueError(f"Unknown executor '{executor}', expected 'thread', 'process' or 'staged'")
+    if executor == "process" and default_batch_session() is not None:
+        logging.warning("Batch mode collects requests in this process; using threads instead of processes")
+        executor = "thread"
+
+    repo_names = dict.fromkeys(data) if isinstance(data, dict) else {}  # Every repository appears in the output
+    skipped = 0
+
+    def targets():
+        nonlocal skipped
+        for index, (repo_name, item) in enumerate(records_of(data)):
+            if repo_name is None:
+                repo_name = item.get("reponame", "")  # JSONL record without a "repo" field
+            repo_names.setdefault(repo_name)
+            if (repo_name, item.get("sha", "unknown_sha")) in skip:
+                skipped += 1
+                continue
+            yield index, repo_name, item
+
+    outcomes = {}
+
+    def finish(repo_name, index, outcome):
+        if outcome is None:
+            return
+        if on_result is not None:
+            on_result(repo_name, *outcome)
+        else:
+            outcomes[(repo_name, index)] = outcome
+
+    if executor == "staged":
+        def staged_targets():
+            for index, repo_name, item in targets():
+                data_for_pipeline = pipeline_input(item)
+                if data_for_pipeline is not None:
+                    yield (repo_name, index), repo_name, item.get("sha", "unknown_sha"), data_for_pipeline
 
-    for repo_name, items in data.items():
-        repo_results = {}
+        results_lock = threading.Lock()
 
-        for item in items:
-            try:
-                repo_path = item.get("reponame", "")
-                function_name = item.get("target_func", "")
-                class_name = item.get("target_class", "")
-                message = item.get("prompt", "")
+        def finish_staged(key, outcome):
+            with results_lock:
+                finish(*key, outcome)
 
-                if not repo_path or not function_name:
-                    logging.warning(f"Skipping entry due to missing repo_path or function_name: {item}")
-                    continue
+        StagedPipeline().run(staged_targets(), finish_staged)
+    elif max_workers == 1:
+        for index, repo_name, item in targets():
+            finish(repo_name, index, process_item(repo_name, item))
+    else:
+        server = None
+        if executor == "thread":
+            pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="peace")
+            task = process_item
+        else:
+            server = DependencyServer().start()  # Loads the model once, in this process
+            pool = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker_process, initargs=(server.url, default_tracer().enabled)
+            )
+            task = _process_item_in_worker
 
-                # Construct input data for pipeline
-                data_for_pipeline = {
-                    "repo_path": f"/path/to/repos/{repo_path}",  # Modify path accordingly
-                    "function_name": function_name,
-                    "class_name": class_name if class_name else None,
-                    "message": message
-                }
+        try:
+            with pool:
+                in_flight = {}
+                running = {}  # Repository -> targets in flight
+                waiting = {}  # Repository -> targets read ahead while it was busy
+                records = targets()
+                state = {"waiting": 0, "exhausted": False}
 
-                # Process modifications
-                results = process_pipeline(data_for_pipeline)
-                repo_results[item.get("sha", "unknown_sha")] = results
+                def submit(repo_name, index, item):
+                    in_flight[pool.submit(task, repo_name, item)] = (repo_name, index)
+                    running[repo_name] = running.get(repo_name, 0) + 1
 
-            except Exception as e:
-                logging.error(f"Error processing {item.get('sha', 'unknown_sha')}: {e}")
+                def fill():
+                    for repo_name, queue in waiting.items():
+                        while queue and running.get(repo_name, 0) < per_repo_concurrency and len(in_flight) < max_workers:
+                            submit(repo_name, *queue.popleft())
+                            state["waiting"] -= 1
+                    while not state["exhausted"] and len(in_flight) < max_workers and state["waiting"] < LOOKAHEAD:
+                        try:
+                            index, repo_name, item = next(records)
+                        except StopIteration:
+                            state["exhausted"] = True
+                            break
+                        if running.get(repo_name, 0) < per_repo_concurrency:
+                            submit(repo_name, index, item)
+                        else:
+                            waiting.setdefault(repo_name, deque()).append((index, item))
+                            state["waiting"] += 1
 
-        output_data[repo_name] = repo_results
+                fill()
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        repo_name, index = in_flight.pop(future)
+                        running[repo_name] -= 1
+                        outcome = future.result()
+                        if executor == "process":
+                            outcome, worker_records, worker_events = outcome
+                            default_recorder().merge(worker_records)
+                            default_tracer().merge(worker_events)
+                        finish(repo_name, index, outcome)
+                    fill()
+        finally:
+            if server is not None:
+                server.stop()
+
+    if skipped:
+        logging.info(f"Skipped {skipped} targets that already have results")
+
+    # Assemble in input order so the output does not depend on completion order
+    output_data = {repo_name: {} for repo_name in repo_names}
+    for (repo_name, index), (sha, results) in sorted(outcomes.items(), key=lambda entry: entry[0][1]):
+        output_data[repo_name][sha] = results
 
     return output_data
 
+def run_pipeline(input_file, output_file, results_log=None, run_name=None):
+    """
+    Runs the pipeline over a dataset file and writes the nested results.
+
+    Each target's result is appended to `results_log` as it completes, so rerunning
+    skips the targets it already holds; the log is compacted into `output_file` at
+    the end unless batch mode paused the run.
+
+    Parameters
+    ----------
+    input_file : str
+        The dataset, streamed (see `dataset_stream.iter_records`).
+    output_file : str
+        The nested {repo: {sha: results}} JSON to write.
+    results_log : str or None, optional
+        The JSONL result log, default is `output_file` with a `.jsonl` extension.
+    run_name : str or None, optional
+        Name of the run in the results store (`PEACE_RESULTS_DB`), default is the
+        output file name without extension.
+
+    Returns
+    -------
+    bool
+        True if the output was written, False if the input is missing or the run paused.
+    """
+    results_log = results_log or os.path.splitext(output_file)[0] + ".jsonl"
+    if not os.path.exists(input_file):
+        logging.error(f"Input file not found: {input_file}")
+        return False
+
+    # The dataset is streamed: the first target starts as soon as it is read
+    result_log = ResultLog(results_log)
+    process_repositories(iter_records(input_file), skip=result_log.completed_keys(), on_result=result_log.append)
+    batch = default_batch_session()
+    if batch is not None:
+        batch.close()
+        batch.log_summary()
+    completed = batch is None or not batch.paused
+    if completed:
+        compact(results_log, output_file, iter_records(input_file))
+        if RESULTS_DB:
+            # The run replaces an earlier one of the same name, so rerunning does not duplicate it
+            run_name = run_name or os.path.splitext(os.path.basename(output_file))[0]
+            with ResultsStore(RESULTS_DB) as store:
+                import_model_results(store, output_file, run_name)
+                import_llm_trace(store, default_recorder().records, run_name)
+    log_all_metrics()
+    if TELEMETRY_PATH:
+        default_recorder().write_summary(os.path.splitext(TELEMETRY_PATH)[0] + "_summary.json")
+    if export_trace():
+        default_tracer().log_summary()
+    return completed
+
 # ========== Main Execution ==========
 if __name__ == "__main__":
-    INPUT_FILE = "/path/to/input/repoexec_python.json"  # Modify path accordingly
-    OUTPUT_FILE = "model_results.json"
+    INPUT_FILE = os.environ.get("PEACE_INPUT_FILE", "/path/to/input/repoexec_python.json")  # Modify path accordingly
+    OUTPUT_FILE = os.environ.get("PEACE_OUTPUT_FILE", "model_results.json")
+    RESULTS_LOG = os.environ.get("PEACE_RESULTS_LOG")
 
-    data = load_json(INPUT_FILE)
-    if data:
-        results = process_repositories(data)
-        save_json(results, OUTPUT_FILE)
+    run_pipeline(INPUT_FILE, OUTPUT_FILE, RESULTS_LOG, os.environ.get("PEACE_RUN_NAME"))
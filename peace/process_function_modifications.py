@@ -2,9 +2,19 @@ import json
 import os
 import re
 import logging
-from FunctionOptimizer import add_data, get_prompt, send_to_gpt
+import threading
+import contextvars
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from FunctionOptimizer import add_data, get_prompt, send_to_gpt, generate_candidates, NUM_CANDIDATES, CANDIDATE_TEMPERATURES
+from candidates import unique_candidates, optimization_key
 from RAGEditPool import RAGEditPool
 from get_modifications import FunctionModificationAnalyzer
+from llm_batch import LLMBatchPending
+from llm_telemetry import telemetry_tags, metered, current_tags
+from budget import Budget
+from tracing import traced
 
 # ========== Logger Configuration ==========
 logging.basicConfig(
@@ -12,6 +22,16 @@ logging.basicConfig(
     level=logging.INFO
 )
 
+# ========== Deduplication Configuration ==========
+DEDUPLICATE_OPTIMIZATIONS = os.environ.get("PEACE_DEDUP_OPTIMIZATION", "1") != "0"
+
+_optimizations = {}  # Optimization key -> Future of the optimized fields, shared by all targets of the run
+_optimizations_lock = threading.Lock()
+
+# ========== Scheduling Configuration ==========
+DAG_SCHEDULING = os.environ.get("PEACE_DAG_SCHEDULING", "0") == "1"  # Optimize independent functions of a target concurrently
+FUNCTION_WORKERS = int(os.environ.get("PEACE_FUNCTION_WORKERS", "4"))  # Functions of one target optimized at a time
+
 def filter_response(code):
     """
     Cleans the response code by removing unnecessary markdown formatting.
@@ -26,60 +46,427 @@ def filter_response(code):
     str
         Cleaned code string.
     """
+    # Streamed responses end at the closing fence but may start with a sentence
+    fenced = re.search(r'```(?:python)?\n(.*?)(?:\n```|$)', code, re.DOTALL)
+    if fenced:
+        return fenced.group(1).strip()
     code = re.sub(r'^```python\n', '', code)  # Remove leading ```python
     code = re.sub(r'```$', '', code)  # Remove trailing ```
     return code.strip()
 
-def process_function_modifications(modifications):
+def optimize(input_data):
+    """
+    Generates the optimized version (or best-of-n candidates) of a function.
+
+    Parameters
+    ----------
+    input_data : dict
+        Function details, edits and message, as returned by `add_data`.
+
+    Returns
+    -------
+    dict
+        "after" and, in best-of-n mode, "candidates".
+    """
+    prompt = get_prompt(input_data)
+    with telemetry_tags(function=input_data.get("function_name", "")):
+        if NUM_CANDIDATES > 1 or len(CANDIDATE_TEMPERATURES) > 1:
+            # Best-of-n: keep every distinct candidate for the evaluation to choose from
+            candidates = unique_candidates([filter_response(c) for c in generate_candidates(prompt)])
+            return {"after": candidates[0] if candidates else "", "candidates": candidates}
+        return {"after": filter_response(send_to_gpt(prompt))}
+
+def optimize_once(input_data):
+    """
+    Optimizes a function once per distinct request and shares the result.
+
+    The same function body with the same associated edits, message and APIs often
+    occurs at several SHAs or in several repositories. Such requests get the same
+    key (`candidates.optimization_key`, which ignores formatting, comments and
+    docstrings of the function) and only the first one is sent; concurrent
+    duplicates wait for it. Failed requests are not kept, so a later occurrence retries.
+
+    Parameters
+    ----------
+    input_data : dict
+        Function details, edits and message, as returned by `add_data`.
+
+    Returns
+    -------
+    tuple
+        (optimized, reused) where `optimized` is a copy of the fields from `optimize`
+        and `reused` tells whether it came from an earlier request.
+    """
+    if not DEDUPLICATE_OPTIMIZATIONS:
+        return optimize(input_data), False
+
+    key = optimization_key(
+        input_data.get("function_body", ""), input_data.get("associated_edit", ""),
+        input_data.get("message", ""), input_data.get("api", "")
+    )
+    with _optimizations_lock:
+        future = _optimizations.get(key)
+        owner = future is None
+        if owner:
+            future = _optimizations[key] = Future()
+
+    if owner:
+        try:
+            optimized = optimize(input_data)
+        except BaseException as e:
+            with _optimizations_lock:
+                _optimizations.pop(key, None)
+            future.set_exception(e)
+        else:
+            if not optimized["after"]:
+                with _optimizations_lock:
+                    _optimizations.pop(key, None)  # Empty response: let later occurrences try again
+            future.set_result(optimized)
+    else:
+        logging.info(f"Reusing the optimization of an identical request for {input_data.get('function_name', '')} ({key[:12]})")
+
+    optimized = future.result()
+    return {name: list(value) if isinstance(value, list) else value for name, value in optimized.items()}, not owner
+
+@traced("optimize_function", "pipeline")
+def optimize_modification(data, input_data, rag_pool):
+    """
+    Phase III of one function: generates its optimized version and stores the edit
+    for the functions processed after it.
+
+    Parameters
+    ----------
+    data : dict
+        The function modification entry.
+    input_data : dict
+        Function details and associated edits, as returned by `add_data` (Phase II).
+    rag_pool : RAGEditPool
+        Edit pool of the target.
+
+    Returns
+    -------
+    dict
+        The processed function modification.
+    """
+    result = {}
+    result["repo_path"] = data.get("repo_path", "")
+    result["file_path"] = data.get("file_path", "")
+    result["function_name"] = data.get("function_name", "")
+    result["class_name"] = data.get("class_name", "")
+    result["message"] = data.get("message", "")
+
+    result["before"] = input_data.get("function_body", "")
+
+    # Generate optimized function, once per distinct request
+    optimized, reused = optimize_once(input_data)
+    result.update(optimized)
+    if reused:
+        result["deduplicated"] = True
+
+    # Store edit in RAG pool
+    rag_pool.add_edit(result["before"], result["after"])
+    return result
+
+def build_dependency_graph(modifications):
+    """
+    Derives which functions of a target depend on which, from the Phase I call relationships.
+
+    A function depends on the functions of the list it calls, so callees are
+    optimized before their callers and their edits are retrieved for them. Only
+    functions earlier in the list count, which keeps the graph acyclic (recursion
+    and mutual calls are cut) and never gives a function an edit it would not have
+    had in list order. A function whose calls are unknown depends on all earlier ones.
+
+    Parameters
+    ----------
+    modifications : list
+        Function modification entries from `analyze_modifications`.
+
+    Returns
+    -------
+    list
+        For each entry, the set of indices of the entries it depends on.
+    """
+    dependencies = []
+    for index, data in enumerate(modifications):
+        calls = data.get("calls")
+        if calls is None:
+            dependencies.append(set(range(index)))
+            continue
+        calls = set(calls)
+        dependencies.append({
+            earlier for earlier in range(index)
+            if modifications[earlier].get("function_name") in calls
+        })
+    return dependencies
+
+class FunctionSchedule:
+    """
+    Tracks which functions of a target can be optimized and the edits they build on.
+
+    With `dag`, a function becomes ready once the functions it depends on
+    (`build_dependency_graph`) are done, and its associated edits are retrieved from
+    the edits of those functions and their own dependencies. Without it, functions
+    run one after the other on a single edit pool, as in `process_function_modifications`.
+
+    Attributes
+    ----------
+    modifications : list
+        The function modification entries.
+    dependencies : list
+        For each entry, the indices of the entries it waits for.
+    """
+
+    def __init__(self, modifications, dag=True):
+        """
+        Initialize the schedule.
+
+        Parameters
+        ----------
+        modifications : list
+            Function modification entries from `analyze_modifications`.
+        dag : bool, optional
+            Schedule by dependency graph (default) rather than in list order.
+        """
+        self.modifications = modifications
+        self.dag = dag
+        if dag:
+            self.dependencies = build_dependency_graph(modifications)
+        else:
+            self.dependencies = [{index - 1} if index else set() for index in range(len(modifications))]
+        self._dependents = [[] for _ in modifications]
+        for index, dependencies in enumerate(self.dependencies):
+            for dependency in dependencies:
+                self._dependents[dependency].append(index)
+        self._waiting = [len(dependencies) for dependencies in self.dependencies]
+        self._edits = {}
+        self._shared_pool = None if dag else RAGEditPool(max_lines=10)
+        self._lock = threading.Lock()
+
+    def ready(self):
+        """Return the indices of the functions that depend on nothing."""
+        return [index for index, waiting in enumerate(self._waiting) if not waiting]
+
+    def ancestors(self, index):
+        """Return the indices of all functions an entry depends on, directly or not, in list order."""
+        seen = set()
+        stack = list(self.dependencies[index])
+        while stack:
+            dependency = stack.pop()
+            if dependency not in seen:
+                seen.add(dependency)
+                stack.extend(self.dependencies[dependency])
+        return sorted(seen)
+
+    def edit_pool(self, index):
+        """
+        Return the edit pool to retrieve the associated edits of an entry from.
+
+        Parameters
+        ----------
+        index : int
+            The entry, whose dependencies must be done.
+
+        Returns
+        -------
+        RAGEditPool
+        """
+        if self._shared_pool is not None:
+            return self._shared_pool
+        rag_pool = RAGEditPool(max_lines=10)
+        with self._lock:
+            edits = [self._edits[ancestor] for ancestor in self.ancestors(index) if ancestor in self._edits]
+        for before, after in edits:
+            rag_pool.add_edit(before, after)
+        return rag_pool
+
+    def complete(self, index, result=None):
+        """
+        Mark an entry as done and release the entries waiting for it.
+
+        Parameters
+        ----------
+        index : int
+            The entry.
+        result : dict or None, optional
+            Its processed modification, None if it failed; its edit is kept for the
+            entries depending on it (in the shared pool, `optimize_modification` has already added it).
+
+        Returns
+        -------
+        list
+            Indices of the entries that became ready.
+        """
+        with self._lock:
+            if result is not None and self._shared_pool is None:
+                self._edits[index] = (result["before"], result["after"])
+            released = []
+            for dependent in self._dependents[index]:
+                self._waiting[dependent] -= 1
+                if not self._waiting[dependent]:
+                    released.append(dependent)
+            return released
+
+def optimize_scheduled(schedule, index):
+    """
+    Phases II and III of one function of a schedule.
+
+    Parameters
+    ----------
+    schedule : FunctionSchedule
+        The target's schedule.
+    index : int
+        The ready entry to process.
+
+    Returns
+    -------
+    dict
+        The processed function modification.
+    """
+    data = schedule.modifications[index]
+    rag_pool = schedule.edit_pool(index)
+    input_data = add_data(data, rag_pool)
+    return optimize_modification(data, input_data, rag_pool)
+
+def schedule_function_modifications(modifications, max_workers=None, budget=None):
+    """
+    Processes function modifications concurrently along their dependency graph.
+
+    Functions on independent branches of the call graph are optimized at the same
+    time; a function waits only for the functions it depends on, whose edits are
+    the ones its associated edits are retrieved from.
+
+    Parameters
+    ----------
+    modifications : list
+        List of function modification dictionaries.
+    max_workers : int or None, optional
+        Functions optimized at a time, default is `PEACE_FUNCTION_WORKERS` or 4.
+    budget : Budget or None, optional
+        Limits checked before each function starts; functions started once the
+        budget is exhausted are skipped (`Budget.skip`). Ready functions start from
+        the most promising (`Budget.order`).
+
+    Returns
+    -------
+    list
+        List of processed function modifications, in the order of `modifications`.
+    """
+    schedule = FunctionSchedule(modifications)
+    results = {}
+    max_workers = max(1, FUNCTION_WORKERS if max_workers is None else max_workers)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="peace-function") as pool:
+        in_flight = {}
+
+        def submit(index):
+            # Run in a copy of this context so the LLM calls keep the target's telemetry tags
+            future = pool.submit(contextvars.copy_context().run, optimize_scheduled, schedule, index)
+            in_flight[future] = index
+
+        ready = deque(schedule.ready())
+        while ready or in_flight:
+            while ready:
+                if budget is not None:
+                    ready = deque(budget.order(ready))  # Functions released by a skip are ranked too
+                index = ready.popleft()
+                reason = budget.try_start_function(index) if budget is not None else None
+                if reason is None:
+                    submit(index)
+                else:
+                    results[index] = budget.skip(modifications[index], reason)
+                    ready.extend(schedule.complete(index))
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = in_flight.pop(future)
+                try:
+                    results[index] = future.result()
+                except LLMBatchPending:
+                    for other in in_flight:
+                        other.cancel()
+                    raise  # Later functions build on this one's edit, so stop here until the batch returns
+                except Exception as e:
+                    logging.error(f"Error processing function {modifications[index].get('function_name', '')}: {e}")
+                ready.extend(schedule.complete(index, results.get(index)))
+
+    return [results[index] for index in sorted(results)]
+
+def process_function_modifications(modifications, budget=None):
     """
     Processes function modifications by retrieving function details, 
     generating optimized versions, and tracking edits.
 
+    With `PEACE_DAG_SCHEDULING=1`, the functions are scheduled along their
+    dependency graph instead (`schedule_function_modifications`).
+
+    In budget mode, the functions are ranked (`budget.rank_modifications`):
+    `PEACE_BUDGET_MAX_FUNCTIONS` keeps the most promising, and the other limits
+    are kept for them before less promising functions may start (`Budget`). A
+    function still waits for the callees whose edits it retrieves. Functions not
+    processed are recorded in the results with the `skipped` reason instead of
+    being optimized.
+
     Parameters
     ----------
     modifications : list
         List of function modification dictionaries.
+    budget : Budget or bool or None, optional
+        Limits for this target; None uses the `PEACE_BUDGET_*` environment variables
+        (budget mode is off when none is set), False disables it.
 
     Returns
     -------
     list
         List of processed function modifications.
     """
+    if budget is None:
+        budget = Budget.from_env()
+    if not budget or not budget.enabled:
+        budget = None
+    else:
+        budget.plan(modifications).start()
+
+    with metered(budget.meter) if budget is not None else nullcontext():
+        if DAG_SCHEDULING and len(modifications) > 1:
+            results = schedule_function_modifications(modifications, budget=budget)
+        else:
+            results = _process_in_order(modifications, budget)
+
+    if budget is not None:
+        budget.log_summary(current_tags().get("sha", ""))
+    return results
+
+def _process_in_order(modifications, budget):
+    """Processes function modifications one after the other on a shared edit pool."""
     results = []
     rag_pool = RAGEditPool(max_lines=10)
 
-    for data in modifications:
+    for index, data in enumerate(modifications):
+        if budget is not None:
+            reason = budget.try_start_function(index)
+            if reason is not None:
+                results.append(budget.skip(data, reason))
+                continue
         try:
-            result = {}
-            
             # Construct data input
             input_data = add_data(data, rag_pool)
 
-            result["repo_path"] = data.get("repo_path", "")
-            result["file_path"] = data.get("file_path", "")
-            result["function_name"] = data.get("function_name", "")
-            result["class_name"] = data.get("class_name", "")
-            result["message"] = data.get("message", "")
-
-            result["before"] = input_data.get("function_body", "")
-            
-            # Generate optimized function
-            optimized_code = send_to_gpt(get_prompt(input_data))
-            result["after"] = filter_response(optimized_code)
-
-            # Store edit in RAG pool
-            rag_pool.add_edit(result["before"], result["after"])
-
-            results.append(result)
+            results.append(optimize_modification(data, input_data, rag_pool))
 
+        except LLMBatchPending:
+            raise  # Later functions build on this one's edit, so stop here until the batch returns
         except Exception as e:
             logging.error(f"Error processing function {data.get('function_name', '')}: {e}")
 
     return results
 
-def pipeline_function_modifications(data):
+@traced("analyze_modifications", "pipeline")
+def analyze_modifications(data):
     """
-    Runs the pipeline to analyze function dependencies and apply modifications.
+    Phase I: finds the functions to modify along with the target function.
 
     Parameters
     ----------
@@ -89,29 +476,47 @@ def pipeline_function_modifications(data):
     Returns
     -------
     list
-        List of processed function modifications.
+        Function modification entries, in processing order.
     """
-    try:
-        repo_path = data.get("repo_path", "")
-        target_function = data.get("function_name", "")
-        target_class = data.get("class_name", "")
-        message = data.get("message", "")
+    repo_path = data.get("repo_path", "")
+    target_function = data.get("function_name", "")
+    target_class = data.get("class_name", "")
+    message = data.get("message", "")
+
+    if not repo_path or not target_function:
+        logging.error("Missing required parameters: repo_path or function_name")
+        return []
 
-        if not repo_path or not target_function:
-            logging.error("Missing required parameters: repo_path or function_name")
-            return []
+    # Analyze function dependencies
+    analyzer = FunctionModificationAnalyzer(repo_path, target_function, target_class)
+    modifications = analyzer.get_modifications()
 
-        # Analyze function dependencies
-        analyzer = FunctionModificationAnalyzer(repo_path, target_function, target_class)
-        modifications = analyzer.get_modifications()
+    # Update each modification entry with additional metadata
+    for mod in modifications:
+        mod["repo_path"] = repo_path
+        mod["message"] = message
 
-        # Update each modification entry with additional metadata
-        for mod in modifications:
-            mod["repo_path"] = repo_path
-            mod["message"] = message
+    return modifications
 
-        return process_function_modifications(modifications)
+def pipeline_function_modifications(data):
+    """
+    Runs the pipeline to analyze function dependencies and apply modifications.
+
+    Parameters
+    ----------
+    data : dict
+        Dictionary containing repository path, function name, class name, and message.
+
+    Returns
+    -------
+    list
+        List of processed function modifications.
+    """
+    try:
+        return process_function_modifications(analyze_modifications(data))
 
+    except LLMBatchPending:
+        raise
     except Exception as e:
         logging.error(f"Pipeline execution error: {e}")
         return []
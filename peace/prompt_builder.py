@@ -0,0 +1,332 @@
+import os
+import logging
+import threading
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+# ========== Budget Configuration ==========
+DEFAULT_PROMPT_TOKENS = int(os.environ.get("LLM_PROMPT_TOKENS", "2000"))  # ~8000 characters of code
+DEFAULT_ENCODING = os.environ.get("LLM_TOKENIZER_ENCODING", "cl100k_base")
+CHARS_PER_TOKEN = 4  # Fallback estimate when no tokenizer is available
+
+
+class TokenCounter:
+    """
+    Counts tokens with a tiktoken encoding, falling back to a character estimate
+    when the encoding cannot be loaded (e.g. offline without a tokenizer cache).
+
+    Attributes
+    ----------
+    encoding_name : str
+        Name of the tiktoken encoding.
+    exact : bool
+        Whether counts come from the tokenizer rather than the estimate.
+    """
+
+    def __init__(self, encoding_name=DEFAULT_ENCODING):
+        """
+        Initialize the counter.
+
+        Parameters
+        ----------
+        encoding_name : str, optional
+            Name of the tiktoken encoding, default is `LLM_TOKENIZER_ENCODING` or "cl100k_base".
+        """
+        self.encoding_name = encoding_name
+        self._encoding = None
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            logging.warning(f"Tokenizer '{encoding_name}' unavailable, estimating tokens from characters: {e}")
+
+    @property
+    def exact(self):
+        return self._encoding is not None
+
+    def count(self, text):
+        """
+        Count the tokens of a text.
+
+        Parameters
+        ----------
+        text : str
+            The text.
+
+        Returns
+        -------
+        int
+            Number of tokens.
+        """
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return -(-len(text) // CHARS_PER_TOKEN)
+
+    def truncate(self, text, max_tokens, keep="head"):
+        """
+        Cut a text to at most `max_tokens` tokens, at a token boundary (a character
+        boundary when estimating).
+
+        Parameters
+        ----------
+        text : str
+            The text.
+        max_tokens : int
+            Number of tokens to keep.
+        keep : str, optional
+            "head" keeps the start of the text (default), "tail" its end.
+
+        Returns
+        -------
+        str
+            The kept part.
+        """
+        if max_tokens <= 0:
+            return ""
+        if self._encoding is None:
+            size = max_tokens * CHARS_PER_TOKEN
+            return text[:size] if keep == "head" else text[-size:]
+        tokens = self._encoding.encode(text, disallowed_special=())
+        kept = tokens[:max_tokens] if keep == "head" else tokens[-max_tokens:]
+        cut = self._encoding.decode(kept)
+        # A token split inside a character decodes to a replacement character; drop it
+        while cut and self.count(cut) > max_tokens:
+            cut = cut[:-1] if keep == "head" else cut[1:]
+        return cut
+
+
+_default_counter = None
+_default_counter_lock = threading.Lock()
+
+
+def default_counter():
+    """
+    Return the process-wide token counter, loading the tokenizer on first use.
+
+    Returns
+    -------
+    TokenCounter
+    """
+    global _default_counter
+    with _default_counter_lock:
+        if _default_counter is None:
+            _default_counter = TokenCounter()
+        return _default_counter
+
+
+def trim_to_tokens(text, max_tokens, counter=None, keep="head"):
+    """
+    Trim a text to a token budget at line boundaries.
+
+    Parameters
+    ----------
+    text : str
+        The text to trim.
+    max_tokens : int
+        The token budget, including the trim marker.
+    counter : TokenCounter or None, optional
+        Token counter, default is the process-wide counter.
+    keep : str, optional
+        "head" keeps the first lines (default), "tail" keeps the last lines.
+
+    Returns
+    -------
+    str
+        The text itself if it fits, otherwise as many whole lines as fit plus a marker
+        saying how many lines were dropped. When not even the first line fits, that
+        line is cut at a token boundary instead, so some of the text is always kept.
+    """
+    counter = counter or default_counter()
+    if max_tokens <= 0 or not text:
+        return ""
+    if counter.count(text) <= max_tokens:
+        return text
+
+    lines = text.splitlines()
+    ordered = lines if keep == "head" else lines[::-1]
+    marker_budget = counter.count(f"# ... {len(lines)} lines trimmed ...\n")
+
+    kept = []
+    used = marker_budget
+    for line in ordered:
+        # Summing per-line counts slightly overestimates the joined count, so this never exceeds the budget
+        cost = counter.count(line + "\n")
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+
+    if not kept:
+        marker = f"# ... line cut, {len(lines) - 1} more lines trimmed ..." if len(lines) > 1 else "# ... line cut ..."
+        room = max_tokens - counter.count(marker + "\n")
+        if room <= 0:
+            return counter.truncate(ordered[0], max_tokens, keep)  # Not even the marker fits
+        kept = [counter.truncate(ordered[0], room, keep)]
+        return "\n".join(kept + [marker]) if keep == "head" else "\n".join([marker] + kept)
+
+    marker = f"# ... {len(lines) - len(kept)} lines trimmed ..."
+    if keep == "head":
+        return "\n".join(kept + [marker])
+    return "\n".join([marker] + kept[::-1])
+
+
+class PromptSection:
+    """
+    A named part of a prompt template with its trimming policy.
+
+    Attributes
+    ----------
+    name : str
+        Placeholder name in the template.
+    text : str
+        The section content.
+    priority : int
+        Lower values are allocated budget first.
+    min_tokens : int
+        Budget reserved for this section before higher-priority sections are filled.
+    max_tokens : int or None
+        Upper bound of the section, None for no bound.
+    keep : str
+        "head" or "tail": which end of the section survives trimming.
+    """
+
+    def __init__(self, name, text, priority=0, min_tokens=0, max_tokens=None, keep="head"):
+        self.name = name
+        self.text = text or ""
+        self.priority = priority
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.keep = keep
+
+
+class PromptBuilder:
+    """
+    Fills a `str.format` template with sections so that the prompt fits a token
+    budget. Sections are allocated budget in priority order after every section has
+    its `min_tokens` reserved, and over-budget sections are trimmed at line boundaries.
+
+    Attributes
+    ----------
+    template : str
+        The prompt template with one `{name}` placeholder per section.
+    max_tokens : int
+        Token budget of the whole prompt.
+    counter : TokenCounter
+        Token counter.
+    """
+
+    def __init__(self, template, max_tokens=DEFAULT_PROMPT_TOKENS, counter=None):
+        """
+        Initialize the builder.
+
+        Parameters
+        ----------
+        template : str
+            The prompt template with one `{name}` placeholder per section.
+        max_tokens : int, optional
+            Token budget of the whole prompt, default is `LLM_PROMPT_TOKENS` or 2000.
+        counter : TokenCounter or None, optional
+            Token counter, default is the process-wide counter.
+        """
+        self.template = template
+        self.max_tokens = max_tokens
+        self._counter = counter
+
+    @property
+    def counter(self):
+        # Resolved on first use so that importing a module with a builder stays cheap
+        if self._counter is None:
+            self._counter = default_counter()
+        return self._counter
+
+    def build(self, sections):
+        """
+        Build the prompt.
+
+        Parameters
+        ----------
+        sections : list
+            `PromptSection` objects, one per placeholder of the template.
+
+        Returns
+        -------
+        tuple
+            (prompt, usage) where `usage` reports the budget, the template overhead and,
+            per section, the original and allocated token counts.
+        """
+        overhead = self.counter.count(self.template.format(**{section.name: "" for section in sections}))
+        remaining = max(0, self.max_tokens - overhead)
+
+        original = {section.name: self.counter.count(section.text) for section in sections}
+        wanted = {
+            section.name: original[section.name] if section.max_tokens is None
+            else min(original[section.name], section.max_tokens)
+            for section in sections
+        }
+        reserved = {section.name: min(section.min_tokens, wanted[section.name]) for section in sections}
+
+        ordered = sorted(sections, key=lambda section: section.priority)
+        allocated = {}
+        for position, section in enumerate(ordered):
+            # Leave the reservations of the sections still to come untouched
+            still_reserved = sum(reserved[later.name] for later in ordered[position + 1:])
+            allocated[section.name] = max(0, min(wanted[section.name], remaining - still_reserved))
+            remaining -= allocated[section.name]
+
+        texts = {}
+        usage = {"budget": self.max_tokens, "template": overhead, "sections": {}}
+        for section in sections:
+            text = section.text
+            if original[section.name] > allocated[section.name]:
+                text = trim_to_tokens(text, allocated[section.name], self.counter, section.keep)
+            texts[section.name] = text
+            usage["sections"][section.name] = {
+                "tokens": self.counter.count(text),
+                "original": original[section.name],
+                "trimmed": text != section.text
+            }
+
+        prompt = self.template.format(**texts)
+        usage["total"] = self.counter.count(prompt)
+        usage["exact"] = self.counter.exact
+        return prompt, usage
+
+
+def format_usage(usage):
+    """
+    Format a prompt usage report as a single log line.
+
+    Parameters
+    ----------
+    usage : dict
+        The usage report from `PromptBuilder.build`.
+
+    Returns
+    -------
+    str
+    """
+    parts = []
+    for name, section in usage["sections"].items():
+        part = f"{name}={section['tokens']}"
+        if section["trimmed"]:
+            part += f" (trimmed from {section['original']})"
+        parts.append(part)
+    approx = "" if usage.get("exact", True) else "~"
+    return f"Prompt tokens: {approx}{usage['total']}/{usage['budget']} [template={usage['template']}, {', '.join(parts)}]"
+
+
+# ========== Example Usage ==========
+if __name__ == "__main__":
+    builder = PromptBuilder("Optimize:\n{code}\n\nRelated edits:\n{edits}\n", max_tokens=120)
+    prompt, usage = builder.build([
+        PromptSection("code", "\n".join(f"    x{i} = compute({i})" for i in range(40)), priority=0, min_tokens=20),
+        PromptSection("edits", "\n".join(f"- edit {i}" for i in range(40)), priority=1, min_tokens=30)
+    ])
+    print(prompt)
+    print(format_usage(usage))
@@ -0,0 +1,148 @@
+import os
+import json
+import logging
+import argparse
+import threading
+from dataset_stream import iter_records, records_of
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+
+class ResultLog:
+    """
+    Append-only JSONL log of pipeline results, one record per (repo, sha) target,
+    written as soon as the target completes so that an interrupted run can resume.
+
+    Each line is {"repo": str, "sha": str, "results": list}. A later record for the
+    same key replaces an earlier one.
+
+    Attributes
+    ----------
+    path : str
+        The JSONL file.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the log.
+
+        Parameters
+        ----------
+        path : str
+            The JSONL file; it is created on the first append.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def records(self):
+        """
+        Read the records of the log.
+
+        A truncated last line (e.g. from a crash during a write) is ignored.
+
+        Returns
+        -------
+        list
+            The records in file order.
+        """
+        if not os.path.exists(self.path):
+            return []
+
+        records = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logging.warning(f"Ignoring unreadable line {number} of {self.path}")
+        return records
+
+    def completed_keys(self):
+        """
+        Return the (repo, sha) keys that already have a result.
+
+        Returns
+        -------
+        set
+        """
+        return {(record["repo"], record["sha"]) for record in self.records()}
+
+    def append(self, repo_name, sha, results):
+        """
+        Append the result of a target and flush it to disk.
+
+        Parameters
+        ----------
+        repo_name : str
+            Key of the repository in the input data.
+        sha : str
+            SHA of the target.
+        results : list
+            The processed function modifications.
+        """
+        line = json.dumps({"repo": repo_name, "sha": sha, "results": results}, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def compact(log_path, output_path, data=None):
+    """
+    Convert a result log into the nested {repo: {sha: results}} JSON format read by
+    downstream tools such as `evaluate.py`.
+
+    Parameters
+    ----------
+    log_path : str
+        The JSONL result log.
+    output_path : str
+        The JSON file to write.
+    data : dict or iterable or None, optional
+        The input data or its (repo, item) records (`dataset_stream.iter_records`);
+        when given, repositories and SHAs follow its order, as in the output of
+        `process_repositories`.
+
+    Returns
+    -------
+    dict
+        The nested results.
+    """
+    latest = {}
+    for record in ResultLog(log_path).records():
+        latest[(record["repo"], record["sha"])] = record["results"]
+
+    output_data = {repo_name: {} for repo_name in data} if isinstance(data, dict) else {}  # Every repository appears
+    if data is not None:
+        for repo_name, item in records_of(data):
+            if repo_name is None:
+                repo_name = item.get("reponame", "")
+            repo_results = output_data.setdefault(repo_name, {})
+            key = (repo_name, item.get("sha", "unknown_sha"))
+            if key in latest:
+                repo_results[key[1]] = latest[key]
+    for (repo_name, sha), results in latest.items():
+        output_data.setdefault(repo_name, {}).setdefault(sha, results)
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(output_data, f, ensure_ascii=False, indent=4)
+    logging.info(f"Compacted {len(latest)} results from {log_path} into {output_path}")
+    return output_data
+
+
+# ========== Main Execution ==========
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact a JSONL result log into the nested JSON results format.")
+    parser.add_argument("log", help="JSONL result log written by model.py.")
+    parser.add_argument("output", help="JSON file to write.")
+    parser.add_argument("--input", default=None, help="Input data file, to order the output like it.")
+    args = parser.parse_args()
+
+    compact(args.log, args.output, iter_records(args.input) if args.input else None)
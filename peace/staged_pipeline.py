@@ -0,0 +1,416 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import nullcontext
+from FunctionOptimizer import add_data
+from process_function_modifications import analyze_modifications, optimize_modification, FunctionSchedule, DAG_SCHEDULING
+from llm_batch import LLMBatchPending
+from llm_telemetry import telemetry_tags, metered
+from budget import Budget
+from tracing import span
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+# ========== Stage Configuration ==========
+ANALYZE_WORKERS = int(os.environ.get("PEACE_ANALYZE_WORKERS", "2"))  # Phase I: AST and dependency analysis (CPU)
+RETRIEVE_WORKERS = int(os.environ.get("PEACE_RETRIEVE_WORKERS", "2"))  # Phase II: associated edit retrieval (model)
+OPTIMIZE_WORKERS = int(os.environ.get("PEACE_OPTIMIZE_WORKERS", "8"))  # Phase III: LLM optimization (network)
+STAGE_QUEUE_SIZE = int(os.environ.get("PEACE_STAGE_QUEUE_SIZE", "4"))  # Items waiting in front of a stage
+
+
+class Stage:
+    """
+    A pipeline stage: a worker pool that takes items from a bounded input queue.
+
+    Items from the previous stage are admitted with `put`, which blocks while
+    `queue_size` items are waiting, so a slow stage holds back the stages before it.
+    Items sent back by a later stage (`put_feedback`) are never blocked and are taken
+    first, so that work already in the pipeline finishes before new work is admitted;
+    as only feedback flows backwards, the stages cannot deadlock.
+
+    Attributes
+    ----------
+    name : str
+        Name used in the report.
+    workers : int
+        Number of worker threads.
+    queue_size : int
+        Bound of the admission queue.
+    """
+
+    def __init__(self, name, handler, workers=1, queue_size=STAGE_QUEUE_SIZE, on_error=None):
+        """
+        Initialize the stage (call `start` to run it).
+
+        Parameters
+        ----------
+        name : str
+            Name used in the report.
+        handler : callable
+            Called as `handler(item)` by a worker; it forwards the item itself.
+        workers : int, optional
+            Number of worker threads, default is 1.
+        queue_size : int, optional
+            Bound of the admission queue, default is `PEACE_STAGE_QUEUE_SIZE` or 4.
+        on_error : callable or None, optional
+            Called as `on_error(item, exception)` when the handler raises.
+        """
+        self.name = name
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self._handler = handler
+        self._on_error = on_error
+        self._admitted = deque()
+        self._feedback = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._threads = []
+
+        self._processed = 0
+        self._errors = 0
+        self._busy = 0.0
+        self._queue_wait = 0.0
+        self._depth_total = 0
+        self._depth_samples = 0
+        self._depth_max = 0
+
+    def _sample_depth(self):
+        depth = len(self._admitted) + len(self._feedback)
+        self._depth_total += depth
+        self._depth_samples += 1
+        self._depth_max = max(self._depth_max, depth)
+
+    def put(self, item):
+        """Admit an item from the previous stage, waiting while the queue is full."""
+        with self._condition:
+            while len(self._admitted) >= self.queue_size:
+                self._condition.wait()
+            self._admitted.append((time.perf_counter(), item))
+            self._sample_depth()
+            self._condition.notify_all()
+
+    def put_feedback(self, item):
+        """Queue an item sent back by a later stage, without waiting."""
+        with self._condition:
+            self._feedback.append((time.perf_counter(), item))
+            self._sample_depth()
+            self._condition.notify_all()
+
+    def _get(self):
+        with self._condition:
+            while not self._admitted and not self._feedback and not self._closed:
+                self._condition.wait()
+            if self._feedback:
+                queued_at, item = self._feedback.popleft()
+            elif self._admitted:
+                queued_at, item = self._admitted.popleft()
+            else:
+                return None
+            self._queue_wait += time.perf_counter() - queued_at
+            self._sample_depth()
+            self._condition.notify_all()
+            return (item,)
+
+    def _work(self):
+        while True:
+            entry = self._get()
+            if entry is None:
+                return
+            item = entry[0]
+            start = time.perf_counter()
+            try:
+                with span(self.name, "stage"):
+                    self._handler(item)
+                failed = False
+            except Exception as e:
+                failed = True
+                logging.error(f"Stage {self.name} failed: {e}")
+                if self._on_error is not None:
+                    self._on_error(item, e)
+            with self._condition:
+                self._busy += time.perf_counter() - start
+                self._processed += 1
+                self._errors += failed
+
+    def start(self):
+        """Start the worker threads; returns the stage."""
+        self._threads = [
+            threading.Thread(target=self._work, name=f"peace-{self.name}-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def close(self):
+        """Let the workers exit once the queues are empty, and wait for them."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self, elapsed):
+        """
+        Report the stage's activity over a run.
+
+        Parameters
+        ----------
+        elapsed : float
+            Wall time of the run in seconds.
+
+        Returns
+        -------
+        dict
+            Items processed, errors, throughput (items per second), utilization (busy
+            share of the workers' time), mean/max queue depth and mean queue wait.
+        """
+        with self._condition:
+            elapsed = max(elapsed, 1e-9)
+            return {
+                "workers": self.workers,
+                "processed": self._processed,
+                "errors": self._errors,
+                "throughput": self._processed / elapsed,
+                "utilization": self._busy / (self.workers * elapsed),
+                "busy": self._busy,
+                "queue_depth_mean": self._depth_total / self._depth_samples if self._depth_samples else 0.0,
+                "queue_depth_max": self._depth_max,
+                "queue_wait_mean": self._queue_wait / self._processed if self._processed else 0.0
+            }
+
+
+class _TargetJob:
+    """A target moving through the pipeline; its functions go through Phases II and III as its schedule allows."""
+
+    def __init__(self, key, repo_name, sha, data):
+        self.key = key
+        self.repo_name = repo_name
+        self.sha = sha
+        self.data = data
+        self.schedule = None
+        self.budget = None
+        self.remaining = 0
+        self.inputs = {}  # Index -> (input_data, rag_pool) between Phases II and III
+        self.results = {}
+        self.finished = False
+        self.lock = threading.Lock()
+
+
+class StagedPipeline:
+    """
+    Runs the PEACE phases as stages with their own worker pools, so that work of
+    different targets overlaps.
+
+    - analyze (Phase I): `analyze_modifications`, one item per target.
+    - retrieve (Phase II): `add_data`, one item per function.
+    - optimize (Phase III): `optimize_modification`, one item per function.
+
+    A function's associated edits include the edits of the functions it builds on,
+    so the functions of a target follow its `FunctionSchedule`: after Phase III,
+    the functions it released go back to the retrieve stage. By default that is one
+    function after the other, in the order of `process_function_modifications`, and
+    the results are the same as with `pipeline_function_modifications`; with
+    `PEACE_DAG_SCHEDULING=1`, independent functions of a target are in flight together.
+    In budget mode (`PEACE_BUDGET_*`), functions are chosen and skipped as in
+    `process_function_modifications`.
+
+    Attributes
+    ----------
+    stages : list
+        The analyze, retrieve and optimize stages.
+    report : dict or None
+        Per-stage statistics of the last run, see `Stage.stats`.
+    """
+
+    def __init__(self, analyze_workers=None, retrieve_workers=None, optimize_workers=None, queue_size=None):
+        """
+        Initialize the pipeline.
+
+        Parameters
+        ----------
+        analyze_workers : int or None, optional
+            Phase I workers, default is `PEACE_ANALYZE_WORKERS` or 2.
+        retrieve_workers : int or None, optional
+            Phase II workers, default is `PEACE_RETRIEVE_WORKERS` or 2.
+        optimize_workers : int or None, optional
+            Phase III workers, default is `PEACE_OPTIMIZE_WORKERS` or 8.
+        queue_size : int or None, optional
+            Bound of each stage's admission queue, default is `PEACE_STAGE_QUEUE_SIZE` or 4.
+        """
+        queue_size = STAGE_QUEUE_SIZE if queue_size is None else queue_size
+        self.analyze = Stage(
+            "analyze", self._analyze, ANALYZE_WORKERS if analyze_workers is None else analyze_workers,
+            queue_size, self._fail
+        )
+        self.retrieve = Stage(
+            "retrieve", self._retrieve, RETRIEVE_WORKERS if retrieve_workers is None else retrieve_workers,
+            queue_size, self._fail
+        )
+        self.optimize = Stage(
+            "optimize", self._optimize, OPTIMIZE_WORKERS if optimize_workers is None else optimize_workers,
+            queue_size, self._fail
+        )
+        self.stages = [self.analyze, self.retrieve, self.optimize]
+        self.report = None
+        self._on_result = None
+        self._outstanding = 0
+        self._condition = threading.Condition()
+
+    # ========== Stage Handlers ==========
+    def _analyze(self, item):
+        job, _ = item
+        with telemetry_tags(repo=job.repo_name, sha=job.sha):
+            modifications = analyze_modifications(job.data)
+        if not modifications:
+            self._finish(job, (job.sha, []))
+            return
+        budget = Budget.from_env()
+        if budget.enabled:
+            job.budget = budget.plan(modifications).start()
+        job.schedule = FunctionSchedule(modifications, dag=DAG_SCHEDULING)
+        job.remaining = len(modifications)
+        ready = job.schedule.ready()
+        for index in job.budget.order(ready) if job.budget is not None else ready:
+            self.retrieve.put((job, index))
+
+    def _retrieve(self, item):
+        job, index = item
+        if job.finished:
+            return
+        data = job.schedule.modifications[index]
+        if job.budget is not None:
+            reason = job.budget.try_start_function(index)
+            if reason is not None:
+                with job.lock:
+                    job.results[index] = job.budget.skip(data, reason)
+                self._complete(job, index, None)
+                return
+        with telemetry_tags(repo=job.repo_name, sha=job.sha), self._metered(job):
+            try:
+                rag_pool = job.schedule.edit_pool(index)
+                job.inputs[index] = (add_data(data, rag_pool), rag_pool)
+            except LLMBatchPending:
+                raise
+            except Exception as e:
+                logging.error(f"Error processing function {data.get('function_name', '')}: {e}")
+                self._complete(job, index, None)
+                return
+        self.optimize.put(item)
+
+    def _optimize(self, item):
+        job, index = item
+        if job.finished:
+            return
+        data = job.schedule.modifications[index]
+        input_data, rag_pool = job.inputs.pop(index)
+        result = None
+        with telemetry_tags(repo=job.repo_name, sha=job.sha), self._metered(job):
+            try:
+                result = optimize_modification(data, input_data, rag_pool)
+            except LLMBatchPending:
+                raise
+            except Exception as e:
+                logging.error(f"Error processing function {data.get('function_name', '')}: {e}")
+        self._complete(job, index, result)
+
+    def _complete(self, job, index, result):
+        # Released functions re-enter the retrieve stage as feedback, which never blocks
+        released = job.schedule.complete(index, result)
+        for ready in job.budget.order(released) if job.budget is not None else released:
+            self.retrieve.put_feedback((job, ready))
+        with job.lock:
+            if result is not None:
+                job.results[index] = result
+            job.remaining -= 1
+            done = not job.remaining
+        if done:
+            if job.budget is not None:
+                job.budget.log_summary(job.sha)
+            self._finish(job, (job.sha, [job.results[index] for index in sorted(job.results)]))
+
+    @staticmethod
+    def _metered(job):
+        return metered(job.budget.meter) if job.budget is not None else nullcontext()
+
+    def _fail(self, item, error):
+        job, _ = item
+        if isinstance(error, LLMBatchPending):
+            logging.info(f"Paused {job.sha} until the next batch: {error}")
+        else:
+            logging.error(f"Error processing {job.sha}: {error}")
+        self._finish(job, None)
+
+    def _finish(self, job, outcome):
+        with job.lock:
+            if job.finished:
+                return  # A failed target's other functions may still be in flight
+            job.finished = True
+        try:
+            if self._on_result is not None:
+                self._on_result(job.key, outcome)
+        except Exception as e:
+            logging.error(f"Error storing the result of {job.sha}: {e}")
+        with self._condition:
+            self._outstanding -= 1
+            self._condition.notify_all()
+
+    # ========== Running ==========
+    def run(self, targets, on_result):
+        """
+        Process targets through the stages.
+
+        Parameters
+        ----------
+        targets : iterable
+            (key, repo_name, sha, data) tuples, where `data` is the input of
+            `pipeline_function_modifications` and `key` identifies the target to `on_result`.
+        on_result : callable
+            Called from a stage worker as `on_result(key, outcome)` when a target
+            completes; `outcome` is (sha, results), or None if the target failed or is
+            pending in batch mode.
+
+        Returns
+        -------
+        dict
+            Per-stage statistics, also kept in `report`.
+        """
+        self._on_result = on_result
+        start = time.perf_counter()
+        for stage in self.stages:
+            stage.start()
+        try:
+            for key, repo_name, sha, data in targets:
+                with self._condition:
+                    self._outstanding += 1
+                self.analyze.put((_TargetJob(key, repo_name, sha, data), None))
+            with self._condition:
+                while self._outstanding:
+                    self._condition.wait()
+        finally:
+            for stage in self.stages:
+                stage.close()
+
+        elapsed = time.perf_counter() - start
+        self.report = {"elapsed": elapsed, "stages": {stage.name: stage.stats(elapsed) for stage in self.stages}}
+        self.log_report()
+        return self.report
+
+    def log_report(self):
+        """Log the per-stage statistics of the last run."""
+        if self.report is None:
+            return
+        logging.info(f"Staged pipeline finished in {self.report['elapsed']:.2f}s")
+        for name, stats in self.report["stages"].items():
+            logging.info(
+                f"  {name}: {stats['processed']} items ({stats['errors']} errors) on {stats['workers']} workers, "
+                f"{stats['throughput']:.2f} items/s, utilization {stats['utilization']:.0%}, "
+                f"queue depth mean {stats['queue_depth_mean']:.1f} / max {stats['queue_depth_max']}, "
+                f"queue wait mean {stats['queue_wait_mean']:.2f}s"
+            )
@@ -0,0 +1,333 @@
+import re
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+# ========== Stub Configuration ==========
+RESPONSE_MODES = ("pipeline", "echo", "canned")
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+# Trailing text after the answer, so that streaming early termination has something to skip
+TRAILING_EXPLANATION = "\nThis version avoids redundant work while keeping the behaviour unchanged." * 5
+
+FUNCTION_PATTERN = re.compile(r"Function to optimize:\s*```python\n(.*?)\n\s*```", re.DOTALL)
+
+
+def pipeline_response(messages):
+    """
+    Answer the prompts of the PEACE pipeline plausibly and deterministically.
+
+    - Agent prompts (JSON tool protocol): first request one tool call, then give a
+      final answer citing the first fragment.
+    - Optimizer prompts: return the function to optimize in a fenced code block,
+      followed by an explanation.
+    - Anything else is echoed.
+
+    Parameters
+    ----------
+    messages : list
+        The chat messages of the request.
+
+    Returns
+    -------
+    str
+        The response content.
+    """
+    first = messages[0].get("content") or "" if messages else ""
+    last = messages[-1].get("content") or "" if messages else ""
+
+    if '"isfinal_response"' in first:
+        if len(messages) == 1:
+            answer = {"isfinal_response": "0", "usingtool": "get_top_k_fragments(2)", "response": ""}
+        else:
+            answer = {"isfinal_response": "1", "usingtool": "", "response": "[E1]"}
+        return json.dumps(answer) + TRAILING_EXPLANATION
+
+    match = FUNCTION_PATTERN.search(last)
+    if match:
+        return f"```python\n{match.group(1).strip()}\n```" + TRAILING_EXPLANATION
+
+    return last
+
+
+class StubLLMServer:
+    """
+    Local HTTP server implementing the chat-completions API shape, for running and
+    benchmarking the pipeline offline.
+
+    Latency, error rate and responses are configurable; `"stream": true` requests are
+    answered with server-sent events. Counters are served at `GET /stats`.
+
+    Attributes
+    ----------
+    host : str
+        Bound host.
+    port : int
+        Bound port (chosen by the OS when 0 was requested).
+    stats : dict
+        Request, error, stream and early-close counters.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8000, mode="pipeline", canned_path=None, latency=0.0,
+                 latency_jitter=0.0, distribution="fixed", error_rate=0.0, error_status=503,
+                 chunk_size=8, chunk_delay=0.0, seed=0):
+        """
+        Initialize the server (call `start` or `serve_forever` to run it).
+
+        Parameters
+        ----------
+        host : str, optional
+            Host to bind, default is "127.0.0.1".
+        port : int, optional
+            Port to bind, default is 8000; 0 picks a free port.
+        mode : str, optional
+            "pipeline" (default), "echo" or "canned".
+        canned_path : str or None, optional
+            JSON file with {"default": str, "rules": [{"contains": str, "response": str}]} for "canned" mode.
+        latency : float, optional
+            Mean latency before the response starts, in seconds.
+        latency_jitter : float, optional
+            Spread of the latency: half-width for "uniform", sigma for "lognormal".
+        distribution : str, optional
+            "fixed" (default), "uniform", "exponential" or "lognormal".
+        error_rate : float, optional
+            Probability of answering with `error_status`, default is 0.
+        error_status : int, optional
+            Status code of injected errors, default is 503 (retryable).
+        chunk_size : int, optional
+            Characters per server-sent event, default is 8.
+        chunk_delay : float, optional
+            Delay between server-sent events, in seconds.
+        seed : int, optional
+            Seed of the latency and error sampling.
+        """
+        if mode not in RESPONSE_MODES:
+            raise ValueError(f"Unknown mode '{mode}', expected one of {RESPONSE_MODES}")
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution '{distribution}', expected one of {LATENCY_DISTRIBUTIONS}")
+
+        self.mode = mode
+        self.canned = {"default": "", "rules": []}
+        if canned_path:
+            with open(canned_path, "r", encoding="utf-8") as f:
+                self.canned.update(json.load(f))
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.distribution = distribution
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.chunk_size = max(1, chunk_size)
+        self.chunk_delay = chunk_delay
+        self.stats = {"requests": 0, "errors": 0, "streams": 0, "closed_early": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self.host, self.port = self._httpd.server_address[:2]
+
+    @property
+    def url(self):
+        """The chat-completions endpoint of the server."""
+        return f"http://{self.host}:{self.port}/v1/chat/completions"
+
+    # ========== Sampling ==========
+    def _sample(self):
+        """Return (latency, inject_error) for one request."""
+        with self._lock:
+            if self.distribution == "fixed":
+                latency = self.latency
+            elif self.distribution == "uniform":
+                latency = self._random.uniform(self.latency - self.latency_jitter, self.latency + self.latency_jitter)
+            elif self.distribution == "exponential":
+                latency = self._random.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+            else:
+                latency = self._random.lognormvariate(0, self.latency_jitter or 0.5) * self.latency
+            return max(0.0, latency), self._random.random() < self.error_rate
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def respond(self, messages):
+        """
+        Produce the response content for a request.
+
+        Parameters
+        ----------
+        messages : list
+            The chat messages of the request.
+
+        Returns
+        -------
+        str
+        """
+        if self.mode == "echo":
+            return messages[-1].get("content") or "" if messages else ""
+        if self.mode == "canned":
+            text = "\n".join(message.get("content") or "" for message in messages)
+            for rule in self.canned["rules"]:
+                if rule["contains"] in text:
+                    return rule["response"]
+            return self.canned["default"]
+        return pipeline_response(messages)
+
+    # ========== HTTP Handling ==========
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass  # Keep benchmark output clean
+
+            def _send_json(self, status, body, headers=None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/stats":
+                    with server._lock:
+                        stats = dict(server.stats)
+                    self._send_json(200, stats)
+                else:
+                    self._send_json(404, {"error": {"message": "Not found"}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+                    return
+
+                server._count("requests")
+                latency, inject_error = server._sample()
+                time.sleep(latency)
+
+                if inject_error:
+                    server._count("errors")
+                    self._send_json(server.error_status, {"error": {"message": "Injected error"}}, {"Retry-After": "0"})
+                    return
+
+                messages = payload.get("messages") or []
+                content = server.respond(messages)
+                if payload.get("stream"):
+                    self._stream(payload, content)
+                    return
+
+                n = max(1, int(payload.get("n") or 1))
+                prompt_tokens = sum(len(message.get("content") or "") for message in messages) // 4
+                self._send_json(200, {
+                    "id": f"stub-{int(time.time() * 1000)}",
+                    "object": "chat.completion",
+                    "model": payload.get("model", "stub"),
+                    "choices": [
+                        {"index": i, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                        for i in range(n)
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": len(content) // 4,
+                        "total_tokens": prompt_tokens + len(content) // 4
+                    }
+                })
+
+            def _stream(self, payload, content):
+                server._count("streams")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+
+                try:
+                    for start in range(0, len(content), server.chunk_size):
+                        chunk = {
+                            "object": "chat.completion.chunk",
+                            "model": payload.get("model", "stub"),
+                            "choices": [{"index": 0, "delta": {"content": content[start:start + server.chunk_size]}}]
+                        }
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                        if server.chunk_delay:
+                            time.sleep(server.chunk_delay)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    server._count("closed_early")  # The client stopped reading
+                self.close_connection = True
+
+        return Handler
+
+    # ========== Lifecycle ==========
+    def start(self):
+        """Serve in a background thread; returns the server."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stub-llm-server", daemon=True)
+        self._thread.start()
+        logging.info(f"Stub LLM server listening on {self.url}")
+        return self
+
+    def serve_forever(self):
+        """Serve in the current thread until interrupted."""
+        logging.info(f"Stub LLM server listening on {self.url}")
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._httpd.server_close()
+
+    def stop(self):
+        """Stop serving and release the port."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+# ========== Main Execution ==========
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stub of a chat-completions API for offline runs and benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to bind.")
+    parser.add_argument("--mode", choices=RESPONSE_MODES, default="pipeline", help="How responses are produced.")
+    parser.add_argument("--canned", default=None, help="JSON file of canned responses for --mode canned.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean latency in seconds.")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Latency spread (uniform half-width or lognormal sigma).")
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="fixed", help="Latency distribution.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected error.")
+    parser.add_argument("--error-status", type=int, default=503, help="Status code of injected errors.")
+    parser.add_argument("--chunk-size", type=int, default=8, help="Characters per streamed event.")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Delay between streamed events in seconds.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the latency and error sampling.")
+    args = parser.parse_args()
+
+    StubLLMServer(
+        host=args.host, port=args.port, mode=args.mode, canned_path=args.canned, latency=args.latency,
+        latency_jitter=args.latency_jitter, distribution=args.distribution, error_rate=args.error_rate,
+        error_status=args.error_status, chunk_size=args.chunk_size, chunk_delay=args.chunk_delay, seed=args.seed
+    ).serve_forever()
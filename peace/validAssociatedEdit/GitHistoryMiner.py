@@ -0,0 +1,337 @@
+import queue
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from RAGEditPool import RAGEditPool
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+# Marker used in place of the default `git log` header so commit boundaries
+# can be told apart from diff content without parsing author/date lines.
+COMMIT_MARKER = "commit "
+
+# Prefixes of the lines that make up a hunk body.
+HUNK_LINE_PREFIXES = (" ", "+", "-")
+
+# Hunks a parallel worker may read ahead of the pool, and hunks added to the pool at a time.
+MINE_BATCH_SIZE = 512
+
+_END_OF_PATH = object()
+
+
+def _put_unless_stopped(items, item, stop):
+    """Put `item` on a bounded queue, waiting for room until `stop` is set; returns whether it was put."""
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+class GitHistoryMiner:
+    """
+    Streams `git log -p` for a local repository and yields diff hunks one at a time,
+    so an edit pool can be built without materializing the full history in memory.
+
+    Attributes
+    ----------
+    repo_dir : str
+        Path to the local git repository.
+    paths : list or None
+        Optional list of paths (files or directories) to restrict the history to.
+    function_span : tuple or None
+        Optional (file_path, start_line, end_line) or (file_path, function_name)
+        restricting the history to a single function via `git log -L`.
+    max_commits : int or None
+        Maximum number of commits to read (per path when `paths` is given).
+    since : str or None
+        Only read commits more recent than this date (any format accepted by git).
+    until : str or None
+        Only read commits older than this date (any format accepted by git).
+    file_suffixes : tuple
+        Only hunks of files ending with one of these suffixes are yielded.
+    workers : int
+        Number of per-path workers used by `build_pool`.
+    """
+
+    def __init__(self, repo_dir, paths=None, function_span=None, max_commits=None,
+                 since=None, until=None, file_suffixes=(".py",), workers=1):
+        """
+        Initialize the git history miner.
+
+        Parameters
+        ----------
+        repo_dir : str
+            Path to the local git repository.
+        paths : list or None, optional
+            Paths to restrict the history to, default is the whole repository.
+        function_span : tuple or None, optional
+            (file_path, start_line, end_line) or (file_path, function_name), default is None.
+        max_commits : int or None, optional
+            Maximum number of commits to read, default is no limit.
+        since : str or None, optional
+            Lower bound of the time window, default is None.
+        until : str or None, optional
+            Upper bound of the time window, default is None.
+        file_suffixes : tuple, optional
+            File suffixes to keep, default is (".py",).
+        workers : int, optional
+            Number of parallel per-path workers, default is 1.
+        """
+        self.repo_dir = repo_dir
+        self.paths = list(paths) if paths else []
+        self.function_span = function_span
+        self.max_commits = max_commits
+        self.since = since
+        self.until = until
+        self.file_suffixes = tuple(file_suffixes) if file_suffixes else ()
+        self.workers = max(1, int(workers))
+
+    def _build_command(self, path=None):
+        """
+        Build the `git log` command line for the configured filters.
+
+        Parameters
+        ----------
+        path : str or None, optional
+            A single path to restrict the history to.
+
+        Returns
+        -------
+        list
+            The command as a list of arguments.
+        """
+        command = [
+            "git", "-C", self.repo_dir, "log", "-p", "--no-color", "--no-ext-diff",
+            f"--format={COMMIT_MARKER}%H"
+        ]
+        if self.max_commits:
+            command.append(f"--max-count={int(self.max_commits)}")
+        if self.since:
+            command.append(f"--since={self.since}")
+        if self.until:
+            command.append(f"--until={self.until}")
+
+        # `git log -L` cannot be combined with a pathspec
+        if self.function_span:
+            if len(self.function_span) == 3:
+                file_path, start, end = self.function_span
+                command.append(f"-L{int(start)},{int(end)}:{file_path}")
+            else:
+                file_path, function_name = self.function_span
+                command.append(f"-L:{function_name}:{file_path}")
+        elif path:
+            command.extend(["--", path])
+
+        return command
+
+    def _accepts_file(self, file_path):
+        """Checks whether hunks of the given file should be yielded."""
+        return not self.file_suffixes or (file_path or "").endswith(self.file_suffixes)
+
+    def iter_hunks(self, path=None):
+        """
+        Stream the history and yield every hunk as soon as it is complete.
+
+        Parameters
+        ----------
+        path : str or None, optional
+            A single path to restrict the history to.
+
+        Yields
+        ------
+        tuple
+            (commit_sha, file_path, hunk) where `hunk` starts with its `@@` header.
+        """
+        command = self._build_command(path)
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            errors="replace"
+        )
+
+        sha, file_path, hunk = None, None, []
+        try:
+            for raw_line in process.stdout:
+                line = raw_line.rstrip("\n")
+
+                if line.startswith("@@"):
+                    if hunk and self._accepts_file(file_path):
+                        yield sha, file_path, "\n".join(hunk)
+                    hunk = [line]
+                elif hunk and line.startswith(HUNK_LINE_PREFIXES):
+                    hunk.append(line)
+                elif hunk and line.startswith("\\"):
+                    continue  # "\ No newline at end of file"
+                else:
+                    # Any other line ends the current hunk
+                    if hunk and self._accepts_file(file_path):
+                        yield sha, file_path, "\n".join(hunk)
+                    hunk = []
+
+                    if line.startswith(COMMIT_MARKER):
+                        sha = line[len(COMMIT_MARKER):].strip()
+                    elif line.startswith("diff --git "):
+                        file_path = line.rsplit(" b/", 1)[-1]
+
+            if hunk and self._accepts_file(file_path):
+                yield sha, file_path, "\n".join(hunk)
+        finally:
+            # Stop git early if the consumer abandons the generator
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+
+        if process.returncode:
+            logging.warning(f"git log exited with code {process.returncode} for {self.repo_dir}")
+
+    def build_pool(self, rag_pool=None, max_lines=15):
+        """
+        Feed every mined hunk into an edit pool.
+
+        Parameters
+        ----------
+        rag_pool : RAGEditPool or None, optional
+            The pool to fill, a new one is created if None.
+        max_lines : int, optional
+            Maximum number of lines per fragment for a new pool, default is 15.
+
+        Returns
+        -------
+        RAGEditPool
+            The filled edit pool.
+        """
+        if rag_pool is None:
+            rag_pool = RAGEditPool(max_lines=max_lines)
+
+        if self.function_span or not self.paths:
+            count = self._feed(rag_pool, None)
+        elif self.workers == 1 or len(self.paths) == 1:
+            count = sum(self._feed(rag_pool, path) for path in self.paths)
+        else:
+            count = self._feed_parallel(rag_pool)
+
+        logging.info(f"Mined {count} hunks from {self.repo_dir} into {rag_pool}")
+        return rag_pool
+
+    def _feed(self, rag_pool, path):
+        """
+        Stream the history of one path into the pool.
+
+        Parameters
+        ----------
+        rag_pool : RAGEditPool
+            The pool to fill.
+        path : str or None
+            The path to mine, None for the whole repository.
+
+        Returns
+        -------
+        int
+            Number of hunks added.
+        """
+        count = 0
+        for _, _, hunk in self.iter_hunks(path):
+            rag_pool.add_edit_from_patch(hunk)
+            count += 1
+        return count
+
+    def _feed_parallel(self, rag_pool):
+        """
+        Stream the history of every path into the pool, reading the paths in parallel.
+
+        Each worker reads one path into a bounded queue and blocks when it is full;
+        the queues are drained in `paths` order, so the pool (and its ranking, whose
+        ties follow insertion order) does not depend on timing, and at most
+        `MINE_BATCH_SIZE` hunks per worker are held in memory.
+
+        Parameters
+        ----------
+        rag_pool : RAGEditPool
+            The pool to fill.
+
+        Returns
+        -------
+        int
+            Number of hunks added.
+        """
+        stop = threading.Event()
+        queues = [queue.Queue(maxsize=MINE_BATCH_SIZE) for _ in self.paths]
+        count = 0
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(self.paths))) as executor:
+            try:
+                futures = [
+                    executor.submit(self._read_path, path, hunks, stop)
+                    for path, hunks in zip(self.paths, queues)
+                ]
+                batch = []
+                for future, hunks in zip(futures, queues):
+                    for hunk in iter(hunks.get, _END_OF_PATH):
+                        batch.append(hunk)
+                        if len(batch) >= MINE_BATCH_SIZE:
+                            rag_pool.add_edits(batch)
+                            count += len(batch)
+                            batch = []
+                    future.result()  # Re-raise a failure of the worker
+                rag_pool.add_edits(batch)
+                count += len(batch)
+            finally:
+                stop.set()  # Release workers blocked on a full queue if the pool failed
+        return count
+
+    def _read_path(self, path, hunks, stop):
+        """Put the hunks of one path on `hunks`, then `_END_OF_PATH`; returns early once `stop` is set."""
+        try:
+            for _, _, hunk in self.iter_hunks(path):
+                if not _put_unless_stopped(hunks, hunk, stop):
+                    return  # Closing the generator stops git
+        finally:
+            _put_unless_stopped(hunks, _END_OF_PATH, stop)
+
+
+def build_edit_pool_from_repo(repo_dir, max_lines=15, **kwargs):
+    """
+    Build a RAGEditPool directly from the history of a local repository.
+
+    Parameters
+    ----------
+    repo_dir : str
+        Path to the local git repository.
+    max_lines : int, optional
+        Maximum number of lines per edit fragment, default is 15.
+    **kwargs
+        Filters forwarded to `GitHistoryMiner` (paths, function_span, max_commits,
+        since, until, file_suffixes, workers).
+
+    Returns
+    -------
+    RAGEditPool
+        The filled edit pool.
+    """
+    return GitHistoryMiner(repo_dir, **kwargs).build_pool(max_lines=max_lines)
+
+
+# ========== Example Usage ==========
+if __name__ == "__main__":
+    REPO_PATH = "/path/to/repository"
+
+    rag_pool = build_edit_pool_from_repo(
+        REPO_PATH,
+        max_lines=10,
+        paths=["src"],
+        max_commits=200,
+        since="2 years ago",
+        workers=4
+    )
+    print(f"Number of fragments in the pool: {len(rag_pool)}")
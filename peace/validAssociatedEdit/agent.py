@@ -1,8 +1,15 @@
 import os
-import requests
 import json
 import re
+import logging
+import threading
 from RAGEditPool import RAGEditPool
+from llm_client import get_client, LLMRequestError, JSONObjectStop
+from prompt_builder import PromptBuilder, PromptSection, DEFAULT_PROMPT_TOKENS, trim_to_tokens, format_usage, default_counter
+
+# ========== GPT Configuration ==========
+GPT_API_URL = os.environ.get("LLM_API_URL", "https://api.example.com/v1/chat/completions")  # Placeholder URL
+GPT_MODEL = "Llama-3.1-405B"
 
 # ========== JSON Extraction Functions ==========
 def extract_json_from_text(text):
@@ -71,8 +78,9 @@ def call_tool(rag_pool, initial_code, usingtool_str):
 
     Returns
     -------
-    str
-        The tool response formatted as a string.
+    list
+        A list of tuples (tool_call, results) where `results` is the list of
+        (fragment, dependency_score) returned by the tool.
     """
     result = []
 
@@ -83,7 +91,7 @@ def call_tool(rag_pool, initial_code, usingtool_str):
     for match in matches_k:
         k = int(match.strip())
         tool_response = rag_pool.get_top_k_fragments(initial_code, k)
-        result.append(f"get_top_k_fragments({k}): {tool_response}")
+        result.append((f"get_top_k_fragments({k})", tool_response))
 
     # Match get_fragments_in_range(l, r)
     pattern_range = r'get_fragments_in_range\((\d+),\s*(\d+)\)'
@@ -92,64 +100,330 @@ def call_tool(rag_pool, initial_code, usingtool_str):
     for match in matches_range:
         l, r = int(match[0].strip()), int(match[1].strip())
         tool_response = rag_pool.get_fragments_in_range(initial_code, l, r)
-        result.append(f"get_fragments_in_range({l}, {r}): {tool_response}")
+        result.append((f"get_fragments_in_range({l}, {r})", tool_response))
+
+    return result
+
+# ========== Speculative Prefetch ==========
+class RankingPrefetcher:
+    """
+    Ranks the pool against one reference code in a background thread while the
+    loop waits on the LLM, so the tool calls that follow are answered from the
+    precomputed ranking.
+
+    The prefetcher has the tool methods of `RAGEditPool` and can be passed to
+    `call_tool` in its place. Queries for another reference code, or made after a
+    cancellation, a failure or a change to the pool, go to the pool directly, so the
+    results are always the ones the pool would return.
+
+    Attributes
+    ----------
+    rag_pool : RAGEditPool
+        The pool being ranked.
+    reference_code : str
+        The reference code the ranking is computed for.
+    """
+
+    def __init__(self, rag_pool, reference_code):
+        """
+        Initialize the prefetcher.
+
+        Parameters
+        ----------
+        rag_pool : RAGEditPool or ShardedRAGEditPool
+            The pool being ranked.
+        reference_code : str
+            The reference code the ranking is computed for.
+        """
+        self.rag_pool = rag_pool
+        self.reference_code = reference_code
+        self._pool_size = len(rag_pool)
+        self._ranking = None
+        self._cancel_event = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ranking-prefetch", daemon=True)
+
+    def start(self):
+        """Start ranking in the background; returns immediately."""
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            if isinstance(self.rag_pool, RAGEditPool):
+                scores = self.rag_pool.score_fragments(self.reference_code, cancel_event=self._cancel_event)
+                if scores is not None:
+                    # Same ordering as RAGEditPool.calculate_dependency_scores
+                    ranking = list(zip(self.rag_pool.edit_pool, scores))
+                    self._ranking = sorted(ranking, key=lambda x: x[1], reverse=True)
+            else:
+                self._ranking = self.rag_pool.calculate_dependency_scores(self.reference_code)
+        except Exception as e:
+            logging.warning(f"Speculative ranking failed, tool calls will query the pool: {e}")
+        finally:
+            self._done.set()
+
+    def cancel(self):
+        """
+        Stop the background ranking at the next fragment, discard it and wait for the
+        thread, so that it no longer scores with the pool's analyzer or writes its cache.
+        """
+        self._cancel_event.set()
+        if self._thread.ident is not None:
+            self._thread.join()
+
+    def _get_ranking(self, reference_code):
+        """
+        Wait for the speculative ranking; None if it cannot be used for this query, in
+        which case the background ranking has stopped and the pool can be queried.
+        """
+        if reference_code != self.reference_code or self._cancel_event.is_set():
+            self.cancel()
+            return None
+        self._done.wait()
+        if self._ranking is None or len(self.rag_pool) != self._pool_size:
+            return None
+        return self._ranking
+
+    def get_top_k_fragments(self, reference_code, k):
+        """
+        Get the top K fragments, like `RAGEditPool.get_top_k_fragments`.
+
+        Returns
+        -------
+        list
+            A list of tuples (fragment, dependency_score).
+        """
+        ranking = self._get_ranking(reference_code)
+        if ranking is None:
+            return self.rag_pool.get_top_k_fragments(reference_code, k)
+        return ranking[:min(k, len(ranking))]
+
+    def get_fragments_in_range(self, reference_code, l, r):
+        """
+        Get fragments ranked between positions l and r, like `RAGEditPool.get_fragments_in_range`.
+
+        Returns
+        -------
+        list
+            A list of tuples (fragment, dependency_score).
+        """
+        ranking = self._get_ranking(reference_code)
+        if ranking is None:
+            return self.rag_pool.get_fragments_in_range(reference_code, l, r)
+        if l <= 0 or r <= 0 or l > r or l > len(ranking):
+            return []
+        return ranking[l - 1 : min(r, len(ranking))]
+
+# ========== Conversation Context ==========
+class AgentConversation:
+    """
+    The chat messages of one agent run, kept within a token budget.
+
+    Every fragment returned by a tool gets a stable reference ID such as [E1]. A
+    fragment is shown in full only once while that content is still in context;
+    repeated results only cite its ID. When the conversation exceeds the budget,
+    the oldest tool responses are compacted to their tool call and fragment IDs.
 
-    return '\n'.join(result)
+    Attributes
+    ----------
+    messages : list
+        Chat messages sent to the model.
+    max_tokens : int
+        Token budget of all messages.
+    fragments : dict
+        Fragment text by reference ID.
+    """
+
+    def __init__(self, initial_prompt, max_tokens=DEFAULT_PROMPT_TOKENS, counter=None):
+        """
+        Initialize the conversation.
+
+        Parameters
+        ----------
+        initial_prompt : str
+            The task prompt, sent as the first user message.
+        max_tokens : int, optional
+            Token budget of all messages, default is `LLM_PROMPT_TOKENS` or 2000.
+        counter : TokenCounter or None, optional
+            Token counter, default is the process-wide counter.
+        """
+        self.messages = [{"role": "user", "content": initial_prompt}]
+        self.max_tokens = max_tokens
+        self.counter = counter or default_counter()
+        self.fragments = {}
+        self._fragment_ids = {}
+        self._visible = set()  # IDs whose full content is still in the context
+        self._tool_turns = []  # (message index, compact summary, IDs shown in full)
+
+    def _fragment_id(self, fragment):
+        if fragment not in self._fragment_ids:
+            fragment_id = f"E{len(self._fragment_ids) + 1}"
+            self._fragment_ids[fragment] = fragment_id
+            self.fragments[fragment_id] = fragment
+        return self._fragment_ids[fragment]
+
+    def _render(self, tool_results):
+        """
+        Render tool results in full and as a compact summary.
+
+        Returns
+        -------
+        tuple
+            (content, summary, shown) where `shown` holds the IDs shown in full.
+        """
+        full_lines, summary_lines, shown = [], [], set()
+        for tool_call, results in tool_results:
+            full_lines.append(f"{tool_call}:")
+            summary_lines.append(f"{tool_call}:")
+            for fragment, score in results:
+                fragment_id = self._fragment_id(fragment)
+                header = f"[{fragment_id}] score={score:.4f}"
+                summary_lines.append(header)
+                if fragment_id in self._visible or fragment_id in shown:
+                    full_lines.append(f"{header} (shown above)")
+                else:
+                    full_lines.append(f"{header}\n{fragment}")
+                    shown.add(fragment_id)
+        if not tool_results:
+            full_lines.append("No valid tool call found.")
+            summary_lines.append("No valid tool call found.")
+
+        content = "Tool response:\n" + "\n".join(full_lines)
+        summary = "Tool response (compacted, fragment content omitted; cite IDs):\n" + "\n".join(summary_lines)
+        return content, summary, shown
+
+    def add_turn(self, response, tool_results):
+        """
+        Append the model response and the tool results, then compact if over budget.
+
+        Parameters
+        ----------
+        response : str
+            The raw model response that requested the tools.
+        tool_results : list
+            The (tool_call, results) tuples from `call_tool`.
+        """
+        self.messages.append({"role": "assistant", "content": response})
+        self.messages.append({"role": "user", "content": ""})
+        index = len(self.messages) - 1
+
+        # Compacting an older turn hides its fragments, so render again until nothing changes
+        while True:
+            content, summary, shown = self._render(tool_results)
+            self.messages[index]["content"] = content
+            if not self._compact_older():
+                break
+
+        self._tool_turns.append((index, summary, shown))
+        self._visible |= shown
+
+        total = self.token_count()
+        if total > self.max_tokens:
+            allowed = self.counter.count(content) - (total - self.max_tokens)
+            self.messages[index]["content"] = trim_to_tokens(content, allowed)
+
+    def token_count(self):
+        """
+        Count the tokens of all messages.
+
+        Returns
+        -------
+        int
+        """
+        return sum(self.counter.count(message["content"]) for message in self.messages)
+
+    def _compact_older(self):
+        """
+        Compact the oldest tool responses until the budget is met.
+
+        Returns
+        -------
+        bool
+            Whether any tool response was compacted.
+        """
+        total = self.token_count()
+        compacted = False
+        for index, summary, shown in self._tool_turns:
+            if total <= self.max_tokens:
+                break
+            if self.messages[index]["content"] == summary:
+                continue
+            total += self.counter.count(summary) - self.counter.count(self.messages[index]["content"])
+            self.messages[index]["content"] = summary
+            self._visible -= shown
+            compacted = True
+        return compacted
+
+    def expand_references(self, answer):
+        """
+        Replace fragment IDs cited in the final answer with the fragment content.
+
+        Parameters
+        ----------
+        answer : str
+            The final answer of the model.
+
+        Returns
+        -------
+        str
+        """
+        return re.sub(
+            r'\[(E\d+)\]',
+            lambda match: self.fragments.get(match.group(1), match.group(0)),
+            answer
+        )
 
 # ========== GPT Interaction Functions ==========
-def send_to_gpt(prompt):
+def send_messages(messages):
     """
-    Sends a request to the GPT API.
+    Sends chat messages to the GPT API, streaming the response and stopping
+    once the first complete JSON object has been received.
 
     Parameters
     ----------
-    prompt : str
-        The input prompt.
+    messages : list
+        Chat messages, e.g. [{"role": "user", "content": prompt}].
 
     Returns
     -------
     str
-        The GPT response.
+        The GPT response, or an empty string if the request failed.
     """
-    max_length = 8000  # Truncate long prompts
-    prompt = prompt[:max_length]
-
-    url = "https://api.example.com/v1/chat/completions"  # Placeholder URL
     api_key = os.environ.get("GPT_API_KEY", "sk-xxxxxxxxxxxxxxxxxxxxxxxxxxxxx")  # Secure API Key
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-    data = {
-        "model": "Llama-3.1-405B",
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0,
-        "n": 1
-    }
+    client = get_client(GPT_API_URL, api_key=api_key)
 
     try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
-    except requests.exceptions.RequestException:
+        return client.stream_chat_completion(
+            messages,
+            model=GPT_MODEL,
+            stop=JSONObjectStop,
+            temperature=0,
+            n=1
+        )
+    except LLMRequestError as e:
+        logging.error(f"Error in GPT API request: {e}")
         return ""
 
-# ========== Prompt Generation ==========
-def get_prompt(init_code):
+def send_to_gpt(prompt):
     """
-    Generates a structured prompt for GPT.
+    Sends a request to the GPT API.
 
     Parameters
     ----------
-    init_code : str
-        The initial reference code.
+    prompt : str
+        The input prompt.
 
     Returns
     -------
     str
-        The generated prompt.
+        The GPT response, or an empty string if the request failed.
     """
-    return f"""user:
+    prompt = trim_to_tokens(prompt, DEFAULT_PROMPT_TOKENS)  # Trim long prompts at line boundaries
+    return send_messages([{"role": "user", "content": prompt}])
+
+# ========== Prompt Generation ==========
+AGENT_PROMPT_TEMPLATE = """user:
     You are an expert Python programmer.
     You are given the following code:\n{init_code}
     Your task is to find previous associated edits relevant to this code.
@@ -169,12 +443,34 @@ def get_prompt(init_code):
     - "isfinal_response": "1" if the response is final, "0" if more tool calls are needed.
     - "usingtool": The tool call string (e.g., get_top_k_fragments(2)).
     - "response": The final response containing relevant edit snippets.
+
+    Tool results label each edit fragment with an ID such as [E1]; you may cite these IDs in "response" instead of repeating the fragments.
+    """
+# Half of the budget is left for the tool responses added by the loop
+PROMPT_BUILDER = PromptBuilder(AGENT_PROMPT_TEMPLATE, max_tokens=DEFAULT_PROMPT_TOKENS // 2)
+
+def get_prompt(init_code):
     """
+    Generates a structured prompt for GPT, trimming the code to its token budget.
+
+    Parameters
+    ----------
+    init_code : str
+        The initial reference code.
+
+    Returns
+    -------
+    str
+        The generated prompt.
+    """
+    prompt, usage = PROMPT_BUILDER.build([PromptSection("init_code", init_code)])
+    logging.info(format_usage(usage))
+    return prompt
 
 # ========== GPT Response Processing Loop ==========
-def process_response_loop(rag_pool, initial_code, max_requests=5):
+def process_response_loop(rag_pool, initial_code, max_requests=5, max_tokens=DEFAULT_PROMPT_TOKENS, prefetch=True):
     """
-    Processes the GPT response loop.
+    Processes the GPT response loop as a multi-turn conversation within a token budget.
 
     Parameters
     ----------
@@ -184,29 +480,41 @@ def process_response_loop(rag_pool, initial_code, max_requests=5):
         The reference code.
     max_requests : int, optional
         Maximum number of iterations, default is 5.
+    max_tokens : int, optional
+        Token budget of the conversation, default is `LLM_PROMPT_TOKENS` or 2000.
+    prefetch : bool, optional
+        Rank the pool in the background during the first LLM round-trip, default is True.
 
     Returns
     -------
     str
-        The final response.
+        The final response, with cited fragment IDs replaced by the fragments.
     """
-    prompt = get_prompt(initial_code)
+    conversation = AgentConversation(get_prompt(initial_code), max_tokens=max_tokens)
     num_requests = 0
 
-    while num_requests < max_requests:
-        response = send_to_gpt(prompt)
+    # The model almost always starts with a tool call, so rank while waiting for it
+    tools = RankingPrefetcher(rag_pool, initial_code).start() if prefetch and len(rag_pool) else rag_pool
+
+    try:
+        while num_requests < max_requests:
+            response = send_messages(conversation.messages)
 
-        isfinal_response, usingtool_str, answer = extract_values(response)
+            isfinal_response, usingtool_str, answer = extract_values(response)
 
-        if int(isfinal_response) == 1:
-            return answer  # Return final response
+            if int(isfinal_response) == 1:
+                return conversation.expand_references(answer)  # Return final response
 
-        # Call the tool based on the extracted command
-        tool_response = call_tool(rag_pool, initial_code, usingtool_str)
+            # Call the tool based on the extracted command
+            tool_results = call_tool(tools, initial_code, usingtool_str)
 
-        # Update prompt with the tool response
-        prompt += f"\nUser:\n{tool_response}\nresponse:\n"
-        num_requests += 1
+            # Continue the conversation with the tool results
+            conversation.add_turn(response, tool_results)
+            num_requests += 1
+            logging.info(f"Agent turn {num_requests}: {conversation.token_count()}/{max_tokens} context tokens")
+    finally:
+        if isinstance(tools, RankingPrefetcher):
+            tools.cancel()
 
     return "No valid response found."
 
@@ -0,0 +1,469 @@
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import logging
+import argparse
+import importlib
+import threading
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+# ========== Backend Configuration ==========
+BACKEND_MODEL = "model"  # The fine-tuned dependency classifier (needs torch and the weights)
+BACKEND_STUB = "stub"    # Deterministic lexical scorer for offline runs and benchmarks
+BACKEND_SERVER = "server"  # A `DependencyServer` shared by several processes
+DEPENDENCY_BACKEND = os.environ.get("PEACE_DEPENDENCY_BACKEND", BACKEND_MODEL)
+SERVER_URL = os.environ.get("PEACE_DEPENDENCY_SERVER", "http://127.0.0.1:8500")
+SERVER_TIMEOUT = float(os.environ.get("PEACE_DEPENDENCY_SERVER_TIMEOUT", "60"))
+STUB_LATENCY = float(os.environ.get("PEACE_STUB_DEPENDENCY_LATENCY", "0"))  # Seconds per score, to emulate the model
+MODEL_DIR = os.environ.get("PEACE_DEPENDENCY_MODEL_DIR", "/path/to/your/model")
+
+# Modules that may provide the model-backed DependencyAnalyzer, in lookup order
+# (see denpendAnalysisTool/dependencyAnalyzer.py)
+MODEL_MODULES = ("dependency_analysis", "analyze_dependency", "dependencyAnalyzer")
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+DEF_PATTERN = re.compile(r"\bdef\s+([A-Za-z_][A-Za-z0-9_]*)")
+
+
+class StubDependencyClassifier:
+    """
+    Deterministic stand-in for `DependencyClassifier` with the same interface.
+
+    The score of a pair combines the Jaccard similarity of the identifiers of both
+    snippets with a bonus when one snippet calls a function the other defines, and a
+    small hash-derived offset that breaks ties reproducibly. No model or GPU is needed.
+    """
+
+    def construct_pair(self, code_1, code_2):
+        """
+        Constructs a token pair for model input.
+
+        Parameters
+        ----------
+        code_1 : str
+            The first code snippet.
+        code_2 : str
+            The second code snippet.
+
+        Returns
+        -------
+        str
+            The constructed pair.
+        """
+        return f"<from>{code_1}<to>{code_2}"
+
+    def gen(self, text):
+        """
+        Generates the dependency score for a code pair.
+
+        Parameters
+        ----------
+        text : str
+            The input code pair from `construct_pair`.
+
+        Returns
+        -------
+        float
+            The dependency score, between 0 and 1.
+        """
+        if STUB_LATENCY:
+            time.sleep(STUB_LATENCY)
+
+        code_1, _, code_2 = text.partition("<to>")
+        code_1 = code_1.replace("<from>", "", 1)
+        names_1 = set(IDENTIFIER_PATTERN.findall(code_1))
+        names_2 = set(IDENTIFIER_PATTERN.findall(code_2))
+        if not names_1 or not names_2:
+            return 0.0
+
+        similarity = len(names_1 & names_2) / len(names_1 | names_2)
+        defined_1 = set(DEF_PATTERN.findall(code_1))
+        defined_2 = set(DEF_PATTERN.findall(code_2))
+        calls = bool((defined_1 & (names_2 - defined_2)) or (defined_2 & (names_1 - defined_1)))
+        tie_breaker = (zlib.crc32(text.encode("utf-8")) % 1000) / 1e6
+
+        return min(1.0, 0.8 * similarity + (0.2 if calls else 0.0) + tie_breaker)
+
+    def batch_gen(self, corpus_pair):
+        """
+        Processes multiple code pairs and returns dependency scores.
+
+        Parameters
+        ----------
+        corpus_pair : list
+            A list of code pairs from `construct_pair`.
+
+        Returns
+        -------
+        list
+            The dependency score of each pair.
+        """
+        return [self.gen(text) for text in corpus_pair]
+
+
+class StubDependencyAnalyzer:
+    """
+    Drop-in replacement for the model-backed `DependencyAnalyzer`, scoring pairs with
+    `StubDependencyClassifier`.
+    """
+
+    def __init__(self, max_input_length=256):
+        """
+        Initializes the stub analyzer.
+
+        Parameters
+        ----------
+        max_input_length : int, optional
+            Maximum length of the input code (default is 256), as in the real analyzer.
+        """
+        self.max_input_length = max_input_length
+        self.classifier = StubDependencyClassifier()
+
+    def get_dependency(self, code_1, code_2):
+        """
+        Analyzes the dependency score between two code strings.
+
+        Parameters
+        ----------
+        code_1 : str
+            The first code string.
+        code_2 : str
+            The second code string.
+
+        Returns
+        -------
+        float
+            The dependency score (between 0 and 1).
+        """
+        return self.classifier.gen(self.classifier.construct_pair(
+            code_1[:self.max_input_length], code_2[:self.max_input_length]
+        ))
+
+    def compare_multiple_codes(self, code_pairs):
+        """
+        Compares multiple pairs of code and returns their dependency scores.
+
+        Parameters
+        ----------
+        code_pairs : list
+            A list of tuples where each tuple contains two code strings.
+
+        Returns
+        -------
+        list
+            A list of dependency scores corresponding to each code pair.
+        """
+        return [self.get_dependency(code_1, code_2) for code_1, code_2 in code_pairs]
+
+
+class RemoteDependencyAnalyzer:
+    """
+    Analyzer that scores pairs on a `DependencyServer`, so that worker processes
+    share one loaded model instead of loading their own.
+    """
+
+    def __init__(self, url=SERVER_URL, timeout=SERVER_TIMEOUT):
+        """
+        Initializes the remote analyzer.
+
+        Parameters
+        ----------
+        url : str, optional
+            Base URL of the server, default is `PEACE_DEPENDENCY_SERVER`.
+        timeout : float, optional
+            Request timeout in seconds.
+        """
+        import requests  # Only needed when the server backend is used
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def compare_multiple_codes(self, code_pairs):
+        """
+        Compares multiple pairs of code and returns their dependency scores.
+
+        Parameters
+        ----------
+        code_pairs : list
+            A list of tuples where each tuple contains two code strings.
+
+        Returns
+        -------
+        list
+            A list of dependency scores corresponding to each code pair.
+        """
+        response = self.session.post(
+            f"{self.url}/score", json={"pairs": [list(pair) for pair in code_pairs]}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()["scores"]
+
+    def get_dependency(self, code_1, code_2):
+        """
+        Analyzes the dependency score between two code strings.
+
+        Parameters
+        ----------
+        code_1 : str
+            The first code string.
+        code_2 : str
+            The second code string.
+
+        Returns
+        -------
+        float
+            The dependency score (between 0 and 1).
+        """
+        return self.compare_multiple_codes([(code_1, code_2)])[0]
+
+
+class SerializedDependencyAnalyzer:
+    """
+    Wraps an analyzer so that one pair or batch is scored at a time.
+
+    The model-backed analyzer is not safe to share across threads, while the
+    thread, staged and DAG executors all score with the one returned by
+    `get_dependency_analyzer`.
+
+    Attributes
+    ----------
+    analyzer : object
+        The wrapped analyzer; its other attributes are reachable through the wrapper.
+    """
+
+    def __init__(self, analyzer):
+        """
+        Initializes the wrapper.
+
+        Parameters
+        ----------
+        analyzer : object
+            Analyzer with `get_dependency` and `compare_multiple_codes`.
+        """
+        self.analyzer = analyzer
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name == "analyzer":  # Not set yet, e.g. while unpickling
+            raise AttributeError(name)
+        return getattr(self.analyzer, name)
+
+    def get_dependency(self, code_1, code_2):
+        """Score one pair, see `StubDependencyAnalyzer.get_dependency`."""
+        with self._lock:
+            return self.analyzer.get_dependency(code_1, code_2)
+
+    def compare_multiple_codes(self, code_pairs):
+        """Score several pairs, see `StubDependencyAnalyzer.compare_multiple_codes`."""
+        with self._lock:
+            return self.analyzer.compare_multiple_codes(code_pairs)
+
+
+class DependencyServer:
+    """
+    Local HTTP server scoring code pairs with one analyzer for several processes.
+
+    `POST /score` takes {"pairs": [[code_1, code_2], ...]} and answers {"scores": [...]}.
+    Requests are scored one at a time, since the model is not shared across threads.
+
+    Attributes
+    ----------
+    analyzer : object
+        The analyzer scoring the pairs.
+    host : str
+        Bound host.
+    port : int
+        Bound port (chosen by the OS when 0 was requested).
+    """
+
+    def __init__(self, analyzer=None, host="127.0.0.1", port=0):
+        """
+        Initialize the server (call `start` or `serve_forever` to run it).
+
+        Parameters
+        ----------
+        analyzer : object or None, optional
+            Analyzer with `compare_multiple_codes`, default is `get_dependency_analyzer()`.
+        host : str, optional
+            Host to bind, default is "127.0.0.1".
+        port : int, optional
+            Port to bind, default is 0 (a free port).
+        """
+        from http.server import ThreadingHTTPServer  # Only needed when a server is run
+
+        self.analyzer = analyzer or get_dependency_analyzer()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self.host, self.port = self._httpd.server_address[:2]
+
+    @property
+    def url(self):
+        """Base URL of the server."""
+        return f"http://{self.host}:{self.port}"
+
+    def _make_handler(self):
+        from http.server import BaseHTTPRequestHandler
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    pairs = json.loads(self.rfile.read(length) or b"{}")["pairs"]
+                    with server._lock:
+                        scores = [float(score) for score in server.analyzer.compare_multiple_codes(
+                            [tuple(pair) for pair in pairs]
+                        )]
+                    status, body = 200, {"scores": scores}
+                except Exception as e:
+                    status, body = 500, {"error": str(e)}
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def start(self):
+        """Serve in a background thread; returns the server."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="dependency-server", daemon=True)
+        self._thread.start()
+        logging.info(f"Dependency server listening on {self.url}")
+        return self
+
+    def serve_forever(self):
+        """Serve in the current thread until interrupted."""
+        logging.info(f"Dependency server listening on {self.url}")
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._httpd.server_close()
+
+    def stop(self):
+        """Stop serving and release the port."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+def _load_model_analyzer():
+    """
+    Instantiate the model-backed `DependencyAnalyzer` from the first importable module.
+
+    Returns
+    -------
+    DependencyAnalyzer
+
+    Raises
+    ------
+    ImportError
+        If none of `MODEL_MODULES` can be imported.
+    """
+    errors = []
+    for module_name in MODEL_MODULES:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError as e:
+            errors.append(f"{module_name}: {e}")
+            continue
+        analyzer_class = module.DependencyAnalyzer
+        if module_name == "dependencyAnalyzer":
+            return analyzer_class(model_dir=MODEL_DIR)
+        return analyzer_class()
+
+    raise ImportError(
+        "No dependency model backend could be imported (" + "; ".join(errors) + "). "
+        "Put denpendAnalysisTool on PYTHONPATH or set PEACE_DEPENDENCY_BACKEND=stub."
+    )
+
+
+_analyzer = None
+_analyzer_override = None
+_analyzer_lock = threading.Lock()
+
+
+def set_dependency_analyzer(analyzer):
+    """
+    Inject the analyzer returned by `get_dependency_analyzer`, e.g. a stub in tests.
+
+    Parameters
+    ----------
+    analyzer : object or None
+        An object with a `get_dependency(code_1, code_2)` method, None to remove the override.
+    """
+    global _analyzer_override
+    _analyzer_override = analyzer
+
+
+def get_dependency_analyzer():
+    """
+    Return the process-wide dependency analyzer.
+
+    The backend is chosen by `PEACE_DEPENDENCY_BACKEND` ("model", "stub" or "server",
+    which uses the `DependencyServer` at `PEACE_DEPENDENCY_SERVER`). The analyzer is
+    created on first use and then shared, so the model is loaded once per process
+    instead of once per pool or pipeline run. The model-backed analyzer is wrapped in
+    `SerializedDependencyAnalyzer`, since worker threads share it.
+
+    Returns
+    -------
+    object
+        An analyzer with a `get_dependency(code_1, code_2)` method.
+    """
+    global _analyzer
+    if _analyzer_override is not None:
+        return _analyzer_override
+
+    with _analyzer_lock:
+        if _analyzer is None:
+            if DEPENDENCY_BACKEND == BACKEND_STUB:
+                _analyzer = StubDependencyAnalyzer()
+            elif DEPENDENCY_BACKEND == BACKEND_MODEL:
+                _analyzer = SerializedDependencyAnalyzer(_load_model_analyzer())
+            elif DEPENDENCY_BACKEND == BACKEND_SERVER:
+                _analyzer = RemoteDependencyAnalyzer()
+            else:
+                raise ValueError(
+                    f"Unknown dependency backend '{DEPENDENCY_BACKEND}', expected 'model', 'stub' or 'server'"
+                )
+            logging.info(f"Using the '{DEPENDENCY_BACKEND}' dependency backend")
+        return _analyzer
+
+
+# ========== Main Execution ==========
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score code dependencies, or serve the configured backend.")
+    parser.add_argument("--serve", action="store_true", help="Serve the analyzer for PEACE_DEPENDENCY_BACKEND=server clients.")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind with --serve.")
+    parser.add_argument("--port", type=int, default=8500, help="Port to bind with --serve.")
+    args = parser.parse_args()
+
+    if args.serve:
+        DependencyServer(host=args.host, port=args.port).serve_forever()
+        sys.exit(0)
+
+    analyzer = StubDependencyAnalyzer()
+    code_1 = "def load(path):\n    return parse(read(path))"
+    code_2 = "def parse(text):\n    return text.split()"
+    print(f"Dependency score: {analyzer.get_dependency(code_1, code_2):.4f}")
+    print(f"Dependency score: {analyzer.get_dependency(code_1, 'def unrelated(): pass'):.4f}")
@@ -0,0 +1,788 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+import statistics
+import requests
+from requests.adapters import HTTPAdapter
+from llm_cache import default_cache, request_key
+from llm_batch import default_batch_session
+from llm_telemetry import LLMCall, default_recorder
+from tracing import span
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+# ========== Client Configuration ==========
+DEFAULT_API_URL = os.environ.get("LLM_API_URL", "https://api.example.com/v1/chat/completions")  # Placeholder URL
+DEFAULT_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "10"))
+DEFAULT_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "120"))
+DEFAULT_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "4"))
+DEFAULT_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "1.0"))
+DEFAULT_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "30.0"))
+DEFAULT_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "16"))
+DEFAULT_STREAM = os.environ.get("LLM_STREAM", "1") != "0"  # Servers without SSE support are handled transparently
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class LLMRequestError(Exception):
+    """Raised when an LLM request fails permanently or runs out of retries."""
+
+
+class LLMCacheMiss(LLMRequestError):
+    """Raised in cache replay mode when a request is not in the cache."""
+
+
+def compute_backoff(attempt, base=DEFAULT_BACKOFF_BASE, cap=DEFAULT_BACKOFF_MAX, retry_after=None):
+    """
+    Compute the delay before the next retry using exponential backoff with full jitter.
+
+    Parameters
+    ----------
+    attempt : int
+        Zero-based index of the retry.
+    base : float, optional
+        Base delay in seconds.
+    cap : float, optional
+        Upper bound of the delay in seconds.
+    retry_after : str or None, optional
+        Value of the `Retry-After` header, honored when it is a number of seconds.
+
+    Returns
+    -------
+    float
+        Delay in seconds.
+    """
+    if retry_after:
+        try:
+            return min(cap, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def extract_content(response_json):
+    """
+    Extract the message content of the first choice of a chat-completions response.
+
+    Parameters
+    ----------
+    response_json : dict
+        The decoded response body.
+
+    Returns
+    -------
+    str
+        The message content, or an empty string if absent.
+    """
+    choices = response_json.get("choices") or [{}]
+    return (choices[0].get("message") or {}).get("content") or ""
+
+
+def extract_contents(response_json):
+    """
+    Extract the message content of every choice of a chat-completions response.
+
+    Parameters
+    ----------
+    response_json : dict
+        The decoded response body.
+
+    Returns
+    -------
+    list
+        The message contents in choice order (empty strings for missing content).
+    """
+    choices = sorted(response_json.get("choices") or [], key=lambda choice: choice.get("index", 0))
+    return [(choice.get("message") or {}).get("content") or "" for choice in choices]
+
+
+# ========== Streaming Stop Conditions ==========
+class CodeFenceStop:
+    """
+    Detects the end of the first fenced code block in incrementally received text.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._open = None        # Index of the opening fence
+        self._body_start = None  # Index after the opening fence line
+        self._search = 0         # Where the next search resumes
+
+    def feed(self, delta):
+        """
+        Add received text.
+
+        Parameters
+        ----------
+        delta : str
+            The newly received text.
+
+        Returns
+        -------
+        int or None
+            Length of the text up to and including the closing fence, or None if the
+            code block is not complete yet.
+        """
+        self.text += delta
+        if self._open is None:
+            index = self.text.find("```", self._search)
+            if index < 0:
+                self._search = max(0, len(self.text) - 2)  # A fence may straddle two chunks
+                return None
+            self._open = index
+            self._search = index + 3
+
+        if self._body_start is None:
+            newline = self.text.find("\n", self._search)
+            if newline < 0:
+                self._search = len(self.text)
+                return None
+            self._body_start = newline + 1
+            self._search = newline
+
+        index = self.text.find("\n```", self._search)
+        if index < 0:
+            self._search = max(self._body_start - 1, len(self.text) - 3)
+            return None
+        return index + 4
+
+
+class JSONObjectStop:
+    """
+    Detects the end of the first complete JSON object in incrementally received text.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, delta):
+        """
+        Add received text.
+
+        Parameters
+        ----------
+        delta : str
+            The newly received text.
+
+        Returns
+        -------
+        int or None
+            Length of the text up to and including the closing brace of the first
+            object, or None if the object is not complete yet.
+        """
+        self.text += delta
+        for index in range(self._position, len(self.text)):
+            char = self.text[index]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"' and self._depth:
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}" and self._depth:
+                self._depth -= 1
+                if not self._depth:
+                    return index + 1
+        self._position = len(self.text)
+        return None
+
+
+def truncate_content(content, stop=None):
+    """
+    Cut a complete response the way streaming with the same stop condition would.
+
+    Parameters
+    ----------
+    content : str
+        The message content.
+    stop : type or None, optional
+        Stop condition class such as `CodeFenceStop`, None to keep everything.
+
+    Returns
+    -------
+    str
+    """
+    if stop is None:
+        return content
+    cut = stop().feed(content)
+    return content if cut is None else content[:cut]
+
+
+def lookup_cache(cache, metrics, payload, variant=None):
+    """
+    Look up a request in a response cache.
+
+    Parameters
+    ----------
+    cache : LLMResponseCache or None
+        The cache, None when caching is disabled.
+    metrics : LLMClientMetrics
+        Metrics charged with the hit, or with a failed request on a replay miss.
+    payload : dict
+        The request body.
+    variant : str or None, optional
+        Extra key material, see `llm_cache.request_key`.
+
+    Returns
+    -------
+    tuple
+        (key, response) where `key` is None when caching is disabled and
+        `response` is None on a miss.
+
+    Raises
+    ------
+    LLMCacheMiss
+        If the cache is in replay mode and does not hold the request.
+    """
+    if cache is None or not cache.enabled:
+        return None, None
+
+    key = request_key(payload, variant)
+    cached = cache.get(key)
+    if cached is not None:
+        metrics.record_cache_hit()
+        return key, cached
+    if cache.read_only:
+        metrics.record_request(False, 0)
+        raise LLMCacheMiss(f"Request {key[:12]} is not in the replay cache {cache.cache_dir}")
+    return key, None
+
+
+class LLMClientMetrics:
+    """
+    Thread-safe counters and latency samples of an LLM client.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.status_counts = {}
+        self.latencies = []
+
+    def record_attempt(self, latency, status):
+        """
+        Record one HTTP attempt.
+
+        Parameters
+        ----------
+        latency : float
+            Duration of the attempt in seconds.
+        status : int or str
+            HTTP status code, or the exception name for connection errors.
+        """
+        with self._lock:
+            self.latencies.append(latency)
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def record_request(self, succeeded, retries):
+        """
+        Record the outcome of a logical request (all of its attempts).
+
+        Parameters
+        ----------
+        succeeded : bool
+            Whether the request eventually succeeded.
+        retries : int
+            Number of retries it took.
+        """
+        with self._lock:
+            self.requests += 1
+            self.retries += retries
+            if succeeded:
+                self.successes += 1
+            else:
+                self.failures += 1
+
+    def record_cache_hit(self):
+        """Record a request served from the response cache."""
+        with self._lock:
+            self.cache_hits += 1
+
+    def snapshot(self):
+        """
+        Return the current metrics.
+
+        Returns
+        -------
+        dict
+            Request/retry counters, status code counts and latency percentiles.
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+            snapshot = {
+                "requests": self.requests,
+                "successes": self.successes,
+                "failures": self.failures,
+                "retries": self.retries,
+                "cache_hits": self.cache_hits,
+                "status_counts": dict(self.status_counts),
+                "attempts": len(latencies),
+            }
+        if latencies:
+            snapshot["latency_mean"] = statistics.mean(latencies)
+            snapshot["latency_p50"] = latencies[int(0.50 * (len(latencies) - 1))]
+            snapshot["latency_p95"] = latencies[int(0.95 * (len(latencies) - 1))]
+            snapshot["latency_max"] = latencies[-1]
+        return snapshot
+
+    def log_summary(self):
+        """Log a one-line summary of the metrics."""
+        snapshot = self.snapshot()
+        logging.info(
+            f"LLM requests: {snapshot['requests']} (failures: {snapshot['failures']}, "
+            f"retries: {snapshot['retries']}, cache hits: {snapshot['cache_hits']}), latency p50/p95: "
+            f"{snapshot.get('latency_p50', 0):.2f}s/{snapshot.get('latency_p95', 0):.2f}s"
+        )
+
+
+class LLMClient:
+    """
+    Chat-completions client with a keep-alive connection pool, timeouts and
+    exponential backoff with jitter on 429/5xx responses and connection errors.
+
+    Attributes
+    ----------
+    url : str
+        The chat-completions endpoint.
+    timeout : tuple
+        (connect, read) timeouts in seconds.
+    max_retries : int
+        Maximum number of retries per request.
+    metrics : LLMClientMetrics
+        Request, retry and latency metrics.
+    cache : LLMResponseCache or None
+        Response cache consulted before every request.
+    batch : BatchSession or None
+        Offline batch session; when set, requests are never sent to the API.
+    stream : bool
+        Whether `stream_chat_completion` requests server-sent events.
+    telemetry : TelemetryRecorder or None
+        Recorder of per-call latency, tokens, retries and cache hits.
+    """
+
+    def __init__(self, url=None, api_key=None, headers=None, timeout=None, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX, pool_size=DEFAULT_POOL_SIZE,
+                 cache=None, batch=None, stream=DEFAULT_STREAM, telemetry=None):
+        """
+        Initialize the client.
+
+        Parameters
+        ----------
+        url : str or None, optional
+            The chat-completions endpoint, default is `LLM_API_URL`.
+        api_key : str or None, optional
+            API key sent as a bearer token, default is `GPT_API_KEY`.
+        headers : dict or None, optional
+            Extra headers; an `Authorization` header here takes precedence over `api_key`.
+        timeout : float or tuple or None, optional
+            Read timeout or (connect, read) timeouts in seconds.
+        max_retries : int, optional
+            Maximum number of retries per request.
+        backoff_base : float, optional
+            Base delay of the exponential backoff in seconds.
+        backoff_max : float, optional
+            Upper bound of a single backoff delay in seconds.
+        pool_size : int, optional
+            Maximum number of pooled keep-alive connections.
+        cache : LLMResponseCache or bool or None, optional
+            Response cache; None uses the one configured by `LLM_CACHE_DIR`, False disables caching.
+        batch : BatchSession or bool or None, optional
+            Offline batch session; None uses the one configured by `LLM_BATCH_REQUESTS`, False disables it.
+        stream : bool, optional
+            Whether `stream_chat_completion` requests server-sent events, default is `LLM_STREAM`.
+        telemetry : TelemetryRecorder or bool or None, optional
+            Call recorder; None uses the process-wide one (`LLM_TELEMETRY_PATH`), False disables it.
+        """
+        self.url = url or DEFAULT_API_URL
+        if timeout is None:
+            timeout = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+        elif not isinstance(timeout, tuple):
+            timeout = (DEFAULT_CONNECT_TIMEOUT, float(timeout))
+        self.timeout = timeout
+        self.stream = stream
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.metrics = LLMClientMetrics()
+        self.cache = default_cache() if cache is None else (cache or None)
+        self.batch = default_batch_session() if batch is None else (batch or None)
+        self.telemetry = default_recorder() if telemetry is None else (telemetry or None)
+
+        self.headers = {"Content-Type": "application/json"}
+        api_key = api_key or os.environ.get("GPT_API_KEY")
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+        self.headers.update(headers or {})
+
+        # Retries are handled here so they can be jittered and counted
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post(self, payload):
+        """
+        Post a chat-completions payload, retrying transient failures.
+
+        Parameters
+        ----------
+        payload : dict
+            The request body.
+
+        Returns
+        -------
+        dict
+            The decoded response body.
+
+        Raises
+        ------
+        LLMRequestError
+            If the request fails with a non-retryable error or runs out of retries.
+        LLMCacheMiss
+            If the cache is in replay mode and does not hold the request.
+        LLMBatchPending
+            If batch mode is on and the request was queued for the next batch.
+        """
+        return self._traced(LLMCall(payload), self._post)
+
+    def _traced(self, call, send):
+        """
+        Run `send(call)` and record the call with the telemetry recorder.
+
+        Parameters
+        ----------
+        call : LLMCall
+            The call measurements, filled in by `send`.
+        send : callable
+            Performs the call and returns the response body.
+
+        Returns
+        -------
+        dict
+            The response body.
+        """
+        with span("llm_call", "llm", model=call.payload.get("model"), **call.tags) as llm_span:
+            try:
+                result = send(call)
+            except Exception as e:
+                if self.telemetry is not None:
+                    self.telemetry.record(call, error=e)
+                raise
+            llm_span.set_tag("cache_hit", call.cache_hit)
+            llm_span.set_tag("retries", call.retries)
+        if self.telemetry is not None:
+            self.telemetry.record(call, result)
+        return result
+
+    def _post(self, call):
+        key, cached = lookup_cache(self.cache, self.metrics, call.payload)
+        if cached is not None:
+            call.cache_hit = True
+            return cached
+
+        if self.batch is not None:
+            call.batch = True
+            result = self.batch.resolve(call.payload)
+        else:
+            result = self._post_with_retries(call.payload, call=call)
+        if key is not None:
+            self.cache.put(key, call.payload, result)
+        return result
+
+    def _post_with_retries(self, payload, read_stream=None, call=None):
+        """
+        Post a payload to the API, retrying transient failures.
+
+        Parameters
+        ----------
+        payload : dict
+            The request body.
+        read_stream : callable or None, optional
+            Reads a streamed response into a response body; None reads a JSON body.
+        call : LLMCall or None, optional
+            Call measurements to update with the retry count.
+
+        Returns
+        -------
+        dict
+            The decoded response body.
+        """
+        attempt = 0
+        while True:
+            if call is not None:
+                call.retries = attempt
+            retry_after = None
+            start = time.perf_counter()
+            try:
+                response = self.session.post(
+                    self.url, headers=self.headers, json=payload, timeout=self.timeout, stream=read_stream is not None
+                )
+                self.metrics.record_attempt(time.perf_counter() - start, response.status_code)
+
+                # Closing hands the connection back to the pool, which a streamed response
+                # that is retried or rejected would otherwise hold until garbage collection
+                with response:
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        response.raise_for_status()
+                        result = response.json() if read_stream is None else read_stream(response)
+                        self.metrics.record_request(True, attempt)
+                        return result
+
+                    error = LLMRequestError(f"HTTP {response.status_code} from {self.url}")
+                    retry_after = response.headers.get("Retry-After")
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                self.metrics.record_attempt(time.perf_counter() - start, type(e).__name__)
+                error = LLMRequestError(f"{type(e).__name__} while requesting {self.url}: {e}")
+            except (requests.RequestException, ValueError) as e:
+                # Non-retryable HTTP errors (4xx) and undecodable bodies
+                self.metrics.record_request(False, attempt)
+                raise LLMRequestError(f"LLM request to {self.url} failed: {e}") from e
+
+            if attempt >= self.max_retries:
+                self.metrics.record_request(False, attempt)
+                raise LLMRequestError(f"{error} (gave up after {attempt} retries)")
+
+            delay = compute_backoff(attempt, self.backoff_base, self.backoff_max, retry_after)
+            logging.warning(f"{error}; retrying in {delay:.2f}s ({attempt + 1}/{self.max_retries})")
+            time.sleep(delay)
+            attempt += 1
+
+    def chat_completion(self, messages, model, temperature=0, n=1, **options):
+        """
+        Request a chat completion and return the content of the first choice.
+
+        Parameters
+        ----------
+        messages : list
+            Chat messages, e.g. [{"role": "user", "content": prompt}].
+        model : str
+            Model name.
+        temperature : float, optional
+            Sampling temperature, default is 0.
+        n : int, optional
+            Number of choices, default is 1.
+        **options
+            Extra fields of the request body.
+
+        Returns
+        -------
+        str
+            The message content.
+        """
+        payload = {"model": model, "messages": messages, "temperature": temperature, "n": n}
+        payload.update(options)
+        return extract_content(self.post(payload))
+
+    def chat_completions(self, messages, model, stop=None, temperature=0, n=1, **options):
+        """
+        Request a chat completion with several choices and return all of them.
+
+        Choices are not streamed: servers stream only the first one well, and the
+        request is answered once every choice is complete anyway.
+
+        Parameters
+        ----------
+        messages : list
+            Chat messages, e.g. [{"role": "user", "content": prompt}].
+        model : str
+            Model name.
+        stop : type or None, optional
+            Stop condition class applied to each choice, e.g. `CodeFenceStop`.
+        temperature : float, optional
+            Sampling temperature, default is 0.
+        n : int, optional
+            Number of choices, default is 1.
+        **options
+            Extra fields of the request body.
+
+        Returns
+        -------
+        list
+            The message content of each choice, up to the stop condition.
+        """
+        payload = {"model": model, "messages": messages, "temperature": temperature, "n": n}
+        payload.update(options)
+        return [truncate_content(content, stop) for content in extract_contents(self.post(payload))]
+
+    def stream_chat_completion(self, messages, model, stop=None, temperature=0, n=1, **options):
+        """
+        Request a chat completion as server-sent events and stop reading as soon as
+        the stop condition is met, so trailing text is neither waited for nor read.
+
+        Falls back to a regular request when streaming is disabled or in batch mode,
+        and accepts servers that answer with a plain JSON body. In every case the
+        content is cut at the same place.
+
+        Parameters
+        ----------
+        messages : list
+            Chat messages, e.g. [{"role": "user", "content": prompt}].
+        model : str
+            Model name.
+        stop : type or None, optional
+            Stop condition class, e.g. `CodeFenceStop` or `JSONObjectStop`.
+        temperature : float, optional
+            Sampling temperature, default is 0.
+        n : int, optional
+            Number of choices, default is 1; only the first one is streamed.
+        **options
+            Extra fields of the request body.
+
+        Returns
+        -------
+        str
+            The message content, up to the stop condition.
+        """
+        payload = {"model": model, "messages": messages, "temperature": temperature, "n": n}
+        payload.update(options)
+        if not self.stream or self.batch is not None:
+            return truncate_content(extract_content(self.post(payload)), stop)
+
+        def send(call):
+            # The stored response is cut at the stop condition, so it must not answer a plain request
+            variant = f"stream_stop:{stop.__qualname__}" if stop is not None else None
+            key, cached = lookup_cache(self.cache, self.metrics, payload, variant)
+            if cached is not None:
+                call.cache_hit = True
+                return cached
+
+            result = self._post_with_retries(
+                dict(payload, stream=True),
+                read_stream=lambda response: self._read_stream(response, stop),
+                call=call
+            )
+            if key is not None:
+                self.cache.put(key, payload, result)
+            return result
+
+        return truncate_content(extract_content(self._traced(LLMCall(payload, streamed=True), send)), stop)
+
+    def _read_stream(self, response, stop=None):
+        """
+        Accumulate the content of a server-sent events response.
+
+        Parameters
+        ----------
+        response : requests.Response
+            The streamed response.
+        stop : type or None, optional
+            Stop condition class.
+
+        Returns
+        -------
+        dict
+            A chat-completions response body holding the accumulated content.
+        """
+        try:
+            if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                # The server ignored "stream"
+                return {"choices": [{"message": {"role": "assistant", "content": truncate_content(
+                    extract_content(response.json()), stop)}}]}
+
+            detector = stop() if stop is not None else None
+            parts = []
+            cut = None
+            response.encoding = response.encoding or "utf-8"
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                if choices[0].get("index", 0) != 0:
+                    continue
+                delta = (choices[0].get("delta") or {}).get("content") or ""
+                if not delta:
+                    continue
+                parts.append(delta)
+                if detector is not None:
+                    cut = detector.feed(delta)
+                    if cut is not None:
+                        break  # Closing the response stops the download of the remaining tokens
+        finally:
+            response.close()
+
+        content = "".join(parts)
+        if cut is not None:
+            content = content[:cut]
+        finish_reason = "stop_condition" if cut is not None else "stop"
+        return {"choices": [{"message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}]}
+
+    def close(self):
+        """Close the pooled connections."""
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(url=None, api_key=None, headers=None, **options):
+    """
+    Return the shared client for an endpoint, creating it on first use.
+
+    Sharing one client per endpoint keeps its connections alive across calls.
+
+    Parameters
+    ----------
+    url : str or None, optional
+        The chat-completions endpoint, default is `LLM_API_URL`.
+    api_key : str or None, optional
+        API key sent as a bearer token.
+    headers : dict or None, optional
+        Extra headers.
+    **options
+        Other `LLMClient` arguments, only used when the client is created.
+
+    Returns
+    -------
+    LLMClient
+        The shared client.
+    """
+    key = (url or DEFAULT_API_URL, api_key, tuple(sorted((headers or {}).items())))
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = LLMClient(url=url, api_key=api_key, headers=headers, **options)
+        return _clients[key]
+
+
+def log_all_metrics():
+    """Log the metrics summary of every shared client and the per-phase telemetry report."""
+    with _clients_lock:
+        clients = list(_clients.values())
+    for client in clients:
+        logging.info(f"Metrics for {client.url}:")
+        client.metrics.log_summary()
+    default_recorder().log_summary()
+
+
+# ========== Example Usage ==========
+if __name__ == "__main__":
+    client = get_client()
+    try:
+        content = client.chat_completion([{"role": "user", "content": "Say hello."}], model="gpt-4o")
+        print(content)
+    except LLMRequestError as e:
+        logging.error(e)
+    client.metrics.log_summary()
@@ -0,0 +1,457 @@
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+# ========== Telemetry Configuration ==========
+TELEMETRY_PATH = os.environ.get("LLM_TELEMETRY_PATH")  # JSONL trace of every LLM call; unset keeps records in memory
+PROMPT_PRICE = float(os.environ.get("LLM_PROMPT_PRICE", "0"))  # Cost per 1K prompt tokens
+COMPLETION_PRICE = float(os.environ.get("LLM_COMPLETION_PRICE", "0"))  # Cost per 1K completion tokens
+CHARS_PER_TOKEN = 4  # Token estimate for responses without a `usage` field (e.g. streamed ones)
+TAG_NAMES = ("phase", "repo", "sha", "function")
+
+_tags = contextvars.ContextVar("llm_telemetry_tags", default={})
+_meters = contextvars.ContextVar("llm_usage_meters", default=())
+
+
+@contextmanager
+def telemetry_tags(**tags):
+    """
+    Tag the LLM calls made inside the block, e.g. with the pipeline phase or target.
+
+    Tags nest: inner blocks add to or override the tags of outer ones. They follow
+    asyncio tasks; threads started inside the block must run in a copied context
+    (`contextvars.copy_context().run`).
+
+    Parameters
+    ----------
+    **tags
+        Tag values such as phase, repo, sha and function; None values are ignored.
+    """
+    token = _tags.set({**_tags.get(), **{name: value for name, value in tags.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def current_tags():
+    """Return the tags of the current context."""
+    return dict(_tags.get())
+
+
+class UsageMeter:
+    """
+    Counts the LLM calls and tokens of a block of work, e.g. to enforce a budget.
+
+    Calls answered from the response cache cost nothing and are counted apart.
+
+    Attributes
+    ----------
+    calls : int
+        Calls sent to the LLM.
+    tokens : int
+        Prompt and completion tokens of those calls.
+    cache_hits : int
+        Calls answered from the cache.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.tokens = 0
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        """Count a trace record from `LLMCall.to_record`."""
+        with self._lock:
+            if record["cache_hit"]:
+                self.cache_hits += 1
+            else:
+                self.calls += 1
+                self.tokens += record["prompt_tokens"] + record["completion_tokens"]
+
+
+@contextmanager
+def metered(meter):
+    """
+    Count the LLM calls made inside the block with a meter.
+
+    Meters nest like tags and follow the context in the same way; calls are only
+    counted when they are recorded, i.e. with telemetry enabled (the default).
+
+    Parameters
+    ----------
+    meter : UsageMeter
+        The meter to charge.
+    """
+    token = _meters.set(_meters.get() + (meter,))
+    try:
+        yield meter
+    finally:
+        _meters.reset(token)
+
+
+def estimate_tokens(text):
+    """Roughly estimate the number of tokens of a text."""
+    return -(-len(text or "") // CHARS_PER_TOKEN)
+
+
+class LLMCall:
+    """
+    Measurements of one logical LLM call, filled in by the client while it runs.
+
+    Attributes
+    ----------
+    payload : dict
+        The request body.
+    tags : dict
+        Tags of the context the call was made in.
+    queue_wait : float
+        Seconds spent waiting for a concurrency slot or the rate limiter.
+    retries : int
+        Number of retries.
+    cache_hit : bool
+        Whether the response came from the response cache.
+    batch : bool
+        Whether the call went through an offline batch session.
+    streamed : bool
+        Whether the response was streamed.
+    """
+
+    def __init__(self, payload, streamed=False):
+        self.payload = payload
+        self.tags = current_tags()
+        self.meters = _meters.get()
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.queue_wait = 0.0
+        self.retries = 0
+        self.cache_hit = False
+        self.batch = False
+        self.streamed = streamed
+
+    def to_record(self, result=None, error=None):
+        """
+        Build the trace record of the finished call.
+
+        Parameters
+        ----------
+        result : dict or None, optional
+            The response body, None if the call failed.
+        error : Exception or None, optional
+            The exception the call raised.
+
+        Returns
+        -------
+        dict
+        """
+        latency = time.perf_counter() - self.start
+        usage = (result or {}).get("usage") or {}
+        choices = (result or {}).get("choices") or []
+        estimated = "prompt_tokens" not in usage
+        prompt_tokens = usage.get("prompt_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens("".join(
+                message.get("content") or "" for message in self.payload.get("messages", [])
+            ))
+        completion_tokens = usage.get("completion_tokens")
+        if completion_tokens is None:
+            completion_tokens = sum(
+                estimate_tokens((choice.get("message") or {}).get("content")) for choice in choices
+            )
+
+        record = {name: self.tags.get(name) for name in TAG_NAMES}
+        record.update({
+            "timestamp": self.timestamp,
+            "model": self.payload.get("model"),
+            "n": self.payload.get("n", 1),
+            "temperature": self.payload.get("temperature"),
+            "latency": latency,
+            "queue_wait": self.queue_wait,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "tokens_estimated": estimated,
+            "retries": self.retries,
+            "cache_hit": self.cache_hit,
+            "batch": self.batch,
+            "streamed": self.streamed,
+            "status": "ok" if error is None else type(error).__name__
+        })
+        return record
+
+
+def _percentile(values, q):
+    return values[int(q * (len(values) - 1))] if values else 0.0
+
+
+def summarize(records, top=10, prompt_price=PROMPT_PRICE, completion_price=COMPLETION_PRICE):
+    """
+    Aggregate trace records into a report.
+
+    Parameters
+    ----------
+    records : list
+        Trace records as written by `TelemetryRecorder`.
+    top : int, optional
+        Number of slowest targets to report, default is 10.
+    prompt_price : float, optional
+        Cost per 1K prompt tokens.
+    completion_price : float, optional
+        Cost per 1K completion tokens.
+
+    Returns
+    -------
+    dict
+        Per-phase latency percentiles and totals, run totals and the slowest targets
+        (repo, sha, function) by summed latency.
+    """
+    def cost(prompt_tokens, completion_tokens):
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+    def aggregate(group):
+        latencies = sorted(record["latency"] for record in group)
+        queue_waits = sorted(record["queue_wait"] for record in group)
+        prompt_tokens = sum(record["prompt_tokens"] for record in group)
+        completion_tokens = sum(record["completion_tokens"] for record in group)
+        return {
+            "calls": len(group),
+            "latency_p50": _percentile(latencies, 0.50),
+            "latency_p95": _percentile(latencies, 0.95),
+            "latency_max": latencies[-1] if latencies else 0.0,
+            "latency_total": sum(latencies),
+            "queue_wait_p95": _percentile(queue_waits, 0.95),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "retries": sum(record["retries"] for record in group),
+            "cache_hits": sum(1 for record in group if record["cache_hit"]),
+            "errors": sum(1 for record in group if record["status"] != "ok"),
+            "cost": cost(prompt_tokens, completion_tokens)
+        }
+
+    phases = {}
+    targets = {}
+    for record in records:
+        phases.setdefault(record.get("phase") or "untagged", []).append(record)
+        targets.setdefault((record.get("repo"), record.get("sha"), record.get("function")), []).append(record)
+
+    slowest = sorted(targets.items(), key=lambda item: sum(record["latency"] for record in item[1]), reverse=True)
+    return {
+        "total": aggregate(records),
+        "phases": {phase: aggregate(group) for phase, group in sorted(phases.items())},
+        "slowest_targets": [
+            {
+                "repo": repo,
+                "sha": sha,
+                "function": function,
+                "calls": len(group),
+                "latency_total": sum(record["latency"] for record in group),
+                "tokens": sum(record["prompt_tokens"] + record["completion_tokens"] for record in group)
+            }
+            for (repo, sha, function), group in slowest[:top]
+        ]
+    }
+
+
+def format_summary(summary):
+    """
+    Format a report from `summarize` as text lines.
+
+    Parameters
+    ----------
+    summary : dict
+        The report.
+
+    Returns
+    -------
+    list
+        Lines of the report.
+    """
+    total = summary["total"]
+    lines = [
+        f"LLM calls: {total['calls']}, tokens: {total['prompt_tokens']} prompt + {total['completion_tokens']} "
+        f"completion, cost: {total['cost']:.4f}, retries: {total['retries']}, cache hits: {total['cache_hits']}, "
+        f"errors: {total['errors']}"
+    ]
+    for phase, stats in summary["phases"].items():
+        lines.append(
+            f"  {phase}: {stats['calls']} calls, latency p50/p95/max {stats['latency_p50']:.2f}s/"
+            f"{stats['latency_p95']:.2f}s/{stats['latency_max']:.2f}s, queue wait p95 {stats['queue_wait_p95']:.2f}s, "
+            f"tokens {stats['prompt_tokens']}+{stats['completion_tokens']}"
+        )
+    if summary["slowest_targets"]:
+        lines.append("  Slowest targets:")
+    for target in summary["slowest_targets"]:
+        name = " ".join(str(target[key]) for key in ("repo", "sha", "function") if target[key]) or "untagged"
+        lines.append(
+            f"    {name}: {target['latency_total']:.2f}s "
+            f"in {target['calls']} calls, {target['tokens']} tokens"
+        )
+    return lines
+
+
+class TelemetryRecorder:
+    """
+    Collects one record per LLM call and appends it to a JSONL trace.
+
+    Attributes
+    ----------
+    path : str or None
+        The trace file, None to keep records in memory only.
+    records : list
+        Records of this process.
+    """
+
+    def __init__(self, path=TELEMETRY_PATH):
+        """
+        Initialize the recorder.
+
+        Parameters
+        ----------
+        path : str or None, optional
+            The trace file, default is `LLM_TELEMETRY_PATH`. Records are appended.
+        """
+        self.path = path
+        self.records = []
+        self._lock = threading.Lock()
+        self._file = None
+
+    def record(self, call, result=None, error=None):
+        """
+        Record a finished call.
+
+        Parameters
+        ----------
+        call : LLMCall
+            The call measurements.
+        result : dict or None, optional
+            The response body, None if the call failed.
+        error : Exception or None, optional
+            The exception the call raised.
+        """
+        record = call.to_record(result, error)
+        for meter in call.meters:
+            meter.add(record)
+        with self._lock:
+            self.records.append(record)
+            if self.path:
+                if self._file is None:
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._file.flush()
+
+    def pop_records(self):
+        """Return the in-memory records and clear them, e.g. to hand them from a worker process to the parent."""
+        with self._lock:
+            records, self.records = self.records, []
+        return records
+
+    def merge(self, records):
+        """
+        Add records collected in another process to the in-memory records.
+
+        The other process has already appended them to the trace, so they are not written again.
+
+        Parameters
+        ----------
+        records : list
+            Records from `pop_records`.
+        """
+        with self._lock:
+            self.records.extend(records)
+
+    def summary(self, top=10):
+        """Return the `summarize` report of this process's records."""
+        with self._lock:
+            records = list(self.records)
+        return summarize(records, top)
+
+    def log_summary(self, top=10):
+        """Log the report of this process's records."""
+        for line in format_summary(self.summary(top)):
+            logging.info(line)
+
+    def write_summary(self, path, top=10):
+        """
+        Write the report of this process's records as JSON.
+
+        Parameters
+        ----------
+        path : str
+            Output file.
+        top : int, optional
+            Number of slowest targets to report.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(top), f, ensure_ascii=False, indent=4)
+        logging.info(f"LLM telemetry summary saved to {path}")
+
+    def close(self):
+        """Close the trace file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_default_recorder = None
+_default_recorder_lock = threading.Lock()
+
+
+def default_recorder():
+    """
+    Return the process-wide recorder shared by all LLM clients.
+
+    Returns
+    -------
+    TelemetryRecorder
+    """
+    global _default_recorder
+    with _default_recorder_lock:
+        if _default_recorder is None:
+            _default_recorder = TelemetryRecorder()
+        return _default_recorder
+
+
+def load_trace(path):
+    """
+    Read the records of a JSONL trace.
+
+    Parameters
+    ----------
+    path : str
+        The trace file.
+
+    Returns
+    -------
+    list
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# ========== Main Execution ==========
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize an LLM telemetry trace.")
+    parser.add_argument("trace", help="JSONL trace written with LLM_TELEMETRY_PATH.")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest targets to report.")
+    parser.add_argument("--prompt-price", type=float, default=PROMPT_PRICE, help="Cost per 1K prompt tokens.")
+    parser.add_argument("--completion-price", type=float, default=COMPLETION_PRICE, help="Cost per 1K completion tokens.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+
+    report = summarize(load_trace(args.trace), args.top, args.prompt_price, args.completion_price)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=4))
+    else:
+        print("\n".join(format_summary(report)))
@@ -2,6 +2,7 @@ import json
 import os
 import logging
 from calbleu import compute_bleu  # 确保 calbleu.py 中有 compute_bleu 函数
+from results_store import RESULTS_DB, ResultsStore, import_associated_edits, export_associated_edits
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -49,13 +50,14 @@ def clean_text(text):
     return text.strip() if isinstance(text, str) else ""
 
 
-def calculate_bleu_scores(json_data, verbose=False):
+def calculate_bleu_scores(json_data, verbose=False, scores=None):
     """
     Compute BLEU scores for all entries in the dataset.
 
     Args:
         json_data (list): List of entries containing `results2` and `groundtruth`.
         verbose (bool): If True, print detailed BLEU scores for each entry.
+        scores (dict): If given, filled with the BLEU score of each valid entry by index.
 
     Returns:
         float: The average BLEU score.
@@ -71,6 +73,8 @@ def calculate_bleu_scores(json_data, verbose=False):
             bleu_score = compute_bleu(groundtruth, result)
             total_bleu_score += bleu_score
             valid_entries += 1
+            if scores is not None:
+                scores[idx] = bleu_score
 
             if verbose:
                 logging.info(f"[{idx + 1}] BLEU: {bleu_score:.4f} | Result: {result[:50]}... | Groundtruth: {groundtruth[:50]}...")
@@ -90,15 +94,34 @@ def main():
     Main function to load JSON, compute BLEU scores, and print the average BLEU score.
     """
     json_file_path = "output_results_with_results2.json"  # Modify as needed
-    json_data = load_json(json_file_path)
+    # With PEACE_RESULTS_DB and PEACE_RUN_NAME set, the entries are read from that run of the results store
+    run_name = os.environ.get("PEACE_RUN_NAME")
+    if RESULTS_DB and run_name:
+        with ResultsStore(RESULTS_DB) as store:
+            json_data = export_associated_edits(store, run_name)
+        logging.info(f"Loaded {len(json_data)} entries from run '{run_name}' of {RESULTS_DB}")
+    else:
+        json_data = load_json(json_file_path)
 
     if not json_data:
         logging.error("No valid data loaded. Exiting.")
         return
 
-    avg_bleu_score = calculate_bleu_scores(json_data, verbose=True)
+    scores = {}
+    avg_bleu_score = calculate_bleu_scores(json_data, verbose=True, scores=scores)
     print(f"\nFinal Average BLEU Score: {avg_bleu_score:.4f}")
 
+    # Record the scores as "bleu" measurements; the run is (re)imported first so they are not duplicated
+    if RESULTS_DB:
+        run_name = run_name or os.path.splitext(os.path.basename(json_file_path))[0]
+        with ResultsStore(RESULTS_DB) as store:
+            import_associated_edits(store, json_data, run_name)
+            run_id = store.run_id(run_name)
+            for idx, bleu_score in scores.items():
+                entry = json_data[idx]
+                store.add_measurement(run_id, entry.get("repo_name"), entry.get("sha"), entry.get("objectFunc"),
+                                      "bleu", bleu_score)
+
 
 if __name__ == "__main__":
     main()
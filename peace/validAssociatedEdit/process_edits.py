@@ -1,7 +1,9 @@
+import os
 import json
 import logging
 from RAGEditPool import RAGEditPool
 from agent import process_response_loop  # Ensure the correct function is imported
+from dataset_stream import iter_items, write_items
 
 # ========== Configuration ==========
 INPUT_FILE = "output_results.json"
@@ -101,6 +103,10 @@ def process_edits(input_file, output_file, max_lines=10):
     """
     Processes a JSON dataset, retrieves code-related edits, and saves results.
 
+    Items are read and written one at a time (`dataset_stream`), so datasets with
+    large patch lists are never fully in memory. The input may be a JSON array or
+    JSONL; the output is JSONL if `output_file` ends with `.jsonl`.
+
     Parameters
     ----------
     input_file : str
@@ -114,20 +120,19 @@ def process_edits(input_file, output_file, max_lines=10):
     -------
     None
     """
-    data = load_json(input_file)
-
-    if not data:
-        logging.error("No data available for processing. Exiting.")
+    if not os.path.exists(input_file):
+        logging.error(f"Input file not found: {input_file}. Exiting.")
         return
 
-    processed_count = 0
-
-    for item in data:
-        item["results"] = process_single_item(item, max_lines)
-        processed_count += 1
+    def processed_items():
+        for item in iter_items(input_file):
+            item["results"] = process_single_item(item, max_lines)
+            yield item
 
-    # Save results
-    save_json(data, output_file)
+    # Save results as they are produced
+    processed_count = write_items(output_file, processed_items())
+    if not processed_count:
+        logging.error("No data available for processing.")
     logging.info(f"Processing complete. {processed_count} items processed.")
 
 # ========== Entry Point ==========
@@ -0,0 +1,338 @@
+import os
+import json
+import time
+import logging
+import argparse
+import functools
+import itertools
+import threading
+import contextvars
+
+# ========== Logger Configuration ==========
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+
+# ========== Tracing Configuration ==========
+# Chrome trace-event JSON of the run; unset disables tracing. Made absolute since the test harness changes directory
+TRACE_PATH = os.path.abspath(os.environ["PEACE_TRACE"]) if os.environ.get("PEACE_TRACE") else None
+
+# perf_counter has no fixed origin; shift it to the epoch so traces of several processes line up
+_EPOCH_OFFSET = time.time() - time.perf_counter()
+
+_current_span = contextvars.ContextVar("peace_trace_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Span:
+    """
+    A timed section of work, used as a context manager.
+
+    Spans opened inside another span in the same context (including thread pool
+    tasks run in a copied context) record it as their parent.
+
+    Attributes
+    ----------
+    name : str
+        What is being done, e.g. "git_checkout".
+    category : str
+        The stage it belongs to, e.g. "llm" or "test".
+    tags : dict
+        Details shown with the span, e.g. the repo and SHA.
+    """
+
+    __slots__ = ("tracer", "name", "category", "tags", "id", "parent", "start", "_token")
+
+    def __init__(self, tracer, name, category, tags):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.tags = tags
+        self.id = next(_span_ids)
+        self.parent = None
+        self.start = None
+        self._token = None
+
+    def set_tag(self, name, value):
+        """Add a detail to the span, e.g. a result only known at the end."""
+        self.tags[name] = value
+
+    def __enter__(self):
+        self.parent = _current_span.get()
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.tags["error"] = exc_type.__name__
+        self.tracer._finish(self, end)
+        return False
+
+
+class _NullSpan:
+    """The span handed out while tracing is disabled; it does nothing."""
+
+    __slots__ = ()
+
+    def set_tag(self, name, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Collects spans as Chrome trace events ("complete" events with a duration),
+    viewable in chrome://tracing or https://ui.perfetto.dev.
+
+    While disabled, `span` returns a shared no-op span, so instrumented code pays
+    for one attribute check.
+
+    Attributes
+    ----------
+    enabled : bool
+        Whether spans are recorded.
+    events : list
+        Trace events of this process.
+    """
+
+    def __init__(self, enabled=False):
+        """
+        Initialize the tracer.
+
+        Parameters
+        ----------
+        enabled : bool, optional
+            Whether spans are recorded, default is False.
+        """
+        self.enabled = enabled
+        self.events = []
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def span(self, name, category="peace", **tags):
+        """
+        Open a span.
+
+        Parameters
+        ----------
+        name : str
+            What is being done.
+        category : str, optional
+            The stage it belongs to, default is "peace".
+        **tags
+            Details shown with the span.
+
+        Returns
+        -------
+        Span
+            A context manager timing its block.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, category, tags)
+
+    def _finish(self, span, end):
+        thread = threading.current_thread()
+        args = {name: value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+                for name, value in span.tags.items()}
+        args["span_id"] = span.id
+        if span.parent is not None:
+            args["parent_id"] = span.parent.id
+        event = {
+            "name": span.name,
+            "cat": span.category,
+            "ph": "X",
+            "ts": (span.start + _EPOCH_OFFSET) * 1e6,
+            "dur": (end - span.start) * 1e6,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": args
+        }
+        with self._lock:
+            self.events.append(event)
+            self._threads.setdefault((event["pid"], thread.ident), thread.name)
+
+    def pop_events(self):
+        """Return the events and clear them, e.g. to hand them from a worker process to the parent."""
+        with self._lock:
+            events, self.events = self.events, []
+            threads, self._threads = self._threads, {}
+        return events, threads
+
+    def merge(self, popped):
+        """
+        Add the events collected in another process.
+
+        Parameters
+        ----------
+        popped : tuple
+            The result of that process's `pop_events`.
+        """
+        events, threads = popped
+        with self._lock:
+            self.events.extend(events)
+            self._threads.update(threads)
+
+    def trace(self):
+        """
+        Return the trace in the Chrome trace-event JSON format.
+
+        Returns
+        -------
+        dict
+        """
+        with self._lock:
+            events = sorted(self.events, key=lambda event: event["ts"])
+            threads = dict(self._threads)
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for (pid, tid), name in threads.items()
+        ]
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+    def export(self, path=None):
+        """
+        Write the trace.
+
+        Parameters
+        ----------
+        path : str or None, optional
+            Output file, default is `PEACE_TRACE`.
+
+        Returns
+        -------
+        str or None
+            The file written, or None if there is no path.
+        """
+        path = path or TRACE_PATH
+        if not path:
+            return None
+        trace = self.trace()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(trace, f, ensure_ascii=False)
+        logging.info(f"Wrote {len(trace['traceEvents'])} trace events to {path}")
+        return path
+
+    def summary(self, top=15):
+        """
+        Total the time spent per span name.
+
+        Nested spans are counted in their own line and in their parents', so
+        the totals do not add up to the wall time.
+
+        Parameters
+        ----------
+        top : int, optional
+            Names to report, the most expensive first, default is 15.
+
+        Returns
+        -------
+        list
+            Dicts with name, category, count, total, mean and max (seconds).
+        """
+        totals = {}
+        with self._lock:
+            for event in self.events:
+                entry = totals.setdefault(event["name"], {
+                    "name": event["name"], "category": event["cat"], "count": 0, "total": 0.0, "max": 0.0
+                })
+                seconds = event["dur"] / 1e6
+                entry["count"] += 1
+                entry["total"] += seconds
+                entry["max"] = max(entry["max"], seconds)
+        report = sorted(totals.values(), key=lambda entry: entry["total"], reverse=True)[:top]
+        for entry in report:
+            entry["mean"] = entry["total"] / entry["count"]
+        return report
+
+    def log_summary(self, top=15):
+        """Log the time spent per span name."""
+        for entry in self.summary(top):
+            logging.info(
+                f"    {entry['name']} [{entry['category']}]: {entry['total']:.3f}s in {entry['count']} spans "
+                f"(mean {entry['mean'] * 1000:.2f}ms, max {entry['max'] * 1000:.2f}ms)"
+            )
+
+
+_default_tracer = Tracer(enabled=bool(TRACE_PATH))
+
+
+def default_tracer():
+    """
+    Return the process-wide tracer, enabled when `PEACE_TRACE` is set.
+
+    Returns
+    -------
+    Tracer
+    """
+    return _default_tracer
+
+
+def span(name, category="peace", **tags):
+    """Open a span on the process-wide tracer, see `Tracer.span`."""
+    if not _default_tracer.enabled:
+        return _NULL_SPAN
+    return Span(_default_tracer, name, category, tags)
+
+
+def traced(name=None, category="peace"):
+    """
+    Decorate a function so each call is a span.
+
+    Parameters
+    ----------
+    name : str or None, optional
+        Span name, default is the function's qualified name.
+    category : str, optional
+        The stage it belongs to, default is "peace".
+    """
+    def decorate(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _default_tracer.enabled:
+                return func(*args, **kwargs)
+            with Span(_default_tracer, span_name, category, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def enable_tracing(enabled=True):
+    """Turn the process-wide tracer on or off, e.g. from a command-line option."""
+    _default_tracer.enabled = enabled
+
+
+def export_trace(path=None):
+    """Write the process-wide trace if tracing is enabled, see `Tracer.export`."""
+    if not _default_tracer.enabled:
+        return None
+    return _default_tracer.export(path)
+
+
+# ========== Main Execution ==========
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a Chrome trace written with PEACE_TRACE.")
+    parser.add_argument("trace", help="The trace JSON file.")
+    parser.add_argument("--top", type=int, default=15, help="Span names to report.")
+    args = parser.parse_args()
+
+    with open(args.trace, "r", encoding="utf-8") as f:
+        events = [event for event in json.load(f)["traceEvents"] if event.get("ph") == "X"]
+    tracer = Tracer()
+    tracer.events = events
+    logging.info(f"Time per span in {args.trace} ({len(events)} spans):")
+    tracer.log_summary(args.top)